@@ -2,16 +2,20 @@ import sqlite3
 from flask import Flask, jsonify, request, send_file
 from datetime import date, timedelta
 from pathlib import Path
-from app.db import init_tables, get_companies_with_details
+from app.db import init_tables, get_companies_with_details, ADJUST_MODES
 from app.db.connection import db
-from app.db.companies import get_company_by_code
-from app.db.stock_history import get_history as get_stock_history
+from app.db.companies import get_company_by_code, get_companies
+from app.db.stock_history import get_history as get_stock_history, get_history_cache_stats
+from app.db.chips import get_chips
 from app.db.stock_groups import (
     create_group, delete_group, get_all_groups, get_group_by_id,
     add_stock_to_group, remove_stock_from_group, get_stocks_in_group,
     get_stocks_in_group_with_details, get_groups_for_stock
 )
 from app.kline_patterns import detect_kline_patterns
+from app.pattern_registry import PATTERNS
+from app.pattern_engine import scan_universe
+from app import symbol_index, quote_service
 from app.backtest import backtest_kline_patterns
 
 DIST_DIR = (Path(__file__).resolve().parents[2] / 'frontend' / 'dist')
@@ -33,6 +37,17 @@ def create_app():
         data = get_companies_with_details()
         return jsonify({'data': data, 'count': len(data)})
 
+    @app.route('/search', methods=['GET'])
+    def search():
+        q = request.args.get('q', '')
+        limit = request.args.get('limit', type=int, default=10)
+        data = symbol_index.search(q, limit=max(1, min(limit, 50)))
+        return jsonify({'data': data, 'count': len(data)})
+
+    @app.route('/history/cache/stats', methods=['GET'])
+    def history_cache_stats():
+        return jsonify(get_history_cache_stats())
+
     @app.route('/companies/<security_code>', methods=['GET'])
     def company(security_code):
         item = get_company_by_code(security_code)
@@ -45,13 +60,36 @@ def create_app():
         start = request.args.get('start')
         end = request.args.get('end')
         limit = request.args.get('limit', type=int)
+        adjust = request.args.get('adjust', 'qfq')
+        if adjust not in ADJUST_MODES:
+            return jsonify({'error': f'adjust must be one of {list(ADJUST_MODES)}'}), 400
 
         if not start and not end:
             start = (date.today() - timedelta(days=365 * 3)).strftime('%Y-%m-%d')
             # 可选：如需限定上限日期
             # end = date.today().strftime('%Y-%m-%d')
         code = stock_code.split('.')[:1][0]
-        data = get_stock_history(code, start_date=start, end_date=end, limit=limit)
+        data = get_stock_history(code, start_date=start, end_date=end, limit=limit, adjust=adjust)
+        return jsonify({'data': data, 'count': len(data)})
+
+    @app.route('/quotes', methods=['GET'])
+    def quotes():
+        symbols = [s for s in request.args.get('symbols', '').split(',') if s.strip()]
+        if not symbols:
+            return jsonify({'error': 'Missing symbols'}), 400
+        return jsonify({'data': quote_service.get_quotes(symbols)})
+
+    @app.route('/chips/<stock_code>', methods=['GET'])
+    def chips(stock_code):
+        start = request.args.get('start')
+        end = request.args.get('end')
+        limit = request.args.get('limit', type=int)
+        adjust = request.args.get('adjust', 'qfq')
+        if adjust not in ADJUST_MODES:
+            return jsonify({'error': f'adjust must be one of {list(ADJUST_MODES)}'}), 400
+
+        code = stock_code.split('.')[:1][0]
+        data = get_chips(code, start_date=start, end_date=end, limit=limit, adjust=adjust)
         return jsonify({'data': data, 'count': len(data)})
 
     @app.route('/', methods=['GET'])
@@ -131,7 +169,13 @@ def create_app():
                 data = get_stocks_in_group_with_details(group_id)
             else:
                 data = get_stocks_in_group(group_id)
-            return jsonify({'data': data, 'count': len(data)})
+            result = {'data': data, 'count': len(data)}
+            if request.args.get('quotes', 'false').lower() == 'true' and data:
+                # 整个分组的实时行情通过一次批量请求获取
+                codes = [item['security_code'] if include_details else item for item in data]
+                quotes = quote_service.get_quotes(codes)
+                result['quotes'] = {code: quotes.get(quote_service.normalize_symbol(code)) for code in codes}
+            return jsonify(result)
         elif request.method == 'POST':
             # 将股票添加到分组
             data = request.get_json()
@@ -158,22 +202,35 @@ def create_app():
 
     @app.route('/patterns', methods=['GET'])
     def get_all_patterns():
-        # 导入PatternDector以获取所有形态
-        from app.pattern_dector import PatternDector
-        import numpy as np
-
-        m = np.array([1.0])
-        dector = PatternDector(m, m, m, m, m)
-        
-        # 构建形态列表
-        patterns = []
-        for pattern in dector.all_patterns:
-            patterns.append({
-                'name': pattern.code,
-                'chinese': pattern.name
-            })
+        # 形态注册表在导入时创建，不需要构造检测器
+        patterns = [info.to_dict() for info in PATTERNS.values()]
         return jsonify({'patterns': patterns, 'count': len(patterns)})
 
+    @app.route('/scan', methods=['GET'])
+    def scan():
+        # 扫描成分股(可按分组或指数筛选)最近几个交易日出现的形态
+        group_id = request.args.get('group', type=int)
+        index = request.args.get('index')
+        patterns_param = request.args.get('patterns')
+        patterns = None
+        if patterns_param:
+            patterns = [p.strip().upper() for p in patterns_param.split(',') if p.strip()]
+        try:
+            if group_id is None:
+                stock_codes = get_companies(index)
+            else:
+                stock_codes = [code.split('.')[0] for code in get_stocks_in_group(group_id)]
+                if index:
+                    constituents = set(get_companies(index))
+                    stock_codes = [code for code in stock_codes if code in constituents]
+            results = scan_universe(stock_codes, sessions=request.args.get('sessions', type=int, default=1),
+                                    patterns=patterns, direction=request.args.get('direction'),
+                                    end_date=request.args.get('end'), adjust=request.args.get('adjust', 'qfq'),
+                                    limit=request.args.get('limit', type=int))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        return jsonify(results)
+
     @app.route('/patterns/<stock_code>', methods=['POST'])
     def stock_patterns(stock_code):
         # 获取股票历史数据
@@ -9,8 +9,9 @@ import requests
 from typing import List
 
 # 导入数据库模块
-from db.companies import update_companies_from_data
-from db.companies import get_companies
+from app.db.companies import update_companies_from_data
+from app.db.companies import get_companies
+from app.db import init_tables
 
 # 配置日志
 logging.basicConfig(level=logging.INFO, 
@@ -156,6 +157,7 @@ class CompaniesUpdater:
 
 if __name__ == "__main__":
     # 测试数据更新模块
+    init_tables()
     updater = CompaniesUpdater('../data/stock_history.db')
     # 下载所有指数数据并更新数据库
     is_ok = updater.update_companies()
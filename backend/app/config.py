@@ -5,6 +5,8 @@ class Settings(BaseSettings):
     # 数据库配置
     DB_PATH: str = "data/stock_history.db"
     MAX_CONCURRENT: int = 20
+    # 数据源请求速率上限(次/秒)，0 表示不限流
+    RATE_LIMIT: float = 10.0
     
     # 雪球配置（用于AKShare的部分接口）
     XUEQIU_TOKEN: str = os.getenv("XUEQIU_TOKEN", "")
@@ -14,4 +16,7 @@ class Settings(BaseSettings):
     
     UPDATE_COMPANIES: bool = True
 
+    # 全市场形态扫描的进程数，0 表示按CPU核数
+    SCAN_WORKERS: int = 0
+
 settings = Settings()
\ No newline at end of file
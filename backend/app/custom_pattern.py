@@ -1,9 +1,38 @@
+import time
 import talib
 import numpy as np
 import pandas as pd
 
+class _Indicator:
+    """惰性指标: 首次访问时先计算声明的依赖，再计时计算自身，结果缓存到实例属性"""
+
+    def __init__(self, func, deps):
+        self.func = func
+        self.deps = deps
+        self.name = func.__name__
+        self.__doc__ = func.__doc__
+
+    def __get__(self, obj, owner=None):
+        if obj is None:
+            return self
+        # 依赖先计算，各指标的耗时不包含依赖的耗时
+        for dep in self.deps:
+            getattr(obj, dep)
+        start = time.perf_counter()
+        value = self.func(obj)
+        obj._indicator_times[self.name] = time.perf_counter() - start
+        # 写入实例字典后，后续访问不再经过描述符
+        obj.__dict__[self.name] = value
+        return value
+
+def indicator(*deps):
+    """声明惰性计算的指标及其依赖的其他指标"""
+    def wrap(func):
+        return _Indicator(func, deps)
+    return wrap
+
 class CustomPatternDetector:
-    def __init__(self, open_p, high_p, low_p, close_p, volume, limit_threshold=0.098):
+    def __init__(self, open_p, high_p, low_p, close_p, volume, limit_threshold=0.098, chips=None):
         self.o = pd.Series(open_p)
         self.h = pd.Series(high_p)
         self.l = pd.Series(low_p)
@@ -15,51 +44,142 @@ class CustomPatternDetector:
         self.l.ffill(inplace=True)
         self.c.ffill(inplace=True)
         self.v.fillna(0, inplace=True)
+        # 筹码分布(可选): {字段: 与价格等长的序列}，没有筹码数据的日期为 NaN，不做填充
+        self.chips = {col: pd.Series(values, index=self.c.index, dtype=np.float64)
+                      for col, values in (chips or {}).items()}
         
         self.n = len(self.c)
         self.limit_threshold = limit_threshold
-        self._precalculate_indicators()
+        # 指标在形态第一次读取时计算，这里只记录已计算指标的耗时
+        self._indicator_times = {}
         self._debug = True
 
-    def _precalculate_indicators(self):
-        # === 基础均线 ===
-        values = self.c.values
-        self.ma5 = pd.Series(talib.SMA(values, 5))
-        self.ma10 = pd.Series(talib.SMA(values, 10))
-        self.ma30 = pd.Series(talib.SMA(values, 30))
-        self.ma20 = pd.Series(talib.SMA(values, 20))
-        self.ma60 = pd.Series(talib.SMA(values, 60))
-        
-        self.vma5 = pd.Series(talib.SMA(self.v.values, 5))
-        self.vma10 = pd.Series(talib.SMA(self.v.values, 10))
-        self.vma20 = pd.Series(talib.SMA(self.v.values, 20))
-
-        # === 波动率 (关键优化) ===
-        # 使用 ATR(14) 来定义"大幅波动"、"接近"等概念，而非固定百分比
-        self.atr = pd.Series(talib.ATR(self.h.values, self.l.values, self.c.values, timeperiod=14))
-        # 归一化 ATR，用于判断相对波幅
-        self.natr = self.atr / self.c 
-        
-        # === MACD ===
-        macd_results = talib.MACD(values, fastperiod=12, slowperiod=26, signalperiod=9)
-        self.diff = pd.Series(macd_results[0])
-        self.dea = pd.Series(macd_results[1])
-        self.macd_hist = pd.Series(macd_results[2])
-        
-        # === Shift 数据 ===
-        self.close_prev = self.c.shift(1)
-        self.open_prev = self.o.shift(1)
-        self.vol_prev = self.v.shift(1)
-        self.high_prev = self.h.shift(1)
-        self.low_prev = self.l.shift(1)
-
-        # === 辅助逻辑 ===
-        self.is_yang = self.c > self.o
-        # 实体大小 (绝对值)
-        self.body_abs = np.abs(self.c - self.o)
-          # 高低位判断 (优化版)
-        self.low_pos = self._check_position(is_low=True)
-        self.high_pos = self._check_position(is_low=False)
+    def _frame(self, values):
+        """把计算结果包装为与价格序列相同类型、相同索引的对象"""
+        return pd.Series(values, index=self.c.index)
+
+    def _ta(self, func, *inputs, **kwargs):
+        """调用 TA-Lib 函数，返回与输入相同类型的对象(多个输出时为元组)"""
+        result = func(*[x.to_numpy(dtype=np.float64) for x in inputs], **kwargs)
+        if isinstance(result, tuple):
+            return tuple(self._frame(r) for r in result)
+        return self._frame(result)
+
+    @classmethod
+    def indicator_names(cls):
+        """所有可用指标名称"""
+        return [name for name, attr in vars(cls).items() if isinstance(attr, _Indicator)]
+
+    @classmethod
+    def indicator_deps(cls, name):
+        """指标直接依赖的指标"""
+        return vars(cls)[name].deps
+
+    def indicator_stats(self):
+        """已计算的指标及其耗时(毫秒)，按计算顺序排列"""
+        return {name: round(seconds * 1000, 3) for name, seconds in self._indicator_times.items()}
+
+    # === 基础均线 ===
+    @indicator()
+    def ma5(self):
+        return self._ta(talib.SMA, self.c, timeperiod=5)
+
+    @indicator()
+    def ma10(self):
+        return self._ta(talib.SMA, self.c, timeperiod=10)
+
+    @indicator()
+    def ma20(self):
+        return self._ta(talib.SMA, self.c, timeperiod=20)
+
+    @indicator()
+    def ma30(self):
+        return self._ta(talib.SMA, self.c, timeperiod=30)
+
+    @indicator()
+    def ma60(self):
+        return self._ta(talib.SMA, self.c, timeperiod=60)
+
+    @indicator()
+    def vma5(self):
+        return self._ta(talib.SMA, self.v, timeperiod=5)
+
+    @indicator()
+    def vma10(self):
+        return self._ta(talib.SMA, self.v, timeperiod=10)
+
+    @indicator()
+    def vma20(self):
+        return self._ta(talib.SMA, self.v, timeperiod=20)
+
+    # === 波动率 (关键优化) ===
+    @indicator()
+    def atr(self):
+        """使用 ATR(14) 来定义"大幅波动"、"接近"等概念，而非固定百分比"""
+        return self._ta(talib.ATR, self.h, self.l, self.c, timeperiod=14)
+
+    @indicator('atr')
+    def natr(self):
+        """归一化 ATR，用于判断相对波幅"""
+        return self.atr / self.c
+
+    # === MACD ===
+    @indicator()
+    def macd(self):
+        """(DIFF, DEA, MACD柱) 三个序列一次计算"""
+        return self._ta(talib.MACD, self.c, fastperiod=12, slowperiod=26, signalperiod=9)
+
+    @indicator('macd')
+    def diff(self):
+        return self.macd[0]
+
+    @indicator('macd')
+    def dea(self):
+        return self.macd[1]
+
+    @indicator('macd')
+    def macd_hist(self):
+        return self.macd[2]
+
+    # === Shift 数据 ===
+    @indicator()
+    def close_prev(self):
+        return self.c.shift(1)
+
+    @indicator()
+    def open_prev(self):
+        return self.o.shift(1)
+
+    @indicator()
+    def vol_prev(self):
+        return self.v.shift(1)
+
+    @indicator()
+    def high_prev(self):
+        return self.h.shift(1)
+
+    @indicator()
+    def low_prev(self):
+        return self.l.shift(1)
+
+    # === 辅助逻辑 ===
+    @indicator()
+    def is_yang(self):
+        return self.c > self.o
+
+    @indicator()
+    def body_abs(self):
+        """实体大小 (绝对值)"""
+        return np.abs(self.c - self.o)
+
+    # 高低位判断 (优化版)
+    @indicator()
+    def low_pos(self):
+        return self._check_position(is_low=True)
+
+    @indicator()
+    def high_pos(self):
+        return self._check_position(is_low=False)
 
     def _check_position(self, is_low=True, window=60):
         """向量化的高低位判断"""
@@ -154,8 +274,7 @@ class CustomPatternDetector:
         stand = self.c > self.ma20
         
         # 4. 缩量 (可选): 相比5日均量缩量
-        vma5 = talib.SMA(self.v.values, 5)
-        shrink_vol = self.v < vma5
+        shrink_vol = self.v < self.vma5
         
         return (trend_up & touch & stand & shrink_vol).fillna(0).astype(int).values
 
@@ -185,10 +304,7 @@ class CustomPatternDetector:
         # 今天下跌回补
         fill_down = gap_up & (self.l <= gap_support) & (self.c < self.o)
         
-        res = np.zeros(self.n, dtype=int)
-        res[fill_up] = 1
-        res[fill_down] = -1
-        return res
+        return np.where(fill_down, -1, np.where(fill_up, 1, 0))
 
     def THREE_GOLDEN_CROSSES(self):
         """三金叉：放宽为近3日内发生，且保持多头"""
@@ -213,7 +329,7 @@ class CustomPatternDetector:
         return cond.astype(int).values
 
     def UPSIDE_GAP_3CROWS(self):
-        return talib.CDLUPSIDEGAP2CROWS(self.o.values, self.h.values, self.l.values, self.c.values) / -100
+        return self._ta(talib.CDLUPSIDEGAP2CROWS, self.o, self.h, self.l, self.c).values / 100
 
     def POURING_RAIN(self):
         """倾盆大雨"""
@@ -230,7 +346,7 @@ class CustomPatternDetector:
         return np.where(c1 & c2 & c3 & c4, -1, 0)
 
     def RISING_SUN(self):
-        return talib.CDLPIERCING(self.o.values, self.h.values, self.l.values, self.c.values) / 100
+        return self._ta(talib.CDLPIERCING, self.o, self.h, self.l, self.c).values / 100
 
     def JIEDI_FANJI(self):
         """绝地反击: 长下影 + 放量 + 处于低位 (增加低位过滤以保准确)"""
@@ -273,7 +389,7 @@ class CustomPatternDetector:
         strong_body = (self.c - self.o) > (0.8 * self.atr)
         
         # 3. 放量: 大于5日均量
-        vol_up = self.v > talib.SMA(self.v.values, 5)
+        vol_up = self.v > self.vma5
         
         return (penetrate & strong_body & vol_up).fillna(0).astype(int).values
 
@@ -319,7 +435,7 @@ class CustomPatternDetector:
 
     def LONG_TENG_LOW(self):
         """龙腾四海低位"""
-        rsi = pd.Series(talib.RSI(self.c.values, 14))
+        rsi = self._ta(talib.RSI, self.c, timeperiod=14)
         c1 = self.low_pos
         c2 = rsi.shift(1) < 30
         c3 = rsi > rsi.shift(1)
@@ -339,7 +455,7 @@ class CustomPatternDetector:
         return (c1 & c2).astype(int).values
 
     def BOTTOM_REVERSAL(self):
-        return talib.CDLMORNINGSTAR(self.o.values, self.h.values, self.l.values, self.c.values) / 100
+        return self._ta(talib.CDLMORNINGSTAR, self.o, self.h, self.l, self.c).values / 100
 
     def SHORT_TERM_BULL(self):
         cond = (self.ma5 > self.ma10) & (self.ma10 > self.ma20)
@@ -356,7 +472,7 @@ class CustomPatternDetector:
 
     def QIU_YING_JIN_BO(self):
         """秋影金波: 高位十字星"""
-        doji = talib.CDLDOJI(self.o.values, self.h.values, self.l.values, self.c.values)
+        doji = self._ta(talib.CDLDOJI, self.o, self.h, self.l, self.c)
         return np.where((doji != 0) & self.high_pos, -1, 0)
 
     def SOLDIER_ASSAULT(self):
@@ -446,9 +562,8 @@ class CustomPatternDetector:
 
     def MA_ADHESION(self):
         """均线粘合"""
-        arrs = np.vstack([self.ma5, self.ma10, self.ma20, self.ma30])
-        max_vals = np.max(arrs, axis=0)
-        min_vals = np.min(arrs, axis=0)
+        max_vals = np.maximum.reduce([self.ma5, self.ma10, self.ma20, self.ma30])
+        min_vals = np.minimum.reduce([self.ma5, self.ma10, self.ma20, self.ma30])
         # 极差 < 1%
         cond = (max_vals - min_vals) / min_vals < 0.01
         return cond.astype(int)
@@ -510,8 +625,8 @@ class CustomPatternDetector:
 
     def CLOUD_MAP(self):
         """目送云图"""
-        doji = talib.CDLDOJI(self.o.values, self.h.values, self.l.values, self.c.values)
-        doji_count = pd.Series(doji).rolling(4).apply(lambda x: np.sum(x != 0), raw=True)
+        doji = self._ta(talib.CDLDOJI, self.o, self.h, self.l, self.c)
+        doji_count = (doji != 0).rolling(4).sum()
         return np.where((doji_count >= 2) & self.high_pos, -1, 0)
 
     def AMBUSH(self):
@@ -522,7 +637,7 @@ class CustomPatternDetector:
         return np.where(self.high_pos & c1, -1, 0)
 
     def TWISTS_TURNS(self):
-        return talib.CDLHARAMI(self.o.values, self.h.values, self.l.values, self.c.values) / 100
+        return self._ta(talib.CDLHARAMI, self.o, self.h, self.l, self.c).values / 100
 
     def CLOUD_WALK(self):
         """云行雨步"""
@@ -699,63 +814,38 @@ class CustomPatternDetector:
         c2 = self.c > self.o
         return (c1 & c2).astype(int).values
 
-    def _is_index_valid(self, dead_idx, gold_idx, n):
-        """
-        封装索引有效性校验辅助函数，减少冗余代码
-        返回值：(是否有效, 转换后的死叉索引, 转换后的金叉索引)
-        """
-        if pd.isna(dead_idx) or pd.isna(gold_idx):
-            return False, -1, -1
-        try:
-            dead_idx_int = int(dead_idx)
-            gold_idx_int = int(gold_idx)
-        except (ValueError, TypeError):
-            return False, -1, -1
-        # 边界校验
-        if dead_idx_int < 0 or gold_idx_int >= n or dead_idx_int > gold_idx_int:
-            return False, -1, -1
-        return True, dead_idx_int, gold_idx_int
-
-    def _is_neck_dead_valid(self, neck_idx, dead_idx, ma5_series, ma60_series):
+    @staticmethod
+    def _prefix_sum(values):
+        """沿时间轴的前缀和，prefix[j] 为 values[:j] 之和，区间 [a, b] 之和为 prefix[b+1] - prefix[a]"""
+        values = np.asarray(values)
+        dtype = np.int64 if values.dtype == bool else np.float64
+        zeros = np.zeros((1,) + values.shape[1:], dtype=dtype)
+        return np.concatenate((zeros, np.cumsum(values, axis=0, dtype=dtype)))
+
+    @staticmethod
+    def _gather(values, idx):
+        """按时间轴取值: 结果的第 i 行为 values[idx[i]]（二维时逐列取值）"""
+        return np.take_along_axis(values, idx, axis=0)
+
+    def _segment_mean(self, prefix, start, end, valid):
+        """用前缀和一次求出每个位置对应闭区间 [start, end] 的均值，无效位置为 NaN"""
+        start = np.where(valid, start, 0)
+        end = np.where(valid, end, 0)
+        total = self._gather(prefix, end + 1) - self._gather(prefix, start)
+        return np.where(valid, total / (end - start + 1), np.nan)
+
+    def _duck_head_common(self, platform_limit):
         """
-        验证鸭颈到死叉期间MA5始终在MA60上方（容忍小幅波动）
+        老鸭头与宽松老鸭头共用的条件（全向量化）
+        每个位置 i 对应最近一次死叉 dead[i]、金叉 gold[i]、鸭颈 neck[i]，
+        区间条件用前缀和计数，只依赖死叉位置的条件先按每个可能的死叉位置计算再按 dead 取值
         """
-        if pd.isna(neck_idx) or pd.isna(dead_idx):
-            return False
-        try:
-            neck_idx_int = int(neck_idx)
-            dead_idx_int = int(dead_idx)
-        except (ValueError, TypeError):
-            return False
-        if neck_idx_int >= dead_idx_int:
-            return False
-        # 提取鸭颈到死叉期间的MA5和MA60
-        neck_dead_ma5 = ma5_series.iloc[neck_idx_int:dead_idx_int+1]
-        neck_dead_ma60 = ma60_series.iloc[neck_idx_int:dead_idx_int+1]
-        # 容忍5%的小幅下穿，避免误判
-        return (neck_dead_ma5 > neck_dead_ma60 * 0.95).all()
-
-    def OLD_DUCK_HEAD(self):
-        """
-        优化版老鸭头形态检测（高性能+高鲁棒性+高准确性）
-        核心特征：
-        1.  长期趋势：MA60 阶段向上（非每日连涨，更贴合实际行情）
-        2.  形态前提：存在鸭颈（MA5上穿MA60，且死叉前MA5未有效跌破MA60）
-        3.  形态核心：先死叉（鸭头回调）→ 后金叉（鸭嘴张开），时序合理
-        4.  支撑约束：回调全程（死叉→金叉）价格未有效跌破MA60（容忍1%）
-        5.  量能约束：回调全程缩量（整体趋势下降，允许单日小幅反复）
-        6.  鸭头高度：回调前有合理涨幅，避免小幅震荡误判
-        7.  头顶约束：鸭头顶部为平台震荡，避免不规则大幅震荡误判
-        """
-        
-        # ======================================
-        # 预处理：使用已有的pd.Series类型变量
-        # ======================================
         ma5_series = self.ma5
         ma10_series = self.ma10
         ma60_series = self.ma60
-        # 创建索引序列（pd.Series类型，使用整数索引避免类型混淆）
-        idx_series = pd.Series(range(self.n), index=self.c.index)
+        # 创建索引序列（与价格序列同类型，二维时每列相同）
+        positions = np.arange(self.n, dtype=np.float64).reshape((-1,) + (1,) * (self.c.ndim - 1))
+        idx_series = self._frame(np.broadcast_to(positions, self.c.shape))
 
         # ======================================
         # 核心信号判定
@@ -770,141 +860,85 @@ class CustomPatternDetector:
         # ======================================
         # 记录最近一次各类信号的索引（向前填充，确保每个位置都有最近信号的索引）
         # ======================================
-        last_dead_idx = pd.Series(idx_series.where(dead_cross).ffill(), index=self.c.index)    # 最近一次死叉索引
-        last_gold_idx = pd.Series(idx_series.where(gold_cross).ffill(), index=self.c.index)    # 最近一次金叉索引
-        last_neck_idx = pd.Series(idx_series.where(neck_cross).ffill(), index=self.c.index)    # 最近一次鸭颈索引
-
-        # ======================================
-        # 分条件判定（核心逻辑，含所有优化点）
-        # ======================================
-        # 1. MA60趋势向上（放宽约束：最近10天整体上涨）
-        ma60_diff = ma60_series - ma60_series.shift(10)
-        ma60_trend_up = ma60_diff > 0
-        ma60_trend_up = ma60_trend_up.fillna(False)
+        last_dead_idx = idx_series.where(dead_cross).ffill()    # 最近一次死叉索引
+        last_gold_idx = idx_series.where(gold_cross).ffill()    # 最近一次金叉索引
+        last_neck_idx = idx_series.where(neck_cross).ffill()    # 最近一次鸭颈索引
+        # 整数下标，-1 表示之前没有信号
+        dead = last_dead_idx.fillna(-1).to_numpy(dtype=np.int64)
+        gold = last_gold_idx.fillna(-1).to_numpy(dtype=np.int64)
+        neck = last_neck_idx.fillna(-1).to_numpy(dtype=np.int64)
+        # 死叉和金叉都已出现且死叉在前，回调区间为 [dead, gold]
+        valid = (dead >= 0) & (gold >= 0) & (dead <= gold)
+
+        cond = {'dead': dead, 'gold': gold, 'valid': valid}
 
         # 2. 当日或近期金叉（放宽约束：4天内（含当日）出现金叉）
-        cond_recent_gold = gold_cross.rolling(4).max()  # 滚动最大值，4天内有金叉则为True
+        cond['recent_gold'] = gold_cross.rolling(4).max()  # 滚动最大值，4天内有金叉则为True
 
         # 3. 时序合理性：鸭颈→死叉→金叉，且死叉到金叉间隔合理（1-20天）
-        cond_neck_before_dead = (last_neck_idx < last_dead_idx)  # 鸭颈在死叉之前
-        diff_days = last_gold_idx - last_dead_idx                # 死叉到金叉的间隔天数
-        cond_sequence = (diff_days > 0) & (diff_days < 20)       # 间隔为正且不超过20天
-
-        # 4. 回调全程价格支撑（优化：使用辅助函数减少冗余）
-        price_support_all = pd.Series(False, index=self.c.index, dtype=bool)
-        for i in range(self.n):
-            # 索引有效性校验
-            is_valid, dead_idx_int, gold_idx_int = self._is_index_valid(
-                last_dead_idx.iloc[i], last_gold_idx.iloc[i], self.n
-            )
-            if not is_valid:
-                continue
-            # 提取回调期间的最低价和MA60
-            period_low = self.l.iloc[dead_idx_int:gold_idx_int+1]
-            period_ma60 = ma60_series.iloc[dead_idx_int:gold_idx_int+1]
-            # 判定期间90%以上最低价在MA60的98%之上（放宽约束）
-            support_ratio = (period_low > (period_ma60 * 0.98)).mean()
-            price_support_all.iloc[i] = support_ratio >= 0.9
-
-        # 5. 回调缩量（优化：放宽约束，允许单日反复，提升准确性）
-        vol_shrink = pd.Series(False, index=self.c.index, dtype=bool)
-        for i in range(self.n):
-            # 索引有效性校验
-            is_valid, dead_idx_int, gold_idx_int = self._is_index_valid(
-                last_dead_idx.iloc[i], last_gold_idx.iloc[i], self.n
-            )
-            if not is_valid:
-                continue
-
-            period_vol = self.v.iloc[dead_idx_int:gold_idx_int+1]
-            # 注意：这里需要对应时间段的 MA20，假设 self.v_ma20 与 self.v 索引对齐
-            period_ma20 = self.vma20.iloc[dead_idx_int:gold_idx_int+1]
-            # 核心逻辑：是不是大部分日子都是“缩量状态”（在均量线下方）
-            # 这里的 0.6 (60%) 是一个合理的区间，因为金叉前可能会放量突破均量线
-            is_low_volume = (period_vol < period_ma20).mean() >= 0.6
-            vol_shrink.iloc[i] = is_low_volume
-
-        # 6. 鸭头高度约束（死叉前10天股价涨幅≥5%）
-        duck_head_height = pd.Series(False, index=self.c.index, dtype=bool)
-        for i in range(self.n):
-            if pd.isna(last_dead_idx.iloc[i]):
-                continue
-            try:
-                dead_idx_int = int(last_dead_idx.iloc[i])
-            except (ValueError, TypeError):
-                continue
-            # 防止索引越界（死叉前至少10天数据）
-            if dead_idx_int < 10:
-                continue
-            # 死叉前10天收盘价涨幅
-            pre_dead_close = self.c.iloc[dead_idx_int - 10]
-            dead_close = self.c.iloc[dead_idx_int]
-            # 避免除零错误
-            if pre_dead_close == 0:
-                continue
-            price_rise = (dead_close - pre_dead_close) / pre_dead_close * 100
-            duck_head_height.iloc[i] = price_rise >= 5  # 涨幅≥5%
-
-        # 7. 优化：鸭颈后趋势约束（鸭颈到死叉期间MA5未有效跌破MA60）
-        neck_to_dead_valid = pd.Series(False, index=self.c.index, dtype=bool)
-        for i in range(self.n):
-            neck_to_dead_valid.iloc[i] = self._is_neck_dead_valid(
-                last_neck_idx.iloc[i], last_dead_idx.iloc[i], ma5_series, ma60_series
-            )
-
-        # 8. 优化：鸭头头顶平台约束（死叉前5-10天最高价波动≤10%，避免不规则震荡）
-        head_platform_valid = pd.Series(False, index=self.c.index, dtype=bool)
-        for i in range(self.n):
-            if pd.isna(last_dead_idx.iloc[i]):
-                continue
-            try:
-                dead_idx_int = int(last_dead_idx.iloc[i])
-            except (ValueError, TypeError):
-                continue
-            # 确保有足够数据计算头顶平台
-            if dead_idx_int < 10:
-                continue
-            # 提取死叉前5-10天的最高价（头顶区间）
-            head_highs = self.h.iloc[dead_idx_int-10 : dead_idx_int-5+1]
-            max_high = head_highs.max()
-            min_high = head_highs.min()
-            # 避免除零错误
-            if min_high == 0:
-                continue
-            # 波动幅度≤10%，判定为平台震荡
-            head_volatility = (max_high - min_high) / min_high * 100
-            head_platform_valid.iloc[i] = head_volatility <= 10
-
+        cond['neck_before_dead'] = (last_neck_idx < last_dead_idx)  # 鸭颈在死叉之前
+        diff_days = last_gold_idx - last_dead_idx                    # 死叉到金叉的间隔天数
+        cond['sequence'] = (diff_days > 0) & (diff_days < 20)        # 间隔为正且不超过20天
+
+        # 4. 回调全程价格支撑：期间90%以上最低价在MA60的98%之上（放宽约束）
+        support = self._prefix_sum((self.l > ma60_series * 0.98).to_numpy())
+        support_ratio = self._segment_mean(support, dead, gold, valid)
+        cond['price_support'] = self._frame(support_ratio >= 0.9)
+
+        # 6. 鸭头高度约束（死叉前10天股价涨幅≥5%），按每个可能的死叉位置 k 计算
+        c = self.c.to_numpy(dtype=np.float64)
+        has_head = dead >= 10   # 防止索引越界（死叉前至少10天数据）
+        pre_dead_close = self.c.shift(10).to_numpy(dtype=np.float64)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            rise_ok = (pre_dead_close != 0) & ((c - pre_dead_close) / pre_dead_close * 100 >= 5)
+        cond['head_height'] = self._frame(has_head & self._gather(rise_ok, np.maximum(dead, 0)))
+
+        # 7. 鸭颈后趋势约束（鸭颈到死叉期间MA5未有效跌破MA60，容忍5%的小幅下穿）
+        broken = self._prefix_sum((~(ma5_series > ma60_series * 0.95)).to_numpy())
+        neck_ok = (neck >= 0) & (dead >= 0) & (neck < dead)
+        broken_days = self._gather(broken, np.where(neck_ok, dead, 0) + 1) - self._gather(broken, np.where(neck_ok, neck, 0))
+        cond['neck_to_dead'] = self._frame(neck_ok & (broken_days == 0))
+
+        # 8. 鸭头头顶平台约束（死叉前5-10天最高价波动≤platform_limit%，避免不规则震荡）
+        # 位置 k 的头顶区间为 [k-10, k-5]，即以 k-5 结尾的 6 日窗口
+        head_max = self.h.rolling(6, min_periods=1).max().shift(5).to_numpy()
+        head_min = self.h.rolling(6, min_periods=1).min().shift(5).to_numpy()
+        with np.errstate(divide='ignore', invalid='ignore'):
+            platform_ok = (head_min != 0) & ((head_max - head_min) / head_min * 100 <= platform_limit)
+        cond['head_platform'] = self._frame(has_head & self._gather(platform_ok, np.maximum(dead, 0)))
+        return cond
+
+    def _duck_head_result(self, name, ma60_trend_up, vol_shrink, cond):
         # ======================================
         # 所有条件合并（最终判定，包含新增优化约束）
         # ======================================
         final_cond = (
             ma60_trend_up &
-            cond_recent_gold &
-            cond_neck_before_dead &
-            cond_sequence &
-            price_support_all &
+            cond['recent_gold'] &
+            cond['neck_before_dead'] &
+            cond['sequence'] &
+            cond['price_support'] &
             vol_shrink &
-            duck_head_height &
-            neck_to_dead_valid &  # 新增鸭颈趋势约束
-            head_platform_valid   # 新增头顶平台约束
+            cond['head_height'] &
+            cond['neck_to_dead'] &  # 新增鸭颈趋势约束
+            cond['head_platform']   # 新增头顶平台约束
         )
 
         # 打印日志，分析每个条件的执行情况
         if self._debug:
             # 只打印最后一天的数据，因为我们关心的是最新状态
             last_idx = len(self.c) - 1
-            print(f"\n=== OLD_DUCK_HEAD_LIKE 形态检测日志 ===")
+            print(f"\n=== {name} 形态检测日志 ===")
             print(f"最新日期: {self.c.index[last_idx] if hasattr(self.c, 'index') else last_idx}")
             print(f"MA60趋势向上: {ma60_trend_up.iloc[last_idx]}")
-            print(f"近期金叉: {cond_recent_gold.iloc[last_idx]}")
-            print(f"鸭颈在死叉之前: {cond_neck_before_dead.iloc[last_idx]}")
-            print(f"死叉到金叉间隔合理: {cond_sequence.iloc[last_idx]}")
-            print(f"回调全程价格支撑: {price_support_all.iloc[last_idx]}")
+            print(f"近期金叉: {cond['recent_gold'].iloc[last_idx]}")
+            print(f"鸭颈在死叉之前: {cond['neck_before_dead'].iloc[last_idx]}")
+            print(f"死叉到金叉间隔合理: {cond['sequence'].iloc[last_idx]}")
+            print(f"回调全程价格支撑: {cond['price_support'].iloc[last_idx]}")
             print(f"回调缩量: {vol_shrink.iloc[last_idx]}")
-            print(f"鸭头高度足够: {duck_head_height.iloc[last_idx]}")
-            print(f"鸭颈到死叉期间MA5未跌破MA60: {neck_to_dead_valid.iloc[last_idx]}")
-            print(f"鸭头顶部平台震荡: {head_platform_valid.iloc[last_idx]}")
+            print(f"鸭头高度足够: {cond['head_height'].iloc[last_idx]}")
+            print(f"鸭颈到死叉期间MA5未跌破MA60: {cond['neck_to_dead'].iloc[last_idx]}")
+            print(f"鸭头顶部平台震荡: {cond['head_platform'].iloc[last_idx]}")
             print(f"最终结果: {final_cond.iloc[last_idx]}")
             print(f"======================================")
 
@@ -913,6 +947,32 @@ class CustomPatternDetector:
         # ======================================
         return final_cond.fillna(0).astype(int).values
 
+    def OLD_DUCK_HEAD(self):
+        """
+        优化版老鸭头形态检测（高性能+高鲁棒性+高准确性）
+        核心特征：
+        1.  长期趋势：MA60 阶段向上（非每日连涨，更贴合实际行情）
+        2.  形态前提：存在鸭颈（MA5上穿MA60，且死叉前MA5未有效跌破MA60）
+        3.  形态核心：先死叉（鸭头回调）→ 后金叉（鸭嘴张开），时序合理
+        4.  支撑约束：回调全程（死叉→金叉）价格未有效跌破MA60（容忍1%）
+        5.  量能约束：回调全程缩量（整体趋势下降，允许单日小幅反复）
+        6.  鸭头高度：回调前有合理涨幅，避免小幅震荡误判
+        7.  头顶约束：鸭头顶部为平台震荡，避免不规则大幅震荡误判
+        """
+        cond = self._duck_head_common(platform_limit=10)
+
+        # 1. MA60趋势向上（放宽约束：最近10天整体上涨）
+        ma60_diff = self.ma60 - self.ma60.shift(10)
+        ma60_trend_up = (ma60_diff > 0).fillna(False)
+
+        # 5. 回调缩量：回调期间大部分日子（60%）成交量在20日均量线下方
+        # 0.6 是一个合理的区间，因为金叉前可能会放量突破均量线
+        under_ma = self._prefix_sum((self.v < self.vma20).to_numpy())
+        under_ratio = self._segment_mean(under_ma, cond['dead'], cond['gold'], cond['valid'])
+        vol_shrink = self._frame(under_ratio >= 0.6)
+
+        return self._duck_head_result('OLD_DUCK_HEAD', ma60_trend_up, vol_shrink, cond)
+
     def OLD_DUCK_HEAD_LIKE(self):
         """
         宽松老鸭头形态检测（高性能+高鲁棒性+高准确性）
@@ -925,36 +985,10 @@ class CustomPatternDetector:
         6.  鸭头高度：回调前有合理涨幅，避免小幅震荡误判
         7.  头顶约束：鸭头顶部为平台震荡，避免不规则大幅震荡误判
         """
-        
-        # ======================================
-        # 预处理：使用已有的pd.Series类型变量
-        # ======================================
-        ma5_series = self.ma5
-        ma10_series = self.ma10
+        cond = self._duck_head_common(platform_limit=15)
+        dead, gold, valid = cond['dead'], cond['gold'], cond['valid']
         ma60_series = self.ma60
-        # 创建索引序列（pd.Series类型，使用整数索引避免类型混淆）
-        idx_series = pd.Series(range(self.n), index=self.c.index)
 
-        # ======================================
-        # 核心信号判定
-        # ======================================
-        # 金叉信号（MA5上穿MA10）
-        gold_cross = (ma5_series > ma10_series) & (ma5_series.shift(1) <= ma10_series.shift(1))
-        # 死叉信号（MA5下穿MA10）
-        dead_cross = (ma5_series < ma10_series) & (ma5_series.shift(1) >= ma10_series.shift(1))
-        # 鸭颈信号（MA5上穿MA60，老鸭头前提）
-        neck_cross = (ma5_series > ma60_series) & (ma5_series.shift(1) <= ma60_series.shift(1))
-
-        # ======================================
-        # 记录最近一次各类信号的索引（向前填充，确保每个位置都有最近信号的索引）
-        # ======================================
-        last_dead_idx = pd.Series(idx_series.where(dead_cross).ffill(), index=self.c.index)    # 最近一次死叉索引
-        last_gold_idx = pd.Series(idx_series.where(gold_cross).ffill(), index=self.c.index)    # 最近一次金叉索引
-        last_neck_idx = pd.Series(idx_series.where(neck_cross).ffill(), index=self.c.index)    # 最近一次鸭颈索引
-
-        # ======================================
-        # 分条件判定（核心逻辑，含所有优化点）
-        # ======================================
         # 计算最近10天的变化率（归一化，解决高低价股差异）
         # 逻辑：(今天MA60 - 10天前MA60) / 10天前MA60
         ma60_pct_change = (ma60_series - ma60_series.shift(10)) / ma60_series.shift(10)
@@ -966,176 +1000,29 @@ class CustomPatternDetector:
         cond_trend_up = ma60_pct_change > 0
         
         # 条件B：趋势走平/微跌，但在容忍范围内，且股价站稳在MA60之上（安全锁）
-        # 注意：self.c 是收盘价序列，需要确保索引对齐
         cond_trend_flat = (ma60_pct_change > slope_threshold) & (self.c > ma60_series)
         
         # 综合判定：满足A或B均可
-        ma60_trend_up = cond_trend_up | cond_trend_flat
-        
-        # 填充缺失值
-        ma60_trend_up = ma60_trend_up.fillna(False)
+        ma60_trend_up = (cond_trend_up | cond_trend_flat).fillna(False)
 
-        # 2. 当日或近期金叉（放宽约束：4天内（含当日）出现金叉）
-        cond_recent_gold = gold_cross.rolling(4).max()  # 滚动最大值，4天内有金叉则为True
+        # 5. 回调缩量（放宽约束，允许单日反复）
+        # 逻辑A（核心）：整体水位下降。回调期（死叉到金叉）均量 < 鸭颈上涨期均量 * 0.7 (即缩量30%以上)
+        # 鸭颈上涨期取死叉前“回调时长”和“15天”中较大值的天数，刚上市前面没有数据时无法对比
+        volume = self._prefix_sum(self.v.to_numpy(dtype=np.float64))
+        avg_vol_head = self._segment_mean(volume, dead, gold, valid)
+        neck_start = np.maximum(0, dead - np.maximum(15, gold - dead))
+        has_neck = valid & (dead > 0)
+        avg_vol_neck = self._segment_mean(volume, neck_start, dead - 1, has_neck)
+        cond_avg_drop = avg_vol_head < (avg_vol_neck * 0.7)
 
-        # 3. 时序合理性：鸭颈→死叉→金叉，且死叉到金叉间隔合理（1-20天）
-        cond_neck_before_dead = (last_neck_idx < last_dead_idx)  # 鸭颈在死叉之前
-        diff_days = last_gold_idx - last_dead_idx                # 死叉到金叉的间隔天数
-        cond_sequence = (diff_days > 0) & (diff_days < 20)       # 间隔为正且不超过20天
-
-        # 4. 回调全程价格支撑（优化：使用辅助函数减少冗余）
-        price_support_all = pd.Series(False, index=self.c.index, dtype=bool)
-        for i in range(self.n):
-            # 索引有效性校验
-            is_valid, dead_idx_int, gold_idx_int = self._is_index_valid(
-                last_dead_idx.iloc[i], last_gold_idx.iloc[i], self.n
-            )
-            if not is_valid:
-                continue
-            # 提取回调期间的最低价和MA60
-            period_low = self.l.iloc[dead_idx_int:gold_idx_int+1]
-            period_ma60 = ma60_series.iloc[dead_idx_int:gold_idx_int+1]
-            # 判定期间90%以上最低价在MA60的98%之上（放宽约束）
-            support_ratio = (period_low > (period_ma60 * 0.98)).mean()
-            price_support_all.iloc[i] = support_ratio >= 0.9
-
-        # 5. 回调缩量（优化：放宽约束，允许单日反复，提升准确性）
-        vol_shrink = pd.Series(False, index=self.c.index, dtype=bool)
-        
-        for i in range(self.n):
-            # 索引有效性校验
-            is_valid, dead_idx_int, gold_idx_int = self._is_index_valid(
-                last_dead_idx.iloc[i], last_gold_idx.iloc[i], self.n
-            )
-            if not is_valid:
-                continue
-
-            # --- 1. 获取“鸭头回调期” (Head) 数据 ---
-            # 从死叉点到金叉点
-            head_vol = self.v.iloc[dead_idx_int:gold_idx_int+1]
-            if head_vol.empty:
-                continue
-            
-            # --- 2. 获取“鸭颈上涨期” (Neck) 数据 ---
-            # 逻辑：为了进行公平对比，我们需要提取死叉前的一段上涨过程作为基准。
-            # 策略：取与回调期相同的时间长度，或者至少取前10-20天的数据。
-            head_len = gold_idx_int - dead_idx_int
-            # 设定回溯窗口：取“回调时长”和“15天”中的较大值，确保基准数据充足
-            neck_lookback = max(15, head_len) 
-            
-            neck_start = max(0, dead_idx_int - neck_lookback)
-            neck_vol = self.v.iloc[neck_start:dead_idx_int]
-            
-            # 边界保护：如果前面没有数据（刚上市），则无法对比
-            if neck_vol.empty:
-                continue
-
-            # --- 3. 计算核心指标 ---
-            avg_vol_head = head_vol.mean() # 回调期平均量
-            avg_vol_neck = neck_vol.mean() # 上涨期平均量
-            
-            # --- 4. 判定逻辑 ---
-            # 逻辑A（核心）：整体水位下降。回调均量 < 上涨均量 * 0.7 (即缩量30%以上)
-            cond_avg_drop = avg_vol_head < (avg_vol_neck * 0.7)
-            
-            # 逻辑B（辅助/兜底）：原来的“均量线压制”逻辑，但放宽阈值。
-            # 如果某只股票没有明显的放量上涨，但回调时缩量极致（比如全在MA20之下），也算过。
-            # 这里将阈值从 0.6/0.8 降至 0.5 (一半时间在均量线下一即可)
-            period_ma20 = self.vma20.iloc[dead_idx_int:gold_idx_int+1]
-            cond_under_ma = (head_vol < period_ma20).mean() >= 0.5
-            
-            # --- 5. 综合结论 ---
-            # 满足任意一个条件即可（既抓住了标准缩量，也兼容了极致低量）
-            vol_shrink.iloc[i] = cond_avg_drop or cond_under_ma
-            
-        # 6. 鸭头高度约束（死叉前10天股价涨幅≥5%）
-        duck_head_height = pd.Series(False, index=self.c.index, dtype=bool)
-        for i in range(self.n):
-            if pd.isna(last_dead_idx.iloc[i]):
-                continue
-            try:
-                dead_idx_int = int(last_dead_idx.iloc[i])
-            except (ValueError, TypeError):
-                continue
-            # 防止索引越界（死叉前至少10天数据）
-            if dead_idx_int < 10:
-                continue
-            # 死叉前10天收盘价涨幅
-            pre_dead_close = self.c.iloc[dead_idx_int - 10]
-            dead_close = self.c.iloc[dead_idx_int]
-            # 避免除零错误
-            if pre_dead_close == 0:
-                continue
-            price_rise = (dead_close - pre_dead_close) / pre_dead_close * 100
-            duck_head_height.iloc[i] = price_rise >= 5  # 涨幅≥5%
-
-        # 7. 优化：鸭颈后趋势约束（鸭颈到死叉期间MA5未有效跌破MA60）
-        neck_to_dead_valid = pd.Series(False, index=self.c.index, dtype=bool)
-        for i in range(self.n):
-            neck_to_dead_valid.iloc[i] = self._is_neck_dead_valid(
-                last_neck_idx.iloc[i], last_dead_idx.iloc[i], ma5_series, ma60_series
-            )
-
-        # 8. 优化：鸭头头顶平台约束（死叉前5-10天最高价波动≤10%，避免不规则震荡）
-        head_platform_valid = pd.Series(False, index=self.c.index, dtype=bool)
-        for i in range(self.n):
-            if pd.isna(last_dead_idx.iloc[i]):
-                continue
-            try:
-                dead_idx_int = int(last_dead_idx.iloc[i])
-            except (ValueError, TypeError):
-                continue
-            # 确保有足够数据计算头顶平台
-            if dead_idx_int < 10:
-                continue
-            # 提取死叉前5-10天的最高价（头顶区间）
-            head_highs = self.h.iloc[dead_idx_int-10 : dead_idx_int-5+1]
-            max_high = head_highs.max()
-            min_high = head_highs.min()
-            # 避免除零错误
-            if min_high == 0:
-                continue
-            # 波动幅度≤15%，判定为平台震荡（宽松版）
-            head_volatility = (max_high - min_high) / min_high * 100
-            head_platform_valid.iloc[i] = head_volatility <= 15
+        # 逻辑B（辅助/兜底）：回调时缩量极致，一半时间在均量线下即可
+        under_ma = self._prefix_sum((self.v < self.vma20).to_numpy())
+        cond_under_ma = self._segment_mean(under_ma, dead, gold, valid) >= 0.5
 
-        # ======================================
-        # 所有条件合并（最终判定，包含新增优化约束）
-        # ======================================
-        final_cond = (
-            ma60_trend_up &
-            cond_recent_gold &
-            cond_neck_before_dead &
-            cond_sequence &
-            price_support_all &
-            vol_shrink &
-            duck_head_height &
-            neck_to_dead_valid &  # 新增鸭颈趋势约束
-            head_platform_valid   # 新增头顶平台约束
-        )
-
-        # 打印日志，分析每个条件的执行情况
-        if self._debug:
-            # 只打印最后一天的数据，因为我们关心的是最新状态
-            last_idx = len(self.c) - 1
-            print(f"\n=== OLD_DUCK_HEAD_LIKE 形态检测日志 ===")
-            print(f"最新日期: {self.c.index[last_idx] if hasattr(self.c, 'index') else last_idx}")
-            print(f"MA60趋势向上: {ma60_trend_up.iloc[last_idx]}")
-            print(f"近期金叉: {cond_recent_gold.iloc[last_idx]}")
-            print(f"鸭颈在死叉之前: {cond_neck_before_dead.iloc[last_idx]}")
-            print(f"死叉到金叉间隔合理: {cond_sequence.iloc[last_idx]}")
-            print(f"回调全程价格支撑: {price_support_all.iloc[last_idx]}")
-            print(f"回调缩量: {vol_shrink.iloc[last_idx]}")
-            print(f"鸭头高度足够: {duck_head_height.iloc[last_idx]}")
-            print(f"鸭颈到死叉期间MA5未跌破MA60: {neck_to_dead_valid.iloc[last_idx]}")
-            print(f"鸭头顶部平台震荡: {head_platform_valid.iloc[last_idx]}")
-            print(f"最终结果: {final_cond.iloc[last_idx]}")
-            print(f"======================================")
+        # 满足任意一个条件即可（既抓住了标准缩量，也兼容了极致低量）
+        vol_shrink = self._frame(has_neck & (cond_avg_drop | cond_under_ma))
 
-        # ======================================
-        # 结果处理：填充空值，转换为整数类型数组返回
-        # ======================================
-        return final_cond.fillna(0).astype(int).values
+        return self._duck_head_result('OLD_DUCK_HEAD_LIKE', ma60_trend_up, vol_shrink, cond)
 
     def TOP_VOL_SPIKE(self):
         """顶部放量"""
@@ -1156,8 +1043,7 @@ class CustomPatternDetector:
     def GOLDEN_SPIDER(self):
         """金蜘蛛"""
         # 三线距离非常近
-        arrs = np.vstack([self.ma5, self.ma10, self.ma20])
-        diff = np.max(arrs, axis=0) - np.min(arrs, axis=0)
+        diff = np.maximum.reduce([self.ma5, self.ma10, self.ma20]) - np.minimum.reduce([self.ma5, self.ma10, self.ma20])
         c1 = diff / self.c < 0.01
         # 均向上
         c2 = (self.ma5 > self.ma5.shift(1)) & \
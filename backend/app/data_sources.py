@@ -0,0 +1,367 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import asyncio
+import gzip
+import hashlib
+import json
+import logging
+import os
+import random
+import zlib
+from typing import Dict, List, Optional
+import numpy as np
+import pandas as pd
+import akshare as ak
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+# 统一的日K格式，与腾讯接口一致: amount 为成交量(手)
+BAR_COLUMNS = ['date', 'open', 'close', 'high', 'low', 'amount']
+
+def normalize_bars(df: pd.DataFrame, columns: Dict[str, str], volume_scale: float = 1.0) -> pd.DataFrame:
+    """把数据源返回的列重命名为统一格式，成交量乘以 volume_scale 换算为手"""
+    if df is None or df.empty:
+        return pd.DataFrame(columns=BAR_COLUMNS)
+    df = df.rename(columns=columns)[BAR_COLUMNS].copy()
+    df['date'] = pd.to_datetime(df['date']).dt.date
+    for column in BAR_COLUMNS[1:]:
+        df[column] = pd.to_numeric(df[column], errors='coerce')
+    if volume_scale != 1.0:
+        df['amount'] = df['amount'] * volume_scale
+    return df.reset_index(drop=True)
+
+# 复权因子格式: 除权除息日及该日起的后复权因子
+FACTOR_COLUMNS = ['date', 'factor']
+
+# 筹码分布格式(成本为不复权价格)
+CHIP_COLUMNS = ['date', 'profit_ratio', 'avg_cost', 'cost_90_low', 'cost_90_high', 'concentration_90',
+                'cost_70_low', 'cost_70_high', 'concentration_70']
+
+class DataSource:
+    """日K数据源接口
+
+    daily_bars 返回统一格式的不复权日K: date(datetime.date), open, close, high, low, amount，
+    adjust_factors 返回后复权因子: date, factor(仅 has_factors 为 True 的数据源支持)，
+    chip_distribution 返回最近的筹码分布: CHIP_COLUMNS(仅 has_chips 为 True 的数据源支持)，
+    symbol 为带市场前缀的代码(如 sh600519)，日期格式为 YYYYMMDD。
+    """
+
+    name = 'base'
+    has_factors = False
+    has_chips = False
+
+    async def daily_bars(self, symbol: str, start_date: str, end_date: str) -> pd.DataFrame:
+        raise NotImplementedError
+
+    async def adjust_factors(self, symbol: str) -> pd.DataFrame:
+        raise NotImplementedError
+
+    async def chip_distribution(self, symbol: str) -> pd.DataFrame:
+        raise NotImplementedError
+
+class TencentSource(DataSource):
+    """腾讯日K接口"""
+
+    name = 'tencent'
+
+    async def daily_bars(self, symbol: str, start_date: str, end_date: str) -> pd.DataFrame:
+        return await asyncio.to_thread(
+            ak.stock_zh_a_hist_tx,
+            symbol=symbol,
+            start_date=start_date,
+            end_date=end_date,
+            adjust=""
+        )
+
+class EastmoneySource(DataSource):
+    """东方财富日K接口，同时提供筹码分布"""
+
+    name = 'eastmoney'
+    has_chips = True
+
+    async def daily_bars(self, symbol: str, start_date: str, end_date: str) -> pd.DataFrame:
+        df = await asyncio.to_thread(
+            ak.stock_zh_a_hist,
+            symbol=symbol[2:],
+            period='daily',
+            start_date=start_date,
+            end_date=end_date,
+            adjust=""
+        )
+        return normalize_bars(df, {'日期': 'date', '开盘': 'open', '收盘': 'close',
+                                   '最高': 'high', '最低': 'low', '成交量': 'amount'})
+
+    async def chip_distribution(self, symbol: str) -> pd.DataFrame:
+        # 接口只返回最近 90 个交易日
+        df = await asyncio.to_thread(ak.stock_cyq_em, symbol=symbol[2:], adjust="")
+        return normalize_chips(df.rename(columns={
+            '日期': 'date', '获利比例': 'profit_ratio', '平均成本': 'avg_cost',
+            '90成本-低': 'cost_90_low', '90成本-高': 'cost_90_high', '90集中度': 'concentration_90',
+            '70成本-低': 'cost_70_low', '70成本-高': 'cost_70_high', '70集中度': 'concentration_70',
+        }))
+
+class SinaSource(DataSource):
+    """新浪财经日K接口，成交量单位为股；同时提供后复权因子"""
+
+    name = 'sina'
+    has_factors = True
+
+    async def daily_bars(self, symbol: str, start_date: str, end_date: str) -> pd.DataFrame:
+        df = await asyncio.to_thread(
+            ak.stock_zh_a_daily,
+            symbol=symbol,
+            start_date=start_date,
+            end_date=end_date,
+            adjust=""
+        )
+        return normalize_bars(df, {'volume': 'amount', 'amount': 'turnover'}, volume_scale=0.01)
+
+    async def adjust_factors(self, symbol: str) -> pd.DataFrame:
+        try:
+            df = await asyncio.to_thread(ak.stock_zh_a_daily, symbol=symbol, adjust="hfq-factor")
+        except ValueError as e:
+            # 从未除权除息的股票没有复权因子
+            if 'not available' in str(e):
+                return pd.DataFrame(columns=FACTOR_COLUMNS)
+            raise
+        return normalize_factors(df.rename(columns={'hfq_factor': 'factor'}))
+
+def normalize_chips(df: pd.DataFrame) -> pd.DataFrame:
+    """筹码分布按日期升序"""
+    if df is None or df.empty:
+        return pd.DataFrame(columns=CHIP_COLUMNS)
+    df = df[CHIP_COLUMNS].copy()
+    df['date'] = pd.to_datetime(df['date']).dt.date
+    for column in CHIP_COLUMNS[1:]:
+        df[column] = pd.to_numeric(df[column], errors='coerce')
+    return df.dropna(subset=['date']).sort_values('date').reset_index(drop=True)
+
+def normalize_factors(df: pd.DataFrame) -> pd.DataFrame:
+    """复权因子按日期升序去重"""
+    if df is None or df.empty:
+        return pd.DataFrame(columns=FACTOR_COLUMNS)
+    df = df[FACTOR_COLUMNS].copy()
+    df['date'] = pd.to_datetime(df['date']).dt.date
+    df['factor'] = pd.to_numeric(df['factor'], errors='coerce')
+    df = df.dropna().drop_duplicates('date', keep='last').sort_values('date')
+    return df.reset_index(drop=True)
+
+# 直连时按顺序使用的数据源，第一个为主数据源，其余用于对冲请求
+LIVE_SOURCES = [TencentSource, EastmoneySource, SinaSource]
+
+def _request_key(source: str, method: str, *args: str) -> str:
+    raw = json.dumps([source, method, *args])
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+def _encode(df: pd.DataFrame) -> bytes:
+    data = df.copy()
+    if 'date' in data.columns:
+        data['date'] = data['date'].astype(str)
+    return json.dumps(data.to_dict(orient='split'), ensure_ascii=False).encode()
+
+def _decode(raw: bytes) -> pd.DataFrame:
+    payload = json.loads(raw)
+    df = pd.DataFrame(payload['data'], columns=payload['columns'])
+    if 'date' in df.columns:
+        df['date'] = pd.to_datetime(df['date']).dt.date
+    return df
+
+class ResponseCache:
+    """按内容寻址的响应缓存
+
+    响应以 gzip 压缩的 JSON 存放在 blobs/<内容sha256>.json.gz，相同内容只存一份；
+    keys/<请求sha256> 记录请求对应的内容哈希。
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+        os.makedirs(os.path.join(root, 'blobs'), exist_ok=True)
+        os.makedirs(os.path.join(root, 'keys'), exist_ok=True)
+
+    def _key_path(self, key: str) -> str:
+        return os.path.join(self.root, 'keys', key)
+
+    def _blob_path(self, digest: str) -> str:
+        return os.path.join(self.root, 'blobs', f'{digest}.json.gz')
+
+    def put(self, key: str, df: pd.DataFrame):
+        raw = _encode(df)
+        digest = hashlib.sha256(raw).hexdigest()
+        blob = self._blob_path(digest)
+        if not os.path.exists(blob):
+            tmp = f'{blob}.{os.getpid()}.tmp'
+            with gzip.open(tmp, 'wb') as f:
+                f.write(raw)
+            os.replace(tmp, blob)
+        with open(self._key_path(key), 'w') as f:
+            f.write(digest)
+
+    def get(self, key: str) -> Optional[pd.DataFrame]:
+        try:
+            with open(self._key_path(key)) as f:
+                digest = f.read().strip()
+            with gzip.open(self._blob_path(digest), 'rb') as f:
+                return _decode(f.read())
+        except FileNotFoundError:
+            return None
+
+class RecordingSource(DataSource):
+    """包装一个数据源，把每次成功的响应记录到缓存中，供 FakeSource 回放"""
+
+    def __init__(self, inner: DataSource, cache_dir: str):
+        self.inner = inner
+        self.name = inner.name
+        self.has_factors = inner.has_factors
+        self.has_chips = inner.has_chips
+        self.cache = ResponseCache(cache_dir)
+
+    async def daily_bars(self, symbol: str, start_date: str, end_date: str) -> pd.DataFrame:
+        df = await self.inner.daily_bars(symbol, start_date, end_date)
+        if df is not None:
+            key = _request_key(self.inner.name, 'daily_bars', symbol, start_date, end_date)
+            await asyncio.to_thread(self.cache.put, key, df)
+        return df
+
+    async def adjust_factors(self, symbol: str) -> pd.DataFrame:
+        df = await self.inner.adjust_factors(symbol)
+        if df is not None:
+            await asyncio.to_thread(self.cache.put, _request_key(self.inner.name, 'adjust_factors', symbol), df)
+        return df
+
+    async def chip_distribution(self, symbol: str) -> pd.DataFrame:
+        df = await self.inner.chip_distribution(symbol)
+        if df is not None:
+            await asyncio.to_thread(self.cache.put, _request_key(self.inner.name, 'chip_distribution', symbol), df)
+        return df
+
+class FakeSource(DataSource):
+    """离线数据源：优先回放录制的响应，否则生成确定性的模拟日K
+
+    Args:
+        cache_dir: 录制缓存目录，None 表示只生成模拟数据
+        recorded_name: 回放哪个数据源的录制数据
+        latency: 每次请求的平均延迟(秒)
+        jitter: 延迟的随机浮动比例
+        error_rate: 请求失败的概率
+        tail_rate: 请求变慢(延迟乘以 tail_factor)的概率，模拟长尾延迟
+        seed: 随机种子(影响延迟和失败，不影响模拟数据)
+        name: 数据源名称，默认 fake
+        factors: 是否提供复权因子
+        chips: 是否提供筹码分布
+    """
+
+    name = 'fake'
+
+    def __init__(self, cache_dir: Optional[str] = None, recorded_name: str = TencentSource.name,
+                 latency: float = 0.05, jitter: float = 0.5, error_rate: float = 0.0,
+                 tail_rate: float = 0.0, tail_factor: float = 20.0, seed: Optional[int] = None,
+                 name: Optional[str] = None, factors: bool = True, chips: bool = True):
+        self.cache = ResponseCache(cache_dir) if cache_dir else None
+        self.recorded_name = recorded_name
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.tail_rate = tail_rate
+        self.tail_factor = tail_factor
+        self._random = random.Random(seed)
+        self.has_factors = factors
+        self.has_chips = chips
+        if name:
+            self.name = name
+
+    async def _request(self, symbol: str, method: str, *args: str) -> Optional[pd.DataFrame]:
+        """模拟一次请求的延迟和失败，返回录制的响应(未录制时返回 None)"""
+        delay = self.latency * (1 + self.jitter * (2 * self._random.random() - 1))
+        if self._random.random() < self.tail_rate:
+            delay *= self.tail_factor
+        await asyncio.sleep(max(0.0, delay))
+        if self._random.random() < self.error_rate:
+            raise ConnectionError(f"模拟数据源请求失败: {symbol}")
+        if self.cache is not None:
+            return self.cache.get(_request_key(self.recorded_name, method, symbol, *args))
+        return None
+
+    async def daily_bars(self, symbol: str, start_date: str, end_date: str) -> pd.DataFrame:
+        df = await self._request(symbol, 'daily_bars', start_date, end_date)
+        return synthetic_bars(symbol, start_date, end_date) if df is None else df
+
+    async def adjust_factors(self, symbol: str) -> pd.DataFrame:
+        df = await self._request(symbol, 'adjust_factors')
+        return synthetic_factors(symbol) if df is None else normalize_factors(df)
+
+    async def chip_distribution(self, symbol: str) -> pd.DataFrame:
+        df = await self._request(symbol, 'chip_distribution')
+        return synthetic_chips(symbol) if df is None else normalize_chips(df)
+
+def synthetic_bars(symbol: str, start_date: str, end_date: str) -> pd.DataFrame:
+    """按代码生成确定性的模拟日K(工作日)，同一代码在不同日期范围内的数据一致"""
+    dates = pd.bdate_range(pd.Timestamp(start_date), pd.Timestamp(end_date))
+    if not len(dates):
+        return pd.DataFrame(columns=['date', 'open', 'close', 'high', 'low', 'amount'])
+    # 以代码和日期作为随机种子，保证增量下载与全量下载的数据一致
+    base = 10 + zlib.crc32(symbol.encode()) % 90
+    seeds = (dates.asi8 // 86_400_000_000_000 + zlib.crc32(symbol.encode())) % (2 ** 32)
+    noise = np.array([np.random.default_rng(int(s)).normal(0, 1, 4) for s in seeds])
+    close = base * (1 + 0.02 * np.sin(dates.asi8 / 8.64e13 / 30)) + noise[:, 0] * 0.2
+    open_ = close + noise[:, 1] * 0.1
+    high = np.maximum(open_, close) + np.abs(noise[:, 2]) * 0.1
+    low = np.minimum(open_, close) - np.abs(noise[:, 3]) * 0.1
+    amount = np.round(10000 + np.abs(noise[:, 0]) * 5000)
+    return pd.DataFrame({
+        'date': dates.date,
+        'open': np.round(open_, 2),
+        'close': np.round(close, 2),
+        'high': np.round(high, 2),
+        'low': np.round(low, 2),
+        'amount': amount,
+    })
+
+def synthetic_factors(symbol: str) -> pd.DataFrame:
+    """按代码生成确定性的模拟后复权因子: 每年 6 月按代码决定是否除权"""
+    seed = zlib.crc32(symbol.encode())
+    dates, factors, factor = [pd.Timestamp('1990-12-19').date()], [1.0], 1.0
+    for year in range(2015, 2025):
+        if (seed >> (year - 2015)) & 1:
+            factor = round(factor * (1 + (seed % 7 + 1) / 100), 6)
+            dates.append(pd.Timestamp(f'{year}-06-15').date())
+            factors.append(factor)
+    return pd.DataFrame({'date': dates, 'factor': factors})
+
+def synthetic_chips(symbol: str, end_date: Optional[str] = None, days: int = 90) -> pd.DataFrame:
+    """由模拟日K生成最近 days 个工作日的模拟筹码分布"""
+    end = pd.Timestamp(end_date) if end_date else pd.Timestamp.today().normalize()
+    bars = synthetic_bars(symbol, (end - pd.Timedelta(days=days * 2)).strftime('%Y%m%d'), end.strftime('%Y%m%d'))
+    close = bars['close']
+    avg_cost = close.rolling(20, min_periods=1).mean()
+    spread = close.rolling(20, min_periods=1).std().fillna(0)
+    df = pd.DataFrame({
+        'date': bars['date'],
+        'profit_ratio': ((close - avg_cost) / spread.replace(0, 1)).clip(-2, 2) / 4 + 0.5,
+        'avg_cost': avg_cost,
+        'cost_90_low': avg_cost - 1.645 * spread,
+        'cost_90_high': avg_cost + 1.645 * spread,
+        'concentration_90': 1.645 * spread / avg_cost,
+        'cost_70_low': avg_cost - 1.036 * spread,
+        'cost_70_high': avg_cost + 1.036 * spread,
+        'concentration_70': 1.036 * spread / avg_cost,
+    })
+    return df.iloc[-days:].round(4).reset_index(drop=True)
+
+def create_sources(kind: str = 'live', cache_dir: Optional[str] = None, latency: float = 0.05,
+                   error_rate: float = 0.0, tail_rate: float = 0.0) -> List[DataSource]:
+    """按名称创建数据源列表(主数据源在前): live 直连, record 直连并录制到 cache_dir,
+    fake 回放 cache_dir 或生成模拟数据，每个直连数据源对应一个独立的模拟数据源"""
+    if kind == 'live':
+        return [cls() for cls in LIVE_SOURCES]
+    if kind == 'record':
+        if not cache_dir:
+            raise ValueError("record 模式需要指定录制目录")
+        return [RecordingSource(cls(), cache_dir) for cls in LIVE_SOURCES]
+    if kind == 'fake':
+        return [FakeSource(cache_dir=cache_dir, recorded_name=cls.name, latency=latency, error_rate=error_rate,
+                           tail_rate=tail_rate, name=f'fake_{cls.name}', factors=cls.has_factors,
+                           chips=cls.has_chips)
+                for cls in LIVE_SOURCES]
+    raise ValueError(f"未知的数据源: {kind}")
@@ -8,13 +8,37 @@ from .models import init_tables
 from .stock_history import (
     init_table as init_stock_history_table,
     save_to_database as save_stock_history,
+    save_many as save_stock_histories,
     get_stock_count,
-    get_latest_date as get_latest_stock_date
+    get_latest_date as get_latest_stock_date,
+    get_watermarks as get_stock_watermarks,
+    get_histories as get_stock_histories,
+    get_history_cache_stats
 )
 
+# 导出复权因子相关操作
+from .adjust_factors import (
+    save_factors as save_adjust_factors,
+    get_factors as get_adjust_factors,
+    ADJUST_MODES
+)
+
+# 导出筹码分布相关操作
+from .chips import (
+    save_chips,
+    get_chips,
+    get_chip_histories,
+    get_chip_panel,
+    get_watermarks as get_chip_watermarks
+)
+
+# 导出列式历史数据读取接口
+from .columnar import get_history_arrays
+
 from .companies import (
     init_table as init_companies_table,
     update_companies_from_data as update_companies_from_data,
     get_companies as get_companies,
-    get_companies_with_details as get_companies_with_details
+    get_companies_with_details as get_companies_with_details,
+    get_company_changes as get_company_changes
 )
\ No newline at end of file
@@ -0,0 +1,159 @@
+import json
+import logging
+from datetime import date, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+import numpy as np
+import pandas as pd
+from .config import DB_CONFIG
+from .connection import db
+from .dates import to_days
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+# 读取时支持的复权方式: 前复权、后复权、不复权
+ADJUST_MODES = ('qfq', 'hfq', 'none')
+
+# 需要复权的价格列，成交量不复权
+ADJUSTED_COLUMNS = ('open', 'close', 'high', 'low')
+
+def init_table():
+    """初始化复权因子表"""
+    with db.write_cursor() as cursor:
+        # 后复权因子只在除权除息日变化，每只股票只存变化点: 某日起的价格乘以该因子得到后复权价格
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS adjust_factors (
+            stock_code TEXT NOT NULL,
+            date INTEGER NOT NULL,
+            factor REAL NOT NULL,
+            PRIMARY KEY (stock_code, date)
+        ) WITHOUT ROWID
+        ''')
+
+        # 复权因子同步状态: 写入新K线后标记待同步(pending)，与K线同步分开执行，失败不影响K线入库
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS adjust_factor_sync (
+            stock_code TEXT PRIMARY KEY,
+            pending INTEGER NOT NULL DEFAULT 1,
+            synced_at TEXT,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            last_error TEXT
+        )
+        ''')
+
+def save_factors(stock_code: str, df: pd.DataFrame) -> int:
+    """保存一只股票的后复权因子，只写入新增和变化的因子
+
+    因子变化时递增该股票的数据版本号，使历史数据缓存失效。
+
+    Args:
+        df: date, factor 两列
+
+    Returns:
+        新增或变化的因子数量
+    """
+    if df is None or df.empty:
+        return 0
+    days = to_days(pd.to_datetime(df['date']).to_numpy()).tolist()
+    incoming = dict(zip(days, df['factor'].astype(float).tolist()))
+    with db.write_cursor() as cursor:
+        cursor.execute('SELECT date, factor FROM adjust_factors WHERE stock_code = ?', (stock_code,))
+        existing = {row[0]: row[1] for row in cursor.fetchall()}
+        changed = [(stock_code, day, factor) for day, factor in incoming.items() if existing.get(day) != factor]
+        cursor.executemany('''
+            INSERT INTO adjust_factors (stock_code, date, factor) VALUES (?, ?, ?)
+            ON CONFLICT(stock_code, date) DO UPDATE SET factor = excluded.factor
+        ''', changed)
+        if changed:
+            cursor.execute('UPDATE stock_watermarks SET version = version + 1 WHERE stock_code = ?', (stock_code,))
+    if changed:
+        logger.info(f"{stock_code} 复权因子更新 {len(changed)} 条")
+    return len(changed)
+
+def mark_pending(stock_codes: Iterable[str]):
+    """写入新K线后标记股票的复权因子待同步"""
+    with db.write_cursor() as cursor:
+        cursor.executemany('''
+            INSERT INTO adjust_factor_sync (stock_code, pending) VALUES (?, 1)
+            ON CONFLICT(stock_code) DO UPDATE SET pending = 1
+        ''', [(code,) for code in stock_codes])
+
+def mark_synced(stock_code: str, today: Optional[str] = None):
+    """复权因子同步成功"""
+    today = today or date.today().isoformat()
+    with db.write_cursor() as cursor:
+        cursor.execute('''
+            INSERT INTO adjust_factor_sync (stock_code, pending, synced_at) VALUES (?, 0, ?)
+            ON CONFLICT(stock_code) DO UPDATE SET pending = 0, synced_at = excluded.synced_at,
+                attempts = 0, last_error = NULL
+        ''', (stock_code, today))
+
+def mark_failed(stock_code: str, error: str):
+    """复权因子同步失败，保持待同步状态，下次同步时重试"""
+    with db.write_cursor() as cursor:
+        cursor.execute('''
+            INSERT INTO adjust_factor_sync (stock_code, pending, attempts, last_error) VALUES (?, 1, 1, ?)
+            ON CONFLICT(stock_code) DO UPDATE SET pending = 1, attempts = attempts + 1,
+                last_error = excluded.last_error
+        ''', (stock_code, error))
+
+def get_due(stock_codes: Iterable[str] | None = None, today: Optional[str] = None,
+            refresh_days: Optional[int] = None) -> List[str]:
+    """需要同步复权因子的股票: 待同步，且从未同步过或距上次成功同步已超过 refresh_days 天
+
+    除权除息不频繁，同一只股票在 refresh_days 内只请求一次因子接口，失败的股票下次同步时重试。
+    """
+    today = today or date.today().isoformat()
+    refresh_days = DB_CONFIG['adjust_factor_refresh_days'] if refresh_days is None else refresh_days
+    cutoff = (date.fromisoformat(today) - timedelta(days=refresh_days)).isoformat()
+    sql = 'SELECT stock_code FROM adjust_factor_sync WHERE pending = 1 AND (synced_at IS NULL OR synced_at <= ?)'
+    params: list = [cutoff]
+    if stock_codes is not None:
+        sql += ' AND stock_code IN (SELECT value FROM json_each(?))'
+        params.append(json.dumps(list(stock_codes)))
+    return [row[0] for row in db.get_cursor().execute(sql + ' ORDER BY stock_code', params)]
+
+def get_sync_status(stock_codes: Iterable[str]) -> Dict[str, Dict]:
+    """获取复权因子同步状态 {股票代码: {'pending', 'synced_at', 'attempts', 'last_error'}}"""
+    cursor = db.get_cursor()
+    cursor.execute('''
+        SELECT * FROM adjust_factor_sync WHERE stock_code IN (SELECT value FROM json_each(?))
+    ''', (json.dumps(list(stock_codes)),))
+    return {row['stock_code']: {k: row[k] for k in row.keys() if k != 'stock_code'} for row in cursor.fetchall()}
+
+def get_factors(stock_codes: Iterable[str]) -> Dict[str, Tuple[np.ndarray, np.ndarray]]:
+    """批量获取后复权因子
+
+    Returns:
+        {股票代码: (int32天数数组, float64因子数组)}，按日期升序，没有因子的股票不包含在结果中
+    """
+    cursor = db.get_cursor()
+    cursor.execute('''
+        SELECT stock_code, date, factor FROM adjust_factors
+        WHERE stock_code IN (SELECT value FROM json_each(?))
+        ORDER BY stock_code, date
+    ''', (json.dumps(list(stock_codes)),))
+    grouped: Dict[str, Tuple[list, list]] = {}
+    for code, day, factor in cursor.fetchall():
+        days, factors = grouped.setdefault(code, ([], []))
+        days.append(day)
+        factors.append(factor)
+    return {code: (np.array(days, dtype=np.int32), np.array(factors, dtype=np.float64))
+            for code, (days, factors) in grouped.items()}
+
+def scale(days: np.ndarray, factors: Tuple[np.ndarray, np.ndarray] | None, adjust: str) -> np.ndarray | None:
+    """计算每个交易日的价格乘数，不需要复权时返回 None
+
+    每个交易日取不晚于该日的最近一个因子(早于第一个因子的日期取第一个因子)；
+    后复权直接乘以因子，前复权再除以最新因子，使最新价格与不复权价格一致。
+    """
+    if adjust not in ADJUST_MODES:
+        raise ValueError(f"不支持的复权方式: {adjust}")
+    if adjust == 'none' or factors is None or not len(factors[0]):
+        return None
+    factor_days, values = factors
+    idx = np.clip(np.searchsorted(factor_days, days, side='right') - 1, 0, None)
+    multiplier = values[idx]
+    if adjust == 'qfq':
+        multiplier = multiplier / values[-1]
+    return multiplier
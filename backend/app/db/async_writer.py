@@ -0,0 +1,143 @@
+import asyncio
+import logging
+import queue
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+import pandas as pd
+from .config import DB_CONFIG
+from .stock_history import save_many
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+# 通知写线程退出的哨兵
+_STOP = object()
+
+class AsyncHistoryWriter:
+    """异步历史数据写入器
+
+    由一个专用线程执行所有 stock_history 写入，事件循环只负责提交数据：
+    - submit() 把数据放入有界队列并立即返回确认 Future，队列满时等待，形成背压；
+      replace=True 时在写入事务中先删除该股票的全部已有数据(替换旧版前复权数据)
+    - 写线程把队列中已有的数据按行数和等待时间合并为一个事务，通过 save_many 写入
+    - 合并的事务失败时逐批单独重试，一批数据有问题不影响同一事务中的其他数据
+    - 事务完成后在事件循环中回调确认，结果为该批数据中各股票的 {'inserted', 'updated'}，失败为 None
+
+    用法:
+        async with AsyncHistoryWriter() as writer:
+            ack = await writer.submit(df)
+            ...
+            result = await ack
+    """
+
+    def __init__(self, max_pending: int | None = None, batch_rows: int | None = None,
+                 batch_seconds: float | None = None):
+        self.max_pending = max_pending or DB_CONFIG['writer_max_pending']
+        self.batch_rows = batch_rows or DB_CONFIG['writer_batch_rows']
+        self.batch_seconds = batch_seconds if batch_seconds is not None else DB_CONFIG['writer_batch_seconds']
+        self._queue: queue.Queue = queue.Queue(maxsize=self.max_pending)
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self.transactions = 0
+
+    def start(self):
+        """在当前事件循环中启动写线程"""
+        if self._thread is not None:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._slots = asyncio.Semaphore(self.max_pending)
+        self._thread = threading.Thread(target=self._run, name='history-writer', daemon=True)
+        self._thread.start()
+
+    async def submit(self, df: pd.DataFrame, replace: bool = False) -> asyncio.Future:
+        """提交一批数据，返回写入完成时结束的 Future；待写数据达到上限时等待
+
+        replace=True 时这批数据中的股票在同一事务中先删除已有数据再写入，写入失败时已有数据保持不变
+        """
+        if self._thread is None:
+            self.start()
+        await self._slots.acquire()
+        future = self._loop.create_future()
+        future.add_done_callback(lambda _: self._slots.release())
+        # 信号量保证队列有空位，这里不会阻塞事件循环
+        self._queue.put_nowait((df, future, replace))
+        return future
+
+    async def save(self, df: pd.DataFrame) -> Optional[Dict[str, Dict[str, int]]]:
+        """提交并等待写入完成"""
+        return await (await self.submit(df))
+
+    async def close(self):
+        """写完队列中剩余数据后停止写线程"""
+        if self._thread is None:
+            return
+        await asyncio.to_thread(self._queue.put, _STOP)
+        await asyncio.to_thread(self._thread.join)
+        self._thread = None
+
+    async def __aenter__(self):
+        self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    def _collect(self, first) -> Tuple[List[tuple], bool]:
+        """从队列中合并一个事务的数据，返回 (数据列表, 是否收到退出信号)"""
+        batch = [first]
+        rows = len(first[0])
+        deadline = time.monotonic() + self.batch_seconds
+        while rows < self.batch_rows:
+            timeout = deadline - time.monotonic()
+            try:
+                item = self._queue.get(timeout=timeout) if timeout > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is _STOP:
+                return batch, True
+            batch.append(item)
+            rows += len(item[0])
+        return batch, False
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            item = self._queue.get()
+            if item is _STOP:
+                break
+            batch, stopping = self._collect(item)
+            stats = self._save(batch)
+            if stats is None and len(batch) > 1:
+                logger.warning(f"合并写入 {len(batch)} 批数据失败，逐批重试")
+                results = [self._result_for(item[0], self._save([item])) for item in batch]
+            else:
+                results = [self._result_for(df, stats) for df, _, _ in batch]
+            for (_, future, _), result in zip(batch, results):
+                self._loop.call_soon_threadsafe(self._resolve, future, result)
+
+    def _save(self, batch: List[tuple]) -> Optional[Dict[str, Any]]:
+        """在一个事务中写入多批数据，失败返回 None"""
+        self.transactions += 1
+        replace = [code for df, _, replace in batch if replace and df is not None and not df.empty
+                   for code in df['stock_code'].astype(str).unique()]
+        try:
+            return save_many([df for df, _, _ in batch], replace=replace)
+        except Exception as e:
+            logger.error(f"写线程保存数据失败: {e}")
+            return None
+
+    @staticmethod
+    def _result_for(df: pd.DataFrame, stats: Optional[Dict[str, Any]]) -> Optional[Dict[str, Dict[str, int]]]:
+        if stats is None:
+            return None
+        if df is None or df.empty:
+            return {}
+        codes = df['stock_code'].astype(str).unique()
+        return {code: stats['stocks'][code] for code in codes if code in stats['stocks']}
+
+    @staticmethod
+    def _resolve(future: asyncio.Future, result):
+        if not future.done():
+            future.set_result(result)
@@ -0,0 +1,158 @@
+import json
+import logging
+from typing import Any, Dict, Iterable, List, Optional
+import numpy as np
+import pandas as pd
+from .connection import db
+from .dates import to_day, to_days, to_iso, to_isos
+from . import adjust_factors
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+# 筹码分布字段: 获利比例、平均成本、90%/70% 筹码的成本区间和集中度
+CHIP_COLUMNS = ['profit_ratio', 'avg_cost', 'cost_90_low', 'cost_90_high', 'concentration_90',
+                'cost_70_low', 'cost_70_high', 'concentration_70']
+
+# 以价格表示的字段，读取时与K线一样复权
+CHIP_PRICE_COLUMNS = ['avg_cost', 'cost_90_low', 'cost_90_high', 'cost_70_low', 'cost_70_high']
+
+def init_table():
+    """初始化筹码分布表"""
+    with db.write_cursor() as cursor:
+        # 与 stock_history 相同，以 (stock_code, date) 为聚簇主键，日期以天数存储，成本为不复权价格
+        cursor.execute(f'''
+        CREATE TABLE IF NOT EXISTS chip_distribution (
+            stock_code TEXT NOT NULL,
+            date INTEGER NOT NULL,
+            {', '.join(f'{col} REAL' for col in CHIP_COLUMNS)},
+            PRIMARY KEY (stock_code, date)
+        ) WITHOUT ROWID
+        ''')
+
+UPSERT_SQL = f'''
+    INSERT INTO chip_distribution (stock_code, date, {', '.join(CHIP_COLUMNS)})
+    VALUES ({', '.join('?' * (len(CHIP_COLUMNS) + 2))})
+    ON CONFLICT(stock_code, date) DO UPDATE SET
+        {', '.join(f'{col} = excluded.{col}' for col in CHIP_COLUMNS)}
+    WHERE {' OR '.join(f'{col} IS NOT excluded.{col}' for col in CHIP_COLUMNS)}
+'''
+
+def save_chips(stock_code: str, df: pd.DataFrame) -> int:
+    """保存一只股票的筹码分布，已有且未变化的行跳过，返回新增或更新的行数"""
+    if df is None or df.empty:
+        return 0
+    df = df.dropna(subset=['date'])
+    days = to_days(pd.to_datetime(df['date']).to_numpy()).tolist()
+    values = [df[col].astype(float).where(df[col].notna(), None).tolist() for col in CHIP_COLUMNS]
+    rows = [(stock_code, day, *row) for day, *row in zip(days, *values)]
+    with db.write_cursor() as cursor:
+        changes = cursor.connection.total_changes
+        cursor.executemany(UPSERT_SQL, rows)
+        changed = cursor.connection.total_changes - changes
+    logger.info(f"{stock_code} 筹码分布写入 {changed} 条")
+    return changed
+
+def get_watermarks(stock_codes: Iterable[str]) -> Dict[str, Dict]:
+    """批量获取筹码分布的数据水位，格式与 stock_history.get_watermarks 一致: {股票代码: {'first_date', 'last_date', 'row_count'}}"""
+    cursor = db.get_cursor()
+    cursor.execute('''
+        SELECT stock_code, MIN(date), MAX(date), COUNT(*) FROM chip_distribution
+        WHERE stock_code IN (SELECT value FROM json_each(?))
+        GROUP BY stock_code
+    ''', (json.dumps(list(stock_codes)),))
+    return {code: {'first_date': to_iso(first), 'last_date': to_iso(last), 'row_count': count}
+            for code, first, last, count in cursor.fetchall()}
+
+def _select(stock_codes: List[str], start_date: Optional[str], end_date: Optional[str],
+            limit: Optional[int] = None) -> List[tuple]:
+    where = 'stock_code IN (SELECT value FROM json_each(?))'
+    params: List[Any] = [json.dumps(stock_codes)]
+    if start_date:
+        where += ' AND date >= ?'
+        params.append(to_day(start_date))
+    if end_date:
+        where += ' AND date <= ?'
+        params.append(to_day(end_date))
+    sql = f"SELECT stock_code, date, {', '.join(CHIP_COLUMNS)} FROM chip_distribution WHERE {where} ORDER BY stock_code, date"
+    if limit:
+        sql += ' LIMIT ?'
+        params.append(limit)
+    cursor = db.get_cursor()
+    cursor.execute(sql, tuple(params))
+    return cursor.fetchall()
+
+def _to_arrays(rows: List[tuple], start: int, end: int) -> Dict[str, np.ndarray]:
+    columns = list(zip(*rows[start:end]))
+    arrays = {'date': np.array(columns[1], dtype=np.int32)}
+    for i, col in enumerate(CHIP_COLUMNS, start=2):
+        arrays[col] = np.array(columns[i], dtype=np.float64)
+    return arrays
+
+def _adjust(code: str, arrays: Dict[str, np.ndarray], factors, adjust: str):
+    multiplier = adjust_factors.scale(arrays['date'], factors.get(code), adjust)
+    if multiplier is not None:
+        for col in CHIP_PRICE_COLUMNS:
+            arrays[col] = np.round(arrays[col] * multiplier, 2)
+
+def get_chips(stock_code: str, start_date: Optional[str] = None, end_date: Optional[str] = None,
+              limit: Optional[int] = None, adjust: str = 'qfq') -> List[Dict]:
+    """获取单只股票的筹码分布，成本按 adjust 复权"""
+    rows = _select([stock_code], start_date, end_date, limit)
+    if not rows:
+        return []
+    arrays = _to_arrays(rows, 0, len(rows))
+    factors = adjust_factors.get_factors([stock_code]) if adjust != 'none' else {}
+    _adjust(stock_code, arrays, factors, adjust)
+    dates = to_isos(arrays['date']).tolist()
+    # NaN(缺失值)输出为 None
+    columns = [[None if np.isnan(v) else v for v in arrays[col].tolist()] for col in CHIP_COLUMNS]
+    return [dict(zip(['date'] + CHIP_COLUMNS, values)) for values in zip(dates, *columns)]
+
+def get_chip_histories(stock_codes: Iterable[str], start_date: Optional[str] = None, end_date: Optional[str] = None,
+                       adjust: str = 'qfq') -> Dict[str, Dict[str, np.ndarray]]:
+    """批量获取筹码分布数组，供形态识别和回测使用
+
+    Returns:
+        {股票代码: {'date': int32天数数组, 字段: float64数组}}，与 stock_history.get_histories 格式一致，无数据的股票不包含在结果中
+    """
+    if adjust not in adjust_factors.ADJUST_MODES:
+        raise ValueError(f"不支持的复权方式: {adjust}")
+    codes = list(dict.fromkeys(stock_codes))
+    rows = _select(codes, start_date, end_date)
+    if not rows:
+        return {}
+    row_codes = np.array([row[0] for row in rows])
+    bounds = np.concatenate(([0], np.flatnonzero(row_codes[1:] != row_codes[:-1]) + 1, [len(rows)]))
+    factors = adjust_factors.get_factors(codes) if adjust != 'none' else {}
+    result = {}
+    for lo, hi in zip(bounds[:-1], bounds[1:]):
+        code = row_codes[lo]
+        result[code] = _to_arrays(rows, lo, hi)
+        _adjust(code, result[code], factors, adjust)
+    return {code: result[code] for code in codes if code in result}
+
+def get_chip_panel(stock_codes: List[str], dates: np.ndarray, adjust: str = 'qfq') -> Dict[str, np.ndarray]:
+    """获取对齐到给定交易日的筹码分布矩阵，作为批量形态检测的可选输入
+
+    Args:
+        stock_codes: 股票代码列表，决定矩阵的行顺序
+        dates: int32天数数组(与 stock_history.get_histories(align=True) 返回的 dates 相同)
+
+    Returns:
+        {字段: (股票数 × 交易日数) float64 矩阵}，没有筹码数据的日期为 NaN
+    """
+    dates = np.asarray(dates, dtype=np.int32)
+    panel = {col: np.full((len(stock_codes), len(dates)), np.nan) for col in CHIP_COLUMNS}
+    if not len(stock_codes) or not len(dates):
+        return panel
+    histories = get_chip_histories(stock_codes, to_iso(int(dates[0])), to_iso(int(dates[-1])), adjust=adjust)
+    for i, code in enumerate(stock_codes):
+        arrays = histories.get(code)
+        if arrays is None:
+            continue
+        pos = np.searchsorted(dates, arrays['date'])
+        found = (pos < len(dates)) & (dates[np.minimum(pos, len(dates) - 1)] == arrays['date'])
+        for col in CHIP_COLUMNS:
+            panel[col][i, pos[found]] = arrays[col][found]
+    return panel
@@ -0,0 +1,173 @@
+import os
+import logging
+import struct
+from typing import Dict, Iterable, List, Optional, Tuple
+import numpy as np
+from .config import DB_CONFIG
+from .connection import db
+from .dates import to_day, to_days
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+# 文件布局: 16字节头(魔数, 版本, 行数) + date(int32) + 5列 float64，各列连续存放并按8字节对齐
+MAGIC = b'OHLC'
+VERSION = 1
+HEADER = struct.Struct('<4sIQ')
+PRICE_COLUMNS = ('open', 'close', 'high', 'low', 'amount')
+COLUMNS = ('date',) + PRICE_COLUMNS
+
+# 已映射文件缓存: stock_code -> (文件标识, 各列数组)
+_mapped: Dict[str, tuple] = {}
+
+def store_dir() -> str:
+    """列式文件目录，与数据库文件放在同一目录下"""
+    return os.path.join(os.path.dirname(DB_CONFIG['database']), 'columnar')
+
+def _path(stock_code: str) -> str:
+    return os.path.join(store_dir(), f'{stock_code}.ohlc')
+
+def _layout(n: int):
+    """计算各列在文件中的 (偏移, dtype)"""
+    offsets = {}
+    pos = HEADER.size
+    offsets['date'] = (pos, np.int32)
+    pos += (4 * n + 7) // 8 * 8
+    for col in PRICE_COLUMNS:
+        offsets[col] = (pos, np.float64)
+        pos += 8 * n
+    return offsets, pos
+
+def write_arrays(stock_code: str, arrays: Dict[str, np.ndarray]):
+    """原子写入单只股票的列式文件(先写临时文件再替换)"""
+    n = len(arrays['date'])
+    offsets, size = _layout(n)
+    os.makedirs(store_dir(), exist_ok=True)
+    path = _path(stock_code)
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    buf = bytearray(size)
+    HEADER.pack_into(buf, 0, MAGIC, VERSION, n)
+    for col in COLUMNS:
+        offset, dtype = offsets[col]
+        data = np.ascontiguousarray(arrays[col], dtype=dtype)
+        buf[offset:offset + data.nbytes] = data.tobytes()
+    with open(tmp_path, 'wb') as f:
+        f.write(buf)
+    os.replace(tmp_path, path)
+    _mapped.pop(stock_code, None)
+
+def remove_stock(stock_code: str):
+    """删除单只股票的列式文件"""
+    try:
+        os.remove(_path(stock_code))
+    except FileNotFoundError:
+        pass
+    _mapped.pop(stock_code, None)
+
+def rebuild_stock(stock_code: str) -> int:
+    """从 stock_history 表(或年份分区)重建单只股票的列式文件，返回行数"""
+    from .stock_history import select_rows
+    rows = select_rows([stock_code], columns=PRICE_COLUMNS)
+    if not rows:
+        remove_stock(stock_code)
+        return 0
+    columns = list(zip(*rows))
+    arrays = {'date': to_days(columns[1])}
+    for i, col in enumerate(PRICE_COLUMNS, start=2):
+        arrays[col] = np.array(columns[i], dtype=np.float64)
+    write_arrays(stock_code, arrays)
+    return len(rows)
+
+def append_stock(stock_code: str, rows: List[Tuple], inserted: int) -> bool:
+    """将新写入的行追加到已有列式文件末尾
+
+    rows 为写入数据库的 (stock_code, date天数, *PRICE_COLUMNS) 行，inserted 为其中新增的行数；
+    只有晚于文件最后日期的行恰好是全部新增行时才追加，否则(文件不存在、写入了更早的日期等)返回 False
+    """
+    arrays = _open(stock_code)
+    if arrays is None or not len(arrays['date']):
+        return False
+    last = int(arrays['date'][-1])
+    # 同一日期写入多次时以最后一次为准，与数据库中的 upsert 结果一致
+    tail = {row[1]: row for row in rows if row[1] > last}
+    if len(tail) != inserted:
+        return False
+    tail = [tail[day] for day in sorted(tail)]
+    columns = list(zip(*tail))
+    write_arrays(stock_code, {
+        col: np.concatenate((arrays[col], np.array(columns[i], dtype=arrays[col].dtype)))
+        for i, col in enumerate(COLUMNS, start=1)
+    })
+    return True
+
+def rebuild_stocks(stock_codes: Iterable[str], tails: Optional[Dict[str, Tuple[List[Tuple], int]]] = None):
+    """刷新多只股票的列式文件，单只失败不影响其他股票
+
+    tails 中的股票 {股票代码: (写入的行, 新增行数)} 只追加了更晚日期时直接追加到文件末尾，否则从数据库重建；
+    刷新失败时删除该股票的列式文件，读取回退到数据库，避免继续读到过期数据
+    """
+    tails = tails or {}
+    for stock_code in stock_codes:
+        try:
+            if not (stock_code in tails and append_stock(stock_code, *tails[stock_code])):
+                rebuild_stock(stock_code)
+        except Exception as e:
+            logger.error(f"刷新 {stock_code} 列式文件失败: {e}")
+            try:
+                remove_stock(stock_code)
+            except OSError as e:
+                logger.error(f"删除 {stock_code} 过期列式文件失败: {e}")
+
+def rebuild_all() -> int:
+    """重建数据库中所有股票的列式文件，返回股票数量"""
+    cursor = db.get_cursor()
+    cursor.execute('SELECT stock_code FROM stock_watermarks')
+    codes = [row[0] for row in cursor.fetchall()]
+    rebuild_stocks(codes)
+    return len(codes)
+
+def _open(stock_code: str) -> Optional[Dict[str, np.ndarray]]:
+    """映射单只股票的列式文件，文件被替换后自动重新映射"""
+    path = _path(stock_code)
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    key = (st.st_ino, st.st_mtime_ns, st.st_size)
+    cached = _mapped.get(stock_code)
+    if cached and cached[0] == key:
+        return cached[1]
+
+    raw = np.memmap(path, dtype=np.uint8, mode='r')
+    magic, version, n = HEADER.unpack_from(raw[:HEADER.size].tobytes())
+    if magic != MAGIC or version != VERSION:
+        logger.error(f"列式文件格式不匹配: {path}")
+        return None
+    offsets, _ = _layout(n)
+    arrays = {}
+    for col in COLUMNS:
+        offset, dtype = offsets[col]
+        itemsize = np.dtype(dtype).itemsize
+        arrays[col] = raw[offset:offset + itemsize * n].view(dtype)
+    _mapped[stock_code] = (key, arrays)
+    return arrays
+
+def get_history_arrays(stock_code: str, start_date: str | None = None, end_date: str | None = None,
+                       build: bool = True) -> Optional[Dict[str, np.ndarray]]:
+    """获取单只股票的列式历史数据
+
+    返回 date(int32天数)、open、close、high、low、amount 的只读数组视图(零拷贝)，
+    列式文件不存在时从 stock_history 表构建(build=False 时直接返回 None)；无数据时返回 None
+    """
+    arrays = _open(stock_code)
+    if arrays is None:
+        if not build or not rebuild_stock(stock_code):
+            return None
+        arrays = _open(stock_code)
+        if arrays is None:
+            return None
+
+    dates = arrays['date']
+    lo = np.searchsorted(dates, to_day(start_date), side='left') if start_date else 0
+    hi = np.searchsorted(dates, to_day(end_date), side='right') if end_date else len(dates)
+    return {col: arr[lo:hi] for col, arr in arrays.items()}
@@ -10,129 +10,181 @@ logger = logging.getLogger(__name__)
 
 def init_table():
     """初始化公司表"""
-    cursor = db.get_cursor()
-    
-    # 创建公司表
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS companies (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        secucode TEXT NOT NULL,
-        security_code TEXT NOT NULL,
-        type TEXT NOT NULL,
-        security_name_abbr TEXT NOT NULL,
-        close_price REAL NOT NULL,
-        industry TEXT NOT NULL,
-        region TEXT NOT NULL,
-        weight REAL NOT NULL,
-        eps REAL NOT NULL,
-        bps REAL NOT NULL,
-        roe REAL NOT NULL,
-        total_shares REAL NOT NULL,
-        free_shares REAL NOT NULL,
-        free_cap REAL NOT NULL,
-        f2 REAL NOT NULL,
-        f3 REAL NOT NULL,
-        update_date TEXT NOT NULL,
-        UNIQUE(security_code)
-    )
-    ''')
-    
-    db.commit()
+    with db.write_cursor() as cursor:
+        # 创建公司表
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS companies (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            secucode TEXT NOT NULL,
+            security_code TEXT NOT NULL,
+            type TEXT NOT NULL,
+            security_name_abbr TEXT NOT NULL,
+            close_price REAL NOT NULL,
+            industry TEXT NOT NULL,
+            region TEXT NOT NULL,
+            weight REAL NOT NULL,
+            eps REAL NOT NULL,
+            bps REAL NOT NULL,
+            roe REAL NOT NULL,
+            total_shares REAL NOT NULL,
+            free_shares REAL NOT NULL,
+            free_cap REAL NOT NULL,
+            f2 REAL NOT NULL,
+            f3 REAL NOT NULL,
+            update_date TEXT NOT NULL,
+            UNIQUE(security_code)
+        )
+        ''')
+
+        # 创建成分股变动表，记录调入(added)和调出(removed)的股票
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS company_changes (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            security_code TEXT NOT NULL,
+            type TEXT NOT NULL,
+            security_name_abbr TEXT NOT NULL,
+            change TEXT NOT NULL,
+            change_date TEXT NOT NULL
+        )
+        ''')
+
+# 成分股字段: (数据库列名, 接口字段名, 缺失时的默认值)
+COMPANY_FIELDS = [
+    # 证券代码（带交易所前缀，如 sh600000）
+    ('secucode', 'SECUCODE', ''),
+    # 股票代码（纯数字，如 600000）
+    ('security_code', 'SECURITY_CODE', ''),
+    # 股票类型（1: 沪深300, 3: 中证500）
+    ('type', 'TYPE', ''),
+    # 股票简称
+    ('security_name_abbr', 'SECURITY_NAME_ABBR', ''),
+    # 收盘价
+    ('close_price', 'CLOSE_PRICE', 0.0),
+    # 所属行业
+    ('industry', 'INDUSTRY', ''),
+    # 所属地区
+    ('region', 'REGION', ''),
+    # 权重
+    ('weight', 'WEIGHT', 0.0),
+    # 每股收益
+    ('eps', 'EPS', 0.0),
+    # 每股净资产
+    ('bps', 'BPS', 0.0),
+    # 净资产收益率
+    ('roe', 'ROE', 0.0),
+    # 总股本
+    ('total_shares', 'TOTAL_SHARES', 0.0),
+    # 流通股本
+    ('free_shares', 'FREE_SHARES', 0.0),
+    # 流通市值
+    ('free_cap', 'FREE_CAP', 0.0),
+    # 涨幅（腾讯接口返回字段）
+    ('f2', 'f2', 0.0),
+    # 跌幅（腾讯接口返回字段）
+    ('f3', 'f3', 0.0),
+]
+COMPANY_COLUMNS = [column for column, _, _ in COMPANY_FIELDS]
+
+# 指数代码 -> 成分股表中的 type
+INDEX_TYPES = {'hs300': '1', 'csi500': '3'}
+
+def _to_record(stock: Dict) -> tuple:
+    """将接口返回的成分股数据转换为按 COMPANY_COLUMNS 排列的元组"""
+    record = []
+    for column, key, default in COMPANY_FIELDS:
+        value = stock.get(key)
+        if value is None or (value == '' and default != ''):
+            value = default
+        record.append(value)
+    return tuple(record)
 
 def update_companies_from_data(stocks: List[Dict]) -> bool:
     """将公司数据更新到数据库
+
+    与表中现有数据逐行比较，只写入新增和变化的行(UPDATE 保持 id 不变)；
+    同一类型(指数)中不再出现的成分股从表中删除。新增和移除记录在 company_changes 表中。
     
     Args:
-        stocks: 公司数据列表
+        stocks: 同一批下载的公司数据列表
     
     Returns:
         bool: 更新是否成功
     """
     try:
         update_date = datetime.now().strftime('%Y-%m-%d')
-        
-        # 初始化数据库表
-        init_table()
-        
-        # 连接数据库
-        cursor = db.get_cursor()
-        
-        # 插入或更新公司数据
+        records = {}
         for stock in stocks:
-            # 证券代码（带交易所前缀，如 sh600000）
-            secucode = stock.get('SECUCODE') or ''
-            # 股票代码（纯数字，如 600000）
-            security_code = stock.get('SECURITY_CODE') or ''
-            # 股票类型
-            type_ = stock.get('TYPE') or ''
-            # 股票简称
-            name_abbr = stock.get('SECURITY_NAME_ABBR') or ''
-            # 收盘价
-            close_price = stock.get('CLOSE_PRICE') or 0.0
-            # 所属行业
-            industry = stock.get('INDUSTRY') or ''
-            # 所属地区
-            region = stock.get('REGION') or ''
-            # 权重
-            weight = stock.get('WEIGHT')
-            weight = 0.0 if weight is None else weight
-            # 每股收益
-            eps = stock.get('EPS') or 0.0
-            # 每股净资产
-            bps = stock.get('BPS') or 0.0
-            # 净资产收益率
-            roe = stock.get('ROE') or 0.0
-            # 总股本
-            total_shares = stock.get('TOTAL_SHARES') or 0.0
-            # 流通股本
-            free_shares = stock.get('FREE_SHARES') or 0.0
-            # 流通市值
-            free_cap = stock.get('FREE_CAP') or 0.0
-            # 涨幅（腾讯接口返回字段）
-            f2 = stock.get('f2') or 0.0
-            # 跌幅（腾讯接口返回字段）
-            f3 = stock.get('f3') or 0.0
-
-            cursor.execute('''
-            REPLACE INTO companies (
-                secucode, security_code, type, security_name_abbr, close_price, industry,
-                region, weight, eps, bps, roe, total_shares, free_shares, free_cap,
-                f2, f3, update_date
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (
-                secucode,
-                security_code,
-                type_,
-                name_abbr,
-                close_price,
-                industry,
-                region,
-                weight,
-                eps,
-                bps,
-                roe,
-                total_shares,
-                free_shares,
-                free_cap,
-                f2,
-                f3,
-                update_date
-            ))
+            record = _to_record(stock)
+            if record[1]:
+                records[record[1]] = record
+        if not records:
+            return True
+        types = {record[2] for record in records.values()}
+
+        with db.write_cursor() as cursor:
+            cursor.execute(f"SELECT {', '.join(COMPANY_COLUMNS)} FROM companies")
+            existing = {row['security_code']: tuple(row) for row in cursor.fetchall()}
+
+            inserts = [record for code, record in records.items() if code not in existing]
+            updates = [record for code, record in records.items()
+                       if code in existing and existing[code] != record]
+            removed = [record for code, record in existing.items()
+                       if record[2] in types and code not in records]
+
+            if inserts:
+                cursor.executemany(f"""
+                INSERT INTO companies ({', '.join(COMPANY_COLUMNS)}, update_date)
+                VALUES ({', '.join('?' * (len(COMPANY_COLUMNS) + 1))})
+                """, [record + (update_date,) for record in inserts])
+            if updates:
+                assignments = ', '.join(f'{column} = ?' for column in COMPANY_COLUMNS if column != 'security_code')
+                cursor.executemany(f"""
+                UPDATE companies SET {assignments}, update_date = ? WHERE security_code = ?
+                """, [record[:1] + record[2:] + (update_date, record[1]) for record in updates])
+            if removed:
+                cursor.executemany('DELETE FROM companies WHERE security_code = ?',
+                                   [(record[1],) for record in removed])
+
+            changes = [(record[1], record[2], record[3], 'added', update_date) for record in inserts]
+            changes += [(record[1], record[2], record[3], 'removed', update_date) for record in removed]
+            if changes:
+                cursor.executemany("""
+                INSERT INTO company_changes (security_code, type, security_name_abbr, change, change_date)
+                VALUES (?, ?, ?, ?, ?)
+                """, changes)
         
-        db.commit()
-        logger.info(f"成功保存 {len(stocks)} 只公司到数据库")
+        logger.info(f"成功保存 {len(records)} 只公司到数据库: 新增 {len(inserts)}, 更新 {len(updates)}, "
+                    f"未变化 {len(records) - len(inserts) - len(updates)}, 移除 {len(removed)}")
         return True
     except Exception as e:
         logger.error(f"保存公司失败: {e}")
-        db.rollback()
         return False
 
-def get_companies() -> List[str]:
-    """从数据库获取公司列表"""
+def get_company_changes(limit: int = 100) -> List[Dict]:
+    """获取最近的成分股变动记录(新增/移除)"""
+    try:
+        cursor = db.get_cursor()
+        cursor.execute('SELECT * FROM company_changes ORDER BY id DESC LIMIT ?', (limit,))
+        return [dict(row) for row in cursor.fetchall()]
+    except Exception as e:
+        logger.error(f"读取成分股变动失败: {e}")
+        return []
+
+def get_companies(index: str | None = None) -> List[str]:
+    """从数据库获取公司列表
+
+    Args:
+        index: 指数代码 (hs300 或 csi500)，默认返回全部成分股
+    """
+    if index is not None and index not in INDEX_TYPES:
+        raise ValueError(f"不支持的指数: {index}")
     try:
         cursor = db.get_cursor()
         
-        cursor.execute('SELECT security_code FROM companies')
+        if index is None:
+            cursor.execute('SELECT security_code FROM companies')
+        else:
+            cursor.execute('SELECT security_code FROM companies WHERE type = ?', (INDEX_TYPES[index],))
         stocks = [row[0] for row in cursor.fetchall()]
         
         logger.info(f"成功读取 {len(stocks)} 只公司")
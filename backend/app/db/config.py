@@ -2,5 +2,35 @@ import os
 
 # 数据库配置
 DB_CONFIG = {
-    'database': os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(__file__)))), 'data', 'stock_history.db')
+    'database': os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(__file__)))), 'data', 'stock_history.db'),
+    # 等待写锁的超时时间(秒)
+    'busy_timeout': 30,
+    # 每个连接的页缓存大小(KB)
+    'cache_size_kb': 32 * 1024,
+    # 内存映射读取的最大字节数
+    'mmap_size': 1024 * 1024 * 1024,
+    # 在线迁移时每个事务复制的行数
+    'migration_chunk_size': 50000,
+    # get_history 查询结果缓存的内存预算(字节)
+    'history_cache_bytes': 64 * 1024 * 1024,
+    # 是否按年份把历史数据存放到独立的分区文件(已存在分区文件时自动启用)
+    'partition_by_year': False,
+    # 写入涉及多个年份分区时的并行写进程数
+    'partition_workers': 4,
+    # 多个年份分区的总写入行数达到该值时才由进程池并行写入，否则在当前进程中依次写入
+    'partition_parallel_rows': 200000,
+    # 同步任务失败后的重试退避: 首次等待秒数，按失败次数翻倍
+    'sync_retry_base_seconds': 60,
+    # 同步任务重试退避的上限(秒)
+    'sync_retry_max_seconds': 6 * 3600,
+    # 同步任务的最大尝试次数，超过后不再自动重试
+    'sync_max_attempts': 8,
+    # 同一只股票的复权因子最短同步间隔(天)，期间有新K线也不重复请求因子接口
+    'adjust_factor_refresh_days': 7,
+    # 异步写入器: 待写入数据批数上限(超过后提交方等待)
+    'writer_max_pending': 64,
+    # 异步写入器: 单个事务合并的最大行数
+    'writer_batch_rows': 50000,
+    # 异步写入器: 合并事务时等待后续数据的最长时间(秒)
+    'writer_batch_seconds': 0.5,
 }
@@ -1,45 +1,110 @@
 import sqlite3
 import os
+import threading
+from contextlib import contextmanager
 from .config import DB_CONFIG
 
 class DatabaseConnection:
-    """数据库连接管理类，实现单例模式"""
+    """数据库连接管理类，实现单例模式
+
+    数据库运行在 WAL 模式下：每个线程持有独立的只读连接，
+    所有写操作通过一个专用写连接串行执行，读请求不会被写事务阻塞。
+    """
     _instance = None
-    
+
     def __new__(cls):
         if cls._instance is None:
             cls._instance = super(DatabaseConnection, cls).__new__(cls)
-            cls._instance._connection = None
+            cls._instance._readers = {}
+            cls._instance._readers_lock = threading.Lock()
+            cls._instance._writer = None
+            cls._instance._write_lock = threading.RLock()
+            cls._instance._write_depth = 0
         return cls._instance
-    
+
+    def _open(self, readonly: bool) -> sqlite3.Connection:
+        """打开并配置一个数据库连接"""
+        db_path = DB_CONFIG['database']
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        conn = sqlite3.connect(db_path, check_same_thread=False, timeout=DB_CONFIG['busy_timeout'])
+        conn.row_factory = sqlite3.Row
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute(f"PRAGMA cache_size=-{int(DB_CONFIG['cache_size_kb'])}")
+        conn.execute(f"PRAGMA mmap_size={int(DB_CONFIG['mmap_size'])}")
+        if readonly:
+            conn.execute('PRAGMA query_only=ON')
+        return conn
+
     def connect(self):
-        """建立数据库连接"""
-        if self._connection is None:
-            db_path = DB_CONFIG['database']
-            os.makedirs(os.path.dirname(db_path), exist_ok=True)
-            self._connection = sqlite3.connect(db_path, check_same_thread=False)
-            self._connection.row_factory = sqlite3.Row
-        return self._connection
-    
+        """获取当前线程的只读连接"""
+        ident = threading.get_ident()
+        entry = self._readers.get(ident)
+        if entry is not None:
+            return entry[1]
+
+        conn = self._open(readonly=True)
+        with self._readers_lock:
+            # 清理已退出线程遗留的连接
+            for other, (thread, other_conn) in list(self._readers.items()):
+                if not thread.is_alive():
+                    other_conn.close()
+                    del self._readers[other]
+            self._readers[ident] = (threading.current_thread(), conn)
+        return conn
+
+    def _get_writer(self):
+        """获取专用写连接(需持有写锁)"""
+        if self._writer is None:
+            self._writer = self._open(readonly=False)
+        return self._writer
+
     def close(self):
-        """关闭数据库连接"""
-        if self._connection is not None:
-            self._connection.close()
-            self._connection = None
-    
+        """关闭所有数据库连接"""
+        with self._readers_lock:
+            for _, conn in self._readers.values():
+                conn.close()
+            self._readers.clear()
+        with self._write_lock:
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
+
     def get_cursor(self):
-        """获取数据库游标"""
+        """获取当前线程的只读游标"""
         return self.connect().cursor()
-    
+
+    @contextmanager
+    def write_cursor(self):
+        """获取写游标
+
+        持有写锁直到退出；最外层正常退出时提交事务，发生异常时回滚并重新抛出
+        """
+        with self._write_lock:
+            conn = self._get_writer()
+            self._write_depth += 1
+            try:
+                yield conn.cursor()
+                if self._write_depth == 1:
+                    conn.commit()
+            except Exception:
+                if self._write_depth == 1:
+                    conn.rollback()
+                raise
+            finally:
+                self._write_depth -= 1
+
     def commit(self):
-        """提交事务"""
-        if self._connection is not None:
-            self._connection.commit()
-    
+        """提交写连接上的事务"""
+        with self._write_lock:
+            if self._writer is not None:
+                self._writer.commit()
+
     def rollback(self):
-        """回滚事务"""
-        if self._connection is not None:
-            self._connection.rollback()
+        """回滚写连接上的事务"""
+        with self._write_lock:
+            if self._writer is not None:
+                self._writer.rollback()
 
 # 创建全局数据库连接实例
 db = DatabaseConnection()
@@ -0,0 +1,35 @@
+import datetime as _dt
+from typing import Iterable, Union
+import numpy as np
+
+# 日期统一以 1970-01-01 起的天数(int32)表示，便于列式存储和区间比较
+EPOCH = np.datetime64('1970-01-01', 'D')
+
+DateLike = Union[str, _dt.date, np.datetime64, int]
+
+def to_day(value: DateLike) -> int:
+    """将日期(YYYY-MM-DD字符串、date、Timestamp或天数)转换为天数"""
+    if isinstance(value, (int, np.integer)):
+        return int(value)
+    if isinstance(value, str):
+        value = value[:10]
+    elif isinstance(value, _dt.datetime):
+        value = value.date()
+    return int((np.datetime64(value, 'D') - EPOCH).astype(np.int64))
+
+def to_iso(day: int) -> str:
+    """将天数转换为 YYYY-MM-DD 字符串"""
+    return str(EPOCH + np.timedelta64(int(day), 'D'))
+
+def to_days(values: Iterable) -> np.ndarray:
+    """批量将日期转换为 int32 天数数组"""
+    arr = np.asarray(values)
+    if arr.dtype.kind in 'iu':
+        return arr.astype(np.int32)
+    if arr.dtype.kind in 'OUS':
+        arr = np.array([str(v)[:10] for v in arr], dtype='datetime64[D]')
+    return (arr.astype('datetime64[D]') - EPOCH).astype(np.int32)
+
+def to_isos(days: np.ndarray) -> np.ndarray:
+    """批量将天数数组转换为 YYYY-MM-DD 字符串数组"""
+    return (EPOCH + np.asarray(days).astype('timedelta64[D]')).astype(str)
@@ -0,0 +1,73 @@
+import sys
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional
+
+class HistoryCache:
+    """历史数据查询结果的 LRU 缓存
+
+    条目按估算的内存占用计入预算，超出预算时淘汰最久未使用的条目；
+    每个条目记录写入时股票的数据版本，版本变化后视为未命中。
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def estimate_size(rows: list) -> int:
+        """估算字典列表占用的字节数(按首行估算每行大小)"""
+        size = sys.getsizeof(rows)
+        if rows:
+            first = rows[0]
+            row_size = sys.getsizeof(first) + sum(sys.getsizeof(v) for v in first.values())
+            size += row_size * len(rows)
+        return size
+
+    def get(self, key: Hashable, version: int) -> Optional[Any]:
+        """获取缓存值，版本不一致或不存在时返回 None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != version:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key: Hashable, version: int, value: list):
+        """写入缓存，单个条目超过预算时不缓存"""
+        size = self.estimate_size(value)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[2]
+            self._entries[key] = (version, value, size)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, (_, _, evicted) = self._entries.popitem(last=False)
+                self._bytes -= evicted
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        """缓存命中统计"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / total, 4) if total else 0.0,
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+            }
@@ -1,10 +1,74 @@
+import logging
 from .connection import db
 
+# 配置日志
+logger = logging.getLogger(__name__)
+
+def _migrate_v1():
+    """v1: stock_history 改为 WITHOUT ROWID 表，日期以整数天数存储"""
+    from . import stock_history
+    stock_history.migrate_integer_dates()
+
+def _migrate_v2():
+    """v2: stock_watermarks 增加数据版本列，用于历史数据缓存失效"""
+    from . import stock_history
+    stock_history.add_watermark_version()
+
+def _migrate_v3():
+    """v3: stock_watermarks 增加价格基准列，已有的前复权数据在下次同步时重新下载为不复权数据"""
+    from . import stock_history
+    stock_history.add_price_basis()
+
+# 按版本号顺序执行的迁移，数据库当前版本记录在 PRAGMA user_version 中
+MIGRATIONS = [
+    (1, _migrate_v1),
+    (2, _migrate_v2),
+    (3, _migrate_v3),
+]
+
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+def get_schema_version() -> int:
+    """获取数据库当前的结构版本"""
+    return db.get_cursor().execute('PRAGMA user_version').fetchone()[0]
+
+def _set_schema_version(version: int):
+    with db.write_cursor() as cursor:
+        cursor.execute(f'PRAGMA user_version = {int(version)}')
+
+def migrate():
+    """执行所有未应用的迁移；新建的数据库直接标记为最新版本"""
+    version = get_schema_version()
+    if version >= SCHEMA_VERSION:
+        return
+    cursor = db.get_cursor()
+    has_tables = cursor.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'stock_history'"
+    ).fetchone() is not None
+    if not has_tables:
+        _set_schema_version(SCHEMA_VERSION)
+        return
+    for target, migration in MIGRATIONS:
+        if target <= version:
+            continue
+        logger.info(f"数据库结构迁移: v{version} -> v{target}")
+        migration()
+        _set_schema_version(target)
+        version = target
+
 def init_tables():
     """初始化所有数据库表"""
     from . import stock_history
     from . import companies
     from . import stock_groups
+    from . import sync_jobs
+    from . import trading_calendar
+    from . import symbols
+    from . import adjust_factors
+    from . import chips
+    
+    # 先迁移已有数据库的表结构
+    migrate()
     
     # 初始化stock_history表
     stock_history.init_table()
@@ -14,3 +78,18 @@ def init_tables():
     
     # 初始化stock_groups相关表
     stock_groups.init_table()
+    
+    # 初始化同步任务日志表
+    sync_jobs.init_table()
+    
+    # 初始化交易日历表
+    trading_calendar.init_table()
+    
+    # 初始化证券代码表
+    symbols.init_table()
+    
+    # 初始化复权因子表
+    adjust_factors.init_table()
+    
+    # 初始化筹码分布表
+    chips.init_table()
@@ -0,0 +1,308 @@
+import os
+import re
+import json
+import atexit
+import logging
+import sqlite3
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterable, List, Optional, Tuple
+import numpy as np
+from .config import DB_CONFIG
+from .connection import db
+from .dates import to_day
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+# 分区文件名: stock_history_<年份>.db 可写，stock_history_<年份>.ro.db 已冻结(只读、不可变)
+FILE_PATTERN = re.compile(r'^stock_history_(\d{4})(\.ro)?\.db$')
+
+# 分区只读连接: (线程标识, 文件路径) -> (线程, 连接)
+_readers: Dict[Tuple[int, str], tuple] = {}
+_readers_lock = threading.Lock()
+
+# 分区文件列表缓存: (目录, 目录修改时间) -> {年份: 路径}，目录内文件增删改名时失效
+_listing: Tuple[Optional[tuple], Dict[int, str]] = (None, {})
+
+# 并行写入分区的进程池，首次需要时创建，进程退出时关闭
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_workers = 0
+_pool_lock = threading.Lock()
+
+def partition_dir() -> str:
+    """分区文件目录，与主数据库文件放在同一目录下"""
+    return os.path.join(os.path.dirname(DB_CONFIG['database']), 'partitions')
+
+def _path(year: int, frozen: bool = False) -> str:
+    suffix = '.ro.db' if frozen else '.db'
+    return os.path.join(partition_dir(), f'stock_history_{year}{suffix}')
+
+def is_frozen(path: str) -> bool:
+    return path.endswith('.ro.db')
+
+def list_partitions() -> Dict[int, str]:
+    """列出已有的分区文件 {年份: 路径}
+
+    每次读取只检查目录的修改时间，目录有变化(其他进程新建或冻结分区)时才重新列出文件。
+    """
+    global _listing
+    directory = partition_dir()
+    try:
+        key = (directory, os.stat(directory).st_mtime_ns)
+    except FileNotFoundError:
+        return {}
+    cached_key, cached = _listing
+    if cached_key == key:
+        return dict(cached)
+
+    result = {}
+    for name in os.listdir(directory):
+        match = FILE_PATTERN.match(name)
+        if match:
+            result[int(match.group(1))] = os.path.join(directory, name)
+    result = dict(sorted(result.items()))
+    _listing = (key, result)
+    return dict(result)
+
+def _invalidate_listing():
+    """本进程新建或改名分区文件后清除文件列表缓存(修改时间精度不足时也能立即看到)"""
+    global _listing
+    _listing = (None, {})
+
+def enabled() -> bool:
+    """是否按年份分区存储：配置开启，或磁盘上已存在分区文件(保证各进程读写同一份数据)"""
+    return bool(DB_CONFIG['partition_by_year']) or bool(list_partitions())
+
+def years_of(days: Iterable[int]) -> np.ndarray:
+    """天数转换为年份"""
+    return np.asarray(days, dtype='datetime64[D]').astype('datetime64[Y]').astype(np.int64) + 1970
+
+def covering(start_day: Optional[int] = None, end_day: Optional[int] = None) -> List[Tuple[int, str]]:
+    """日期范围覆盖的分区，按年份升序"""
+    first = int(years_of([start_day])[0]) if start_day is not None else None
+    last = int(years_of([end_day])[0]) if end_day is not None else None
+    return [(year, path) for year, path in list_partitions().items()
+            if (first is None or year >= first) and (last is None or year <= last)]
+
+def _reader(path: str) -> sqlite3.Connection:
+    """获取当前线程在分区上的只读连接；冻结的分区以 immutable 方式打开，无需加锁"""
+    key = (threading.get_ident(), path)
+    entry = _readers.get(key)
+    if entry is not None:
+        return entry[1]
+
+    if is_frozen(path):
+        conn = sqlite3.connect(f'file:{path}?mode=ro&immutable=1', uri=True, check_same_thread=False)
+    else:
+        conn = sqlite3.connect(path, check_same_thread=False, timeout=DB_CONFIG['busy_timeout'])
+        conn.execute('PRAGMA query_only=ON')
+    conn.execute(f"PRAGMA mmap_size={int(DB_CONFIG['mmap_size'])}")
+    with _readers_lock:
+        # 清理已退出线程遗留的连接
+        for other, (thread, other_conn) in list(_readers.items()):
+            if not thread.is_alive():
+                other_conn.close()
+                del _readers[other]
+        _readers[key] = (threading.current_thread(), conn)
+    return conn
+
+def close(path: Optional[str] = None):
+    """关闭分区连接，path 为 None 时关闭全部"""
+    with _readers_lock:
+        for key, (_, conn) in list(_readers.items()):
+            if path is None or key[1] == path:
+                conn.close()
+                del _readers[key]
+
+def select_rows(stock_codes: List[str], start_day: Optional[int], end_day: Optional[int],
+                columns: Iterable[str], limit: Optional[int] = None) -> List[tuple]:
+    """从日期范围覆盖的分区读取 (stock_code, date, *columns)，按 (stock_code, date) 排序"""
+    select = ', '.join(['stock_code', 'date'] + list(columns))
+    where = 'stock_code IN (SELECT value FROM json_each(?))'
+    params: list = [json.dumps(stock_codes)]
+    if start_day is not None:
+        where += ' AND date >= ?'
+        params.append(start_day)
+    if end_day is not None:
+        where += ' AND date <= ?'
+        params.append(end_day)
+    sql = f'SELECT {select} FROM stock_history WHERE {where} ORDER BY stock_code, date'
+    if limit:
+        sql += f' LIMIT {int(limit)}'
+
+    rows: List[tuple] = []
+    for _, path in covering(start_day, end_day):
+        rows.extend(_reader(path).execute(sql, params).fetchall())
+        # 单只股票时分区按年份升序即为日期顺序，取够即可停止
+        if limit and len(stock_codes) == 1 and len(rows) >= limit:
+            break
+    if len(stock_codes) > 1:
+        rows.sort(key=lambda row: (row[0], row[1]))
+    return rows[:limit] if limit else rows
+
+def summarize(stock_codes: List[str]) -> Dict[str, Tuple[int, int, int]]:
+    """汇总各分区中股票的 (首日, 末日, 行数)"""
+    result: Dict[str, Tuple[int, int, int]] = {}
+    sql = '''
+        SELECT stock_code, MIN(date), MAX(date), COUNT(*) FROM stock_history
+        WHERE stock_code IN (SELECT value FROM json_each(?)) GROUP BY stock_code
+    '''
+    for _, path in list_partitions().items():
+        for code, first, last, count in _reader(path).execute(sql, (json.dumps(stock_codes),)):
+            if code in result:
+                prev = result[code]
+                result[code] = (min(prev[0], first), max(prev[1], last), prev[2] + count)
+            else:
+                result[code] = (first, last, count)
+    return result
+
+def count_rows() -> int:
+    """所有分区的总行数"""
+    return sum(_reader(path).execute('SELECT COUNT(*) FROM stock_history').fetchone()[0]
+               for path in list_partitions().values())
+
+def _write_year(path: str, grouped: Dict[str, List[tuple]], replace: Iterable[str] = ()) -> Dict[str, Dict[str, int]]:
+    """在单个分区文件中执行一个写事务(可在子进程中运行)，replace 中的股票先删除该分区中的已有数据"""
+    from .stock_history import HISTORY_TABLE_SQL, upsert_grouped
+    conn = sqlite3.connect(path, timeout=DB_CONFIG['busy_timeout'])
+    try:
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute(HISTORY_TABLE_SQL.format(name='stock_history'))
+        with conn:
+            return upsert_grouped(conn.cursor(), grouped, replace)
+    finally:
+        conn.close()
+
+def _get_pool(workers: int) -> ProcessPoolExecutor:
+    """获取长期复用的写入进程池，进程数配置变化时重建"""
+    global _pool, _pool_workers
+    with _pool_lock:
+        if _pool is None or _pool_workers != workers:
+            if _pool is not None:
+                _pool.shutdown()
+            # 调用方可能有其他线程(如异步写线程)，使用 spawn 避免 fork 带来的锁状态问题
+            _pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+            _pool_workers = workers
+        return _pool
+
+def shutdown_pool():
+    """关闭写入进程池"""
+    global _pool, _pool_workers
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown()
+            _pool, _pool_workers = None, 0
+
+atexit.register(shutdown_pool)
+
+def _run_writes(jobs: List[Tuple[str, Dict[str, List[tuple]], List[str]]]) -> List[Dict[str, Dict[str, int]]]:
+    """执行各分区的写入
+
+    涉及多个分区且总行数达到 DB_CONFIG['partition_parallel_rows'] 时由进程池并行写入，
+    否则在当前进程中依次写入(小批量写入时进程间传输数据的开销大于并行带来的收益)。
+    """
+    workers = min(int(DB_CONFIG['partition_workers']), len(jobs))
+    rows = sum(len(r) for _, grouped, _ in jobs for r in grouped.values())
+    if workers <= 1 or rows < int(DB_CONFIG['partition_parallel_rows']):
+        return [_write_year(*job) for job in jobs]
+    return list(_get_pool(workers).map(_write_year, *zip(*jobs)))
+
+def save_rows(grouped: Dict[str, List[tuple]], replace: Iterable[str] = ()) -> Dict[str, Dict[str, int]]:
+    """按年份拆分并写入分区，返回各股票的 {'inserted', 'updated'}
+
+    replace 中的股票在每个分区的写事务中先删除该分区中的已有数据；没有新数据的已有分区也会执行删除。
+    已冻结的年份不允许写入(或删除)，此时抛出 ValueError。
+    """
+    by_year: Dict[int, Dict[str, List[tuple]]] = {}
+    for code, rows in grouped.items():
+        for row, year in zip(rows, years_of([row[1] for row in rows]).tolist()):
+            by_year.setdefault(year, {}).setdefault(code, []).append(row)
+
+    existing = list_partitions()
+    replace = list(replace)
+    if replace:
+        sql = 'SELECT DISTINCT stock_code FROM stock_history WHERE stock_code IN (SELECT value FROM json_each(?))'
+        for year, path in existing.items():
+            for (code,) in _reader(path).execute(sql, (json.dumps(replace),)).fetchall():
+                by_year.setdefault(year, {}).setdefault(code, [])
+    frozen = sorted(year for year in by_year if is_frozen(existing.get(year, '')))
+    if frozen:
+        raise ValueError(f"分区已冻结，不能写入: {frozen}")
+
+    os.makedirs(partition_dir(), exist_ok=True)
+    jobs = [(_path(year), by_year[year], [code for code in replace if code in by_year[year]])
+            for year in sorted(by_year)]
+    stats: Dict[str, Dict[str, int]] = {}
+    try:
+        results = _run_writes(jobs)
+    finally:
+        _invalidate_listing()
+    for result in results:
+        for code, s in result.items():
+            total = stats.setdefault(code, {'inserted': 0, 'updated': 0})
+            total['inserted'] += s['inserted']
+            total['updated'] += s['updated']
+    return stats
+
+def split_table() -> int:
+    """把主库 stock_history 表中的数据按年份迁移到分区文件，返回迁移的行数
+
+    迁移期间应停止同步任务；迁移完成后主库表被清空，之后的读写都经由分区。
+    """
+    cursor = db.get_cursor()
+    bounds = cursor.execute('SELECT MIN(date), MAX(date) FROM stock_history').fetchone()
+    if bounds[0] is None:
+        return 0
+
+    os.makedirs(partition_dir(), exist_ok=True)
+    total = 0
+    for year in range(int(years_of([bounds[0]])[0]), int(years_of([bounds[1]])[0]) + 1):
+        if is_frozen(list_partitions().get(year, '')):
+            raise ValueError(f"分区已冻结，不能写入: {year}")
+        cursor.execute('''
+            SELECT stock_code, date, open, close, high, low, amount FROM stock_history
+            WHERE date BETWEEN ? AND ?
+        ''', (to_day(f'{year}-01-01'), to_day(f'{year}-12-31')))
+        grouped: Dict[str, List[tuple]] = {}
+        for row in cursor.fetchall():
+            grouped.setdefault(row[0], []).append(tuple(row))
+        if grouped:
+            _write_year(_path(year), grouped)
+            _invalidate_listing()
+            total += sum(len(rows) for rows in grouped.values())
+            logger.info(f"stock_history 分区迁移: {year} 年完成")
+
+    with db.write_cursor() as cursor:
+        cursor.execute('DELETE FROM stock_history')
+    return total
+
+def freeze(year: int) -> bool:
+    """把一个年份分区转为只读的不可变文件(合并WAL、整理后改名并去掉写权限)
+
+    冻结时该分区不能有其他进程的连接；冻结后以 immutable 方式打开，读取时不再加锁。
+    """
+    path = list_partitions().get(year)
+    if path is None or is_frozen(path):
+        return False
+    # 切换日志模式需要独占访问，先关闭本进程在该分区上的连接
+    close(path)
+    conn = sqlite3.connect(path, timeout=DB_CONFIG['busy_timeout'])
+    try:
+        conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+        conn.execute('PRAGMA journal_mode=DELETE')
+        conn.execute('VACUUM')
+    finally:
+        conn.close()
+    frozen_path = _path(year, frozen=True)
+    os.replace(path, frozen_path)
+    _invalidate_listing()
+    os.chmod(frozen_path, 0o444)
+    logger.info(f"stock_history 分区 {year} 已冻结")
+    return True
+
+def freeze_before(year: int) -> List[int]:
+    """冻结指定年份之前的所有分区，返回本次冻结的年份"""
+    return [y for y in list_partitions() if y < year and freeze(y)]
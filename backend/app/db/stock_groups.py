@@ -8,67 +8,59 @@ logger = logging.getLogger(__name__)
 
 def init_table():
     """初始化股票分组相关表"""
-    cursor = db.get_cursor()
-    
-    # 创建股票分组表
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS stock_groups (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        name TEXT NOT NULL UNIQUE,
-        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-    )
-    ''')
-    
-    # 创建股票分组关联表
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS stock_group_members (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        group_id INTEGER NOT NULL,
-        stock_code TEXT NOT NULL,
-        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-        FOREIGN KEY (group_id) REFERENCES stock_groups(id) ON DELETE CASCADE,
-        UNIQUE(group_id, stock_code)
-    )
-    ''')
-    
-    db.commit()
+    with db.write_cursor() as cursor:
+        # 创建股票分组表
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS stock_groups (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL UNIQUE,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''')
+        
+        # 创建股票分组关联表
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS stock_group_members (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            group_id INTEGER NOT NULL,
+            stock_code TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (group_id) REFERENCES stock_groups(id) ON DELETE CASCADE,
+            UNIQUE(group_id, stock_code)
+        )
+        ''')
 
 # 分组相关操作
 def create_group(name: str) -> int:
     """创建新分组"""
     try:
-        cursor = db.get_cursor()
-        cursor.execute(
-            'INSERT INTO stock_groups (name) VALUES (?)',
-            (name,)
-        )
-        db.commit()
+        with db.write_cursor() as cursor:
+            cursor.execute(
+                'INSERT INTO stock_groups (name) VALUES (?)',
+                (name,)
+            )
         return cursor.lastrowid
     except sqlite3.IntegrityError as e:
         if "UNIQUE constraint failed" in str(e):
             logger.error(f"分组名称已存在: {name}")
         else:
             logger.error(f"创建分组失败: {e}")
-        db.rollback()
         return -1
     except Exception as e:
         logger.error(f"创建分组失败: {e}")
-        db.rollback()
         return -1
 
 def delete_group(group_id: int) -> bool:
     """删除分组"""
     try:
-        cursor = db.get_cursor()
-        cursor.execute(
-            'DELETE FROM stock_groups WHERE id = ?',
-            (group_id,)
-        )
-        db.commit()
+        with db.write_cursor() as cursor:
+            cursor.execute(
+                'DELETE FROM stock_groups WHERE id = ?',
+                (group_id,)
+            )
         return cursor.rowcount > 0
     except Exception as e:
         logger.error(f"删除分组失败: {e}")
-        db.rollback()
         return False
 
 def get_all_groups() -> List[Dict]:
@@ -97,31 +89,27 @@ def get_group_by_id(group_id: int) -> Optional[Dict]:
 def add_stock_to_group(group_id: int, stock_code: str) -> bool:
     """将股票添加到分组"""
     try:
-        cursor = db.get_cursor()
-        cursor.execute(
-            'INSERT OR IGNORE INTO stock_group_members (group_id, stock_code) VALUES (?, ?)',
-            (group_id, stock_code)
-        )
-        db.commit()
+        with db.write_cursor() as cursor:
+            cursor.execute(
+                'INSERT OR IGNORE INTO stock_group_members (group_id, stock_code) VALUES (?, ?)',
+                (group_id, stock_code)
+            )
         return cursor.rowcount > 0
     except Exception as e:
         logger.error(f"添加股票到分组失败: {e}")
-        db.rollback()
         return False
 
 def remove_stock_from_group(group_id: int, stock_code: str) -> bool:
     """从分组中移除股票"""
     try:
-        cursor = db.get_cursor()
-        cursor.execute(
-            'DELETE FROM stock_group_members WHERE group_id = ? AND stock_code = ?',
-            (group_id, stock_code)
-        )
-        db.commit()
+        with db.write_cursor() as cursor:
+            cursor.execute(
+                'DELETE FROM stock_group_members WHERE group_id = ? AND stock_code = ?',
+                (group_id, stock_code)
+            )
         return cursor.rowcount > 0
     except Exception as e:
         logger.error(f"从分组中移除股票失败: {e}")
-        db.rollback()
         return False
 
 def get_stocks_in_group(group_id: int) -> List[str]:
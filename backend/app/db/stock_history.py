@@ -1,59 +1,314 @@
 import sqlite3
+import json
 import logging
+import numpy as np
 import pandas as pd
-from typing import Optional
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from .config import DB_CONFIG
 from .connection import db
+from .dates import to_day, to_days, to_iso, to_isos
+from . import adjust_factors, columnar, partitions
+from .history_cache import HistoryCache
 
 # 配置日志
 logger = logging.getLogger(__name__)
 
-def init_table():
-    """初始化股票历史数据表"""
-    cursor = db.get_cursor()
-    
-    # 创建股票历史数据表
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS stock_history (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
+# get_history 查询结果缓存
+_history_cache = HistoryCache(DB_CONFIG['history_cache_bytes'])
+
+# 日期以 1970-01-01 起的天数存储，以下 SQL 片段在文本日期与天数之间转换
+DAY_TO_TEXT = "date({0} * 86400, 'unixepoch')"
+TEXT_TO_DAY = "CAST(julianday({0}) - 2440587.5 AS INTEGER)"
+
+HISTORY_TABLE_SQL = '''
+    CREATE TABLE IF NOT EXISTS {name} (
         stock_code TEXT NOT NULL,
-        date TEXT NOT NULL,
+        date INTEGER NOT NULL,
         open REAL NOT NULL,
         close REAL NOT NULL,
         high REAL NOT NULL,
         low REAL NOT NULL,
         amount REAL NOT NULL,
-        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-        UNIQUE(stock_code, date)
-    )
-    ''')
-    
-    db.commit()
+        PRIMARY KEY (stock_code, date)
+    ) WITHOUT ROWID
+'''
 
-def save_to_database(df: pd.DataFrame) -> bool:
-    """将股票历史数据保存到SQLite数据库"""
+def init_table():
+    """初始化股票历史数据表"""
+    with db.write_cursor() as cursor:
+        # 创建股票历史数据表: 以 (stock_code, date) 为聚簇主键，每根K线只存一份
+        cursor.execute(HISTORY_TABLE_SQL.format(name='stock_history'))
+
+        # 创建股票数据水位表，记录每只股票已入库数据的范围
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS stock_watermarks (
+            stock_code TEXT PRIMARY KEY,
+            first_date TEXT NOT NULL,
+            last_date TEXT NOT NULL,
+            row_count INTEGER NOT NULL,
+            last_sync_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            version INTEGER NOT NULL DEFAULT 1,
+            price_basis TEXT NOT NULL DEFAULT 'raw'
+        )
+        ''')
+
+        # 已有数据库首次创建水位表时，从历史数据回填(旧数据为前复权价格)
+        if cursor.execute('SELECT 1 FROM stock_watermarks LIMIT 1').fetchone() is None:
+            cursor.execute(f'''
+            INSERT INTO stock_watermarks (stock_code, first_date, last_date, row_count, price_basis)
+            SELECT stock_code, {DAY_TO_TEXT.format('MIN(date)')}, {DAY_TO_TEXT.format('MAX(date)')}, COUNT(*), 'qfq'
+            FROM stock_history
+            GROUP BY stock_code
+            ''')
+
+def add_watermark_version():
+    """为 stock_watermarks 增加数据版本列，每次写入该股票数据时递增"""
+    cursor = db.get_cursor()
+    columns = {row['name'] for row in cursor.execute('PRAGMA table_info(stock_watermarks)')}
+    if not columns or 'version' in columns:
+        return
+    with db.write_cursor() as cursor:
+        cursor.execute('ALTER TABLE stock_watermarks ADD COLUMN version INTEGER NOT NULL DEFAULT 1')
+
+def add_price_basis():
+    """为 stock_watermarks 增加价格基准列: 已有数据为前复权价格(qfq)，重新同步后为不复权价格(raw)"""
+    cursor = db.get_cursor()
+    columns = {row['name'] for row in cursor.execute('PRAGMA table_info(stock_watermarks)')}
+    if not columns or 'price_basis' in columns:
+        return
+    with db.write_cursor() as cursor:
+        cursor.execute("ALTER TABLE stock_watermarks ADD COLUMN price_basis TEXT NOT NULL DEFAULT 'qfq'")
+
+def migrate_integer_dates(chunk_size: int | None = None):
+    """在线迁移旧版 stock_history 表(自增id + TEXT日期 + 唯一索引)到 WITHOUT ROWID 整数日期表
+
+    迁移期间旧表继续提供读写：
+    1. 创建新表，并在旧表上建立触发器把迁移期间的增删改同步到新表
+    2. 按 id 分块复制存量数据，每块一个短事务，不长时间占用写锁
+    3. 在一个事务内删除触发器和旧表，并将新表改名为 stock_history
+    """
+    chunk_size = chunk_size or DB_CONFIG['migration_chunk_size']
+    cursor = db.get_cursor()
+    columns = {row['name']: row['type'] for row in cursor.execute('PRAGMA table_info(stock_history)')}
+    if not columns or columns.get('date') == 'INTEGER':
+        return
+
+    new_values = f"NEW.stock_code, {TEXT_TO_DAY.format('NEW.date')}, NEW.open, NEW.close, NEW.high, NEW.low, NEW.amount"
+    with db.write_cursor() as cursor:
+        cursor.execute(HISTORY_TABLE_SQL.format(name='stock_history_v1'))
+        cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS stock_history_migrate_ins AFTER INSERT ON stock_history BEGIN
+            INSERT OR REPLACE INTO stock_history_v1 VALUES ({new_values});
+        END
+        ''')
+        cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS stock_history_migrate_upd AFTER UPDATE ON stock_history BEGIN
+            DELETE FROM stock_history_v1
+            WHERE stock_code = OLD.stock_code AND date = {TEXT_TO_DAY.format('OLD.date')};
+            INSERT OR REPLACE INTO stock_history_v1 VALUES ({new_values});
+        END
+        ''')
+        cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS stock_history_migrate_del AFTER DELETE ON stock_history BEGIN
+            DELETE FROM stock_history_v1
+            WHERE stock_code = OLD.stock_code AND date = {TEXT_TO_DAY.format('OLD.date')};
+        END
+        ''')
+        max_id = cursor.execute('SELECT COALESCE(MAX(id), 0) FROM stock_history').fetchone()[0]
+
+    # 分块复制存量数据；触发器写入的数据更新，复制时忽略冲突
+    copied = 0
+    for start in range(0, max_id, chunk_size):
+        with db.write_cursor() as cursor:
+            cursor.execute(f'''
+            INSERT OR IGNORE INTO stock_history_v1
+            SELECT stock_code, {TEXT_TO_DAY.format('date')}, open, close, high, low, amount
+            FROM stock_history WHERE id > ? AND id <= ?
+            ''', (start, start + chunk_size))
+            copied += cursor.rowcount
+        logger.info(f"stock_history 迁移进度: {min(start + chunk_size, max_id)}/{max_id}")
+
+    with db.write_cursor() as cursor:
+        for trigger in ('ins', 'upd', 'del'):
+            cursor.execute(f'DROP TRIGGER IF EXISTS stock_history_migrate_{trigger}')
+        cursor.execute('DROP TABLE stock_history')
+        cursor.execute('ALTER TABLE stock_history_v1 RENAME TO stock_history')
+    logger.info(f"stock_history 迁移完成，共复制 {copied} 条数据，可离线执行 VACUUM 回收空间")
+
+PRICE_COLUMNS = ['open', 'close', 'high', 'low', 'amount']
+
+UPSERT_SQL = '''
+    INSERT INTO stock_history (stock_code, date, open, close, high, low, amount)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT(stock_code, date) DO UPDATE SET
+        open = excluded.open,
+        close = excluded.close,
+        high = excluded.high,
+        low = excluded.low,
+        amount = excluded.amount
+    WHERE open IS NOT excluded.open OR close IS NOT excluded.close
+       OR high IS NOT excluded.high OR low IS NOT excluded.low
+       OR amount IS NOT excluded.amount
+'''
+
+# 写入的数据均为不复权价格，水位的价格基准同时更新为 raw
+WATERMARK_SQL = '''
+    INSERT INTO stock_watermarks (stock_code, first_date, last_date, row_count, last_sync_at, version, price_basis)
+    SELECT stock_code, date(MIN(date) * 86400, 'unixepoch'), date(MAX(date) * 86400, 'unixepoch'), COUNT(*), CURRENT_TIMESTAMP, 1, 'raw'
+    FROM stock_history
+    WHERE stock_code = ?
+    GROUP BY stock_code
+    ON CONFLICT(stock_code) DO UPDATE SET
+        first_date = excluded.first_date,
+        last_date = excluded.last_date,
+        row_count = excluded.row_count,
+        last_sync_at = excluded.last_sync_at,
+        version = stock_watermarks.version + ?,
+        price_basis = excluded.price_basis
+'''
+
+# 分区存储时，水位由各分区汇总后直接写入
+WATERMARK_VALUES_SQL = '''
+    INSERT INTO stock_watermarks (stock_code, first_date, last_date, row_count, last_sync_at, version, price_basis)
+    VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP, 1, 'raw')
+    ON CONFLICT(stock_code) DO UPDATE SET
+        first_date = excluded.first_date,
+        last_date = excluded.last_date,
+        row_count = excluded.row_count,
+        last_sync_at = excluded.last_sync_at,
+        version = stock_watermarks.version + ?,
+        price_basis = excluded.price_basis
+'''
+
+def _to_rows(df: pd.DataFrame) -> Dict[str, List[Tuple]]:
+    """按股票代码将DataFrame转换为待写入的元组列表(整列转换，不逐行遍历DataFrame)"""
+    df = df.dropna(subset=['stock_code', 'date'] + PRICE_COLUMNS)
     if df.empty:
-        return False
-    
-    conn = db.connect()
-    
+        return {}
+    codes = df['stock_code'].astype(str).to_numpy()
+    dates = to_days(pd.to_datetime(df['date']).to_numpy()).tolist()
+    prices = [df[col].to_numpy(dtype=np.float64).tolist() for col in PRICE_COLUMNS]
+    rows = list(zip(codes.tolist(), dates, *prices))
+
+    uniques = pd.unique(codes)
+    if len(uniques) == 1:
+        return {uniques[0]: rows}
+    grouped: Dict[str, List[Tuple]] = {}
+    for row in rows:
+        grouped.setdefault(row[0], []).append(row)
+    return grouped
+
+def upsert_grouped(cursor: sqlite3.Cursor, grouped: Dict[str, List[Tuple]],
+                   replace: Iterable[str] = ()) -> Dict[str, Dict[str, int]]:
+    """在当前事务中写入按股票分组的行，返回各股票的 {'inserted', 'updated'}
+
+    replace 中的股票先删除其全部已有数据，写入的行都计为新增
+    """
+    conn = cursor.connection
+    stats = {}
+    count_sql = 'SELECT COUNT(*) FROM stock_history WHERE stock_code = ? AND date BETWEEN ? AND ?'
+    replace = set(replace)
+    for code, rows in grouped.items():
+        if code in replace:
+            cursor.execute('DELETE FROM stock_history WHERE stock_code = ?', (code,))
+        if not rows:
+            stats[code] = {'inserted': 0, 'updated': 0}
+            continue
+        first_date = min(row[1] for row in rows)
+        last_date = max(row[1] for row in rows)
+        before = cursor.execute(count_sql, (code, first_date, last_date)).fetchone()[0]
+        changes = conn.total_changes
+        cursor.executemany(UPSERT_SQL, rows)
+        changed = conn.total_changes - changes
+        after = cursor.execute(count_sql, (code, first_date, last_date)).fetchone()[0]
+        inserted = after - before
+        stats[code] = {'inserted': inserted, 'updated': changed - inserted}
+    return stats
+
+def _refresh_partition_watermarks(stats: Dict[str, Optional[Dict[str, int]]], legacy: Iterable[str] = ()):
+    """按各分区汇总的数据写入水位，stats 为 None 的股票(写入结果未知)也递增版本号
+
+    legacy 中的股票保持前复权价格基准，下次同步时重新整体替换
+    """
+    marks = partitions.summarize(list(stats))
+    with db.write_cursor() as cursor:
+        cursor.executemany(WATERMARK_VALUES_SQL, [
+            (code, to_iso(first), to_iso(last), count,
+             int(stats[code] is None or bool(stats[code]['inserted'] or stats[code]['updated'])))
+            for code, (first, last, count) in marks.items()
+        ])
+        cursor.executemany("UPDATE stock_watermarks SET price_basis = 'qfq' WHERE stock_code = ?",
+                           [(code,) for code in legacy])
+
+def save_many(frames: Iterable[pd.DataFrame], replace: Iterable[str] = ()) -> Optional[Dict[str, Any]]:
+    """批量保存多只股票的历史数据
+
+    所有数据在同一个事务中通过 INSERT ... ON CONFLICT DO UPDATE 写入，
+    与已有数据重叠的行会被更新(值未变化时跳过)，不会导致整批失败；
+    同一事务内刷新 stock_watermarks 水位表，数据有变化的股票递增其版本号。
+    replace 中的股票(如旧版前复权数据)在同一事务中先删除全部已有数据再写入，写入失败时旧数据保持不变。
+    按年份分区存储时，数据写入各年份分区(数据量大时多个年份由多个进程并行写入)，随后按分区汇总刷新水位表；
+    分区无法与水位表在同一事务中提交，部分年份写入失败时仍按已写入的数据刷新水位和列式文件，重试时补齐
+    (整体替换的股票保持前复权价格基准，下次同步时重新替换)。
+
+    Returns:
+        {'inserted': 新增行数, 'updated': 更新行数, 'stocks': {股票代码: {'inserted', 'updated'}}}，失败返回None
+    """
+    grouped: Dict[str, List[Tuple]] = {}
+    for df in frames:
+        if df is None or df.empty:
+            continue
+        for code, rows in _to_rows(df).items():
+            grouped.setdefault(code, []).extend(rows)
+
+    stats = {'inserted': 0, 'updated': 0, 'stocks': {}}
+    if not grouped:
+        return stats
+    replace = [code for code in dict.fromkeys(replace) if code in grouped]
+
     try:
-        # 确保数据库表存在
-        init_table()
-        
-        # 将DataFrame保存到数据库,使用append模式,利用UNIQUE约束处理重复数据
-        df.to_sql('stock_history', conn, if_exists='append', index=False, 
-                 dtype={'stock_code': 'TEXT', 'date': 'TEXT'})
-        
-        db.commit()
-        logger.info(f"成功保存 {len(df)} 条数据到数据库")
-        return True
+        if partitions.enabled():
+            try:
+                stats['stocks'] = partitions.save_rows(grouped, replace)
+            except Exception:
+                # 分区文件与水位表不在同一事务中，部分年份可能已写入: 按分区中的实际数据刷新水位并使缓存失效
+                _refresh_partition_watermarks({code: None for code in grouped}, legacy=replace)
+                columnar.rebuild_stocks(list(grouped))
+                raise
+            _refresh_partition_watermarks(stats['stocks'])
+        else:
+            with db.write_cursor() as cursor:
+                stats['stocks'] = upsert_grouped(cursor, grouped, replace)
+                # 数据有变化的股票递增版本号，使历史数据缓存失效
+                cursor.executemany(WATERMARK_SQL, [
+                    (code, int(bool(s['inserted'] or s['updated']))) for code, s in stats['stocks'].items()
+                ])
+        stats['inserted'] = sum(s['inserted'] for s in stats['stocks'].values())
+        stats['updated'] = sum(s['updated'] for s in stats['stocks'].values())
+
+        logger.info(f"成功保存 {len(grouped)} 只股票数据: 新增 {stats['inserted']} 条, 更新 {stats['updated']} 条")
+        # 同步刷新列式文件: 只新增了行的股票尝试直接追加到文件末尾，其余从数据库重建
+        changed = [code for code, s in stats['stocks'].items() if s['inserted'] or s['updated']]
+        columnar.rebuild_stocks(changed, tails={
+            code: (grouped[code], stats['stocks'][code]['inserted'])
+            for code in changed if not stats['stocks'][code]['updated'] and code not in replace
+        })
+        return stats
     except Exception as e:
         logger.error(f"保存数据到数据库失败: {e}")
-        db.rollback()
+        return None
+
+def save_to_database(df: pd.DataFrame) -> bool:
+    """将股票历史数据保存到SQLite数据库"""
+    if df.empty:
         return False
+    
+    return save_many([df]) is not None
 
 def get_stock_count() -> int:
     """获取数据库中股票历史数据的条数"""
+    if partitions.enabled():
+        return partitions.count_rows()
     cursor = db.get_cursor()
     
     cursor.execute('SELECT COUNT(*) FROM stock_history')
@@ -63,45 +318,201 @@ def get_stock_count() -> int:
 
 def get_latest_date(stock_code: str) -> Optional[str]:
     """获取数据库中特定股票的最大日期"""
+    if partitions.enabled():
+        return get_watermarks([stock_code]).get(stock_code, {}).get('last_date')
     cursor = db.get_cursor()
     
     cursor.execute('''
-        SELECT MAX(date) FROM stock_history 
+        SELECT date(MAX(date) * 86400, 'unixepoch') FROM stock_history 
         WHERE stock_code = ?
     ''', (stock_code,))
     latest_date = cursor.fetchone()[0]
     
     return latest_date
 
+def get_watermarks(stock_codes: Iterable[str] | None = None) -> Dict[str, Dict]:
+    """批量获取股票数据水位
+
+    Args:
+        stock_codes: 股票代码列表，None 表示所有股票
+
+    Returns:
+        {股票代码: {'first_date', 'last_date', 'row_count', 'last_sync_at', 'version', 'price_basis'}}，无数据的股票不包含在结果中
+    """
+    cursor = db.get_cursor()
+    if stock_codes is None:
+        cursor.execute('SELECT * FROM stock_watermarks')
+    else:
+        # 通过 json_each 一次传入全部代码，避免 SQL 变量数量限制
+        cursor.execute('''
+            SELECT * FROM stock_watermarks
+            WHERE stock_code IN (SELECT value FROM json_each(?))
+        ''', (json.dumps(list(stock_codes)),))
+    return {row['stock_code']: dict(row) for row in cursor.fetchall()}
+
 def check_data_exists(stock_code: str, start_date: str, end_date: str) -> int:
     """检查数据库中特定股票在指定日期范围内的数据数量"""
+    if partitions.enabled():
+        return len(select_rows([stock_code], to_day(start_date), to_day(end_date), columns=[]))
     cursor = db.get_cursor()
     
     cursor.execute('''
         SELECT COUNT(*) FROM stock_history 
         WHERE stock_code = ? AND date BETWEEN ? AND ?
-    ''', (stock_code, start_date, end_date))
+    ''', (stock_code, to_day(start_date), to_day(end_date)))
     count = cursor.fetchone()[0]
     
     return count
 
-def get_history(stock_code: str, start_date: str | None = None, end_date: str | None = None, limit: int | None = 1000):
-    cursor = db.get_cursor()
-    where = 'stock_code = ?'
-    params = [stock_code]
-    if start_date and end_date:
-        where += ' AND date BETWEEN ? AND ?'
-        params += [start_date, end_date]
-    elif start_date:
+def get_data_version(stock_code: str) -> Optional[int]:
+    """获取股票数据版本号，无数据时返回 None"""
+    row = db.get_cursor().execute(
+        'SELECT version FROM stock_watermarks WHERE stock_code = ?', (stock_code,)
+    ).fetchone()
+    return row[0] if row else None
+
+def get_history(stock_code: str, start_date: str | None = None, end_date: str | None = None, limit: int | None = 1000,
+                adjust: str = 'qfq'):
+    """获取单只股票的历史数据
+
+    数据库中存储不复权价格，读取时按 adjust(qfq 前复权 / hfq 后复权 / none 不复权)乘以复权因子。
+    结果按 (股票代码, 起止日期, 条数, 复权方式) 缓存，并以 stock_watermarks 中的版本号校验，
+    任何进程写入该股票数据或复权因子后缓存自动失效。调用方不应修改返回的列表。
+    """
+    if adjust not in adjust_factors.ADJUST_MODES:
+        raise ValueError(f"不支持的复权方式: {adjust}")
+    version = get_data_version(stock_code)
+    if version is None:
+        return _query_history(stock_code, start_date, end_date, limit, adjust)
+    # 版本号只在同一数据库内有意义，键中包含数据库路径
+    key = (DB_CONFIG['database'], stock_code, start_date, end_date, limit, adjust)
+    rows = _history_cache.get(key, version)
+    if rows is None:
+        rows = _query_history(stock_code, start_date, end_date, limit, adjust)
+        _history_cache.put(key, version, rows)
+    return rows
+
+def get_history_cache_stats() -> Dict[str, Any]:
+    """获取历史数据缓存的命中统计"""
+    return _history_cache.stats()
+
+def select_rows(stock_codes: List[str], start_day: int | None = None, end_day: int | None = None,
+                columns: Iterable[str] = PRICE_COLUMNS, limit: int | None = None) -> List[Tuple]:
+    """读取 (stock_code, date天数, *columns) 原始行，按 (stock_code, date) 排序
+
+    按年份分区存储时只读取日期范围覆盖的分区，否则读取主库 stock_history 表。
+    """
+    columns = list(columns)
+    if partitions.enabled():
+        return partitions.select_rows(stock_codes, start_day, end_day, columns, limit)
+    where = 'stock_code IN (SELECT value FROM json_each(?))'
+    params: List[Any] = [json.dumps(stock_codes)]
+    if start_day is not None:
         where += ' AND date >= ?'
-        params += [start_date]
-    elif end_date:
+        params.append(start_day)
+    if end_day is not None:
         where += ' AND date <= ?'
-        params += [end_date]
-    sql = f'SELECT date, open, close, high, low, amount FROM stock_history WHERE {where} ORDER BY date ASC'
+        params.append(end_day)
+    sql = f"SELECT {', '.join(['stock_code', 'date'] + columns)} FROM stock_history WHERE {where} ORDER BY stock_code, date"
     if limit:
         sql += ' LIMIT ?'
         params.append(limit)
+    cursor = db.get_cursor()
     cursor.execute(sql, tuple(params))
-    rows = cursor.fetchall()
-    return [dict(row) for row in rows]
+    return cursor.fetchall()
+
+def _adjust_arrays(days: np.ndarray, arrays: Dict[str, np.ndarray], factors, adjust: str) -> Dict[str, np.ndarray]:
+    """按复权因子调整价格列，返回新的数组(不修改传入的数组)"""
+    multiplier = adjust_factors.scale(days, factors, adjust)
+    if multiplier is None:
+        return arrays
+    return {f: np.round(values * multiplier, 2) if f in adjust_factors.ADJUSTED_COLUMNS else values
+            for f, values in arrays.items()}
+
+def _query_history(stock_code: str, start_date: str | None, end_date: str | None, limit: int | None,
+                   adjust: str = 'qfq') -> List[Dict]:
+    rows = select_rows([stock_code], to_day(start_date) if start_date else None,
+                       to_day(end_date) if end_date else None, limit=limit)
+    if not rows:
+        return []
+    columns = list(zip(*rows))
+    days = np.array(columns[1], dtype=np.int32)
+    arrays = {f: np.array(columns[i], dtype=np.float64) for i, f in enumerate(PRICE_COLUMNS, start=2)}
+    factors = adjust_factors.get_factors([stock_code]).get(stock_code) if adjust != 'none' else None
+    arrays = _adjust_arrays(days, arrays, factors, adjust)
+    dates = to_isos(days).tolist()
+    return [dict(zip(['date'] + PRICE_COLUMNS, values))
+            for values in zip(dates, *(arrays[f].tolist() for f in PRICE_COLUMNS))]
+
+def get_histories(stock_codes: Iterable[str], start_date: str | None = None, end_date: str | None = None,
+                  fields: Iterable[str] | None = None, align: bool = False, adjust: str = 'qfq') -> Dict[str, Any]:
+    """批量获取多只股票的历史数据
+
+    优先读取列式文件，缺失的股票通过一次按 (stock_code, date) 排序的区间查询补齐；
+    价格按 adjust 复权(复权后的数组为新分配的数组，不复权时为列式文件的只读视图)。
+
+    Args:
+        stock_codes: 股票代码列表
+        start_date: 开始日期 (YYYY-MM-DD)
+        end_date: 结束日期 (YYYY-MM-DD)
+        fields: 需要的字段，默认 open, close, high, low, amount
+        align: 是否对齐到公共交易日历
+        adjust: 复权方式，qfq 前复权 / hfq 后复权 / none 不复权
+
+    Returns:
+        align=False: {股票代码: {'date': int32天数数组, 字段: float64数组}}，无数据的股票不包含在结果中
+        align=True: {'codes': 股票代码列表, 'dates': int32天数数组, 字段: (股票数 × 交易日数) 矩阵，缺失处为 NaN}
+    """
+    codes = list(dict.fromkeys(stock_codes))
+    fields = list(fields or PRICE_COLUMNS)
+    unknown = set(fields) - set(PRICE_COLUMNS)
+    if unknown:
+        raise ValueError(f"不支持的字段: {sorted(unknown)}")
+    if adjust not in adjust_factors.ADJUST_MODES:
+        raise ValueError(f"不支持的复权方式: {adjust}")
+    result: Dict[str, Dict[str, np.ndarray]] = {}
+
+    missing = []
+    for code in codes:
+        arrays = columnar.get_history_arrays(code, start_date, end_date, build=False)
+        if arrays is None:
+            missing.append(code)
+        elif len(arrays['date']):
+            result[code] = {'date': arrays['date'], **{f: arrays[f] for f in fields}}
+
+    if missing:
+        rows = select_rows(missing, to_day(start_date) if start_date else None,
+                           to_day(end_date) if end_date else None, columns=fields)
+        if rows:
+            columns = list(zip(*rows))
+            row_codes = np.array(columns[0])
+            dates = np.array(columns[1], dtype=np.int32)
+            values = {f: np.array(columns[i], dtype=np.float64) for i, f in enumerate(fields, start=2)}
+            # 结果按股票代码排序，按代码变化的位置切分
+            bounds = np.concatenate(([0], np.flatnonzero(row_codes[1:] != row_codes[:-1]) + 1, [len(rows)]))
+            for lo, hi in zip(bounds[:-1], bounds[1:]):
+                result[row_codes[lo]] = {'date': dates[lo:hi], **{f: values[f][lo:hi] for f in fields}}
+
+    if adjust != 'none' and result:
+        factors = adjust_factors.get_factors(list(result))
+        for code, arrays in result.items():
+            if code in factors:
+                prices = {f: arrays[f] for f in fields}
+                arrays.update(_adjust_arrays(arrays['date'], prices, factors[code], adjust))
+
+    if not align:
+        return {code: result[code] for code in codes if code in result}
+
+    present = [code for code in codes if code in result]
+    if present:
+        calendar = np.unique(np.concatenate([result[code]['date'] for code in present]))
+    else:
+        calendar = np.empty(0, dtype=np.int32)
+    aligned: Dict[str, Any] = {'codes': present, 'dates': calendar}
+    for f in fields:
+        matrix = np.full((len(present), len(calendar)), np.nan)
+        for i, code in enumerate(present):
+            idx = np.searchsorted(calendar, result[code]['date'])
+            matrix[i, idx] = result[code][f]
+        aligned[f] = matrix
+    return aligned
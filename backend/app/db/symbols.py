@@ -0,0 +1,57 @@
+import logging
+from typing import Dict, List
+from .connection import db
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+def init_table():
+    """初始化证券代码表"""
+    with db.write_cursor() as cursor:
+        # 创建证券代码表: 代码、名称、交易所及名称拼音首字母
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS symbols (
+            code TEXT PRIMARY KEY,
+            name TEXT NOT NULL,
+            exchange TEXT NOT NULL,
+            initials TEXT NOT NULL DEFAULT '',
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        ) WITHOUT ROWID
+        ''')
+
+def save_symbols(symbols: List[Dict]) -> Dict[str, int]:
+    """整体刷新证券代码表，只写入新增和变化的行，删除已退市的代码
+
+    Args:
+        symbols: [{'code', 'name', 'exchange', 'initials'}]
+
+    Returns:
+        {'inserted', 'updated', 'deleted'}
+    """
+    incoming = {s['code']: (s['name'], s['exchange'], s.get('initials', '')) for s in symbols}
+    with db.write_cursor() as cursor:
+        cursor.execute('SELECT code, name, exchange, initials FROM symbols')
+        existing = {row[0]: tuple(row[1:]) for row in cursor.fetchall()}
+
+        changed = [(code,) + values for code, values in incoming.items() if existing.get(code) != values]
+        removed = [(code,) for code in existing if code not in incoming]
+        cursor.executemany('''
+            INSERT INTO symbols (code, name, exchange, initials) VALUES (?, ?, ?, ?)
+            ON CONFLICT(code) DO UPDATE SET
+                name = excluded.name,
+                exchange = excluded.exchange,
+                initials = excluded.initials,
+                updated_at = CURRENT_TIMESTAMP
+        ''', changed)
+        cursor.executemany('DELETE FROM symbols WHERE code = ?', removed)
+
+    inserted = sum(1 for row in changed if row[0] not in existing)
+    stats = {'inserted': inserted, 'updated': len(changed) - inserted, 'deleted': len(removed)}
+    logger.info(f"证券代码表已刷新: {len(incoming)} 只, {stats}")
+    return stats
+
+def get_symbols() -> List[Dict]:
+    """获取全部证券代码"""
+    cursor = db.get_cursor()
+    cursor.execute('SELECT code, name, exchange, initials FROM symbols ORDER BY code')
+    return [dict(row) for row in cursor.fetchall()]
@@ -0,0 +1,113 @@
+import time
+import logging
+from typing import Dict, List, Optional, Tuple
+from .config import DB_CONFIG
+from .connection import db
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+# 任务状态: pending 待下载, done 已完成, failed 失败(按退避时间等待重试)
+PENDING = 'pending'
+DONE = 'done'
+FAILED = 'failed'
+
+def init_table():
+    """初始化同步任务日志表"""
+    with db.write_cursor() as cursor:
+        # 一次同步运行
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS sync_jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            start_date TEXT NOT NULL,
+            end_date TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'running',
+            total INTEGER NOT NULL DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            finished_at TIMESTAMP
+        )
+        ''')
+
+        # 同步运行中每只股票的下载任务
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS sync_tasks (
+            job_id INTEGER NOT NULL,
+            stock_code TEXT NOT NULL,
+            start_date TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            last_error TEXT,
+            rows INTEGER NOT NULL DEFAULT 0,
+            next_attempt_at REAL NOT NULL DEFAULT 0,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (job_id, stock_code)
+        ) WITHOUT ROWID
+        ''')
+
+def create_job(start_date: str, end_date: str, tasks: List[Tuple[str, str]]) -> int:
+    """创建同步运行及其下载任务 [(股票代码, 开始日期)]，返回运行 id"""
+    with db.write_cursor() as cursor:
+        cursor.execute('INSERT INTO sync_jobs (start_date, end_date, total) VALUES (?, ?, ?)',
+                       (start_date, end_date, len(tasks)))
+        job_id = cursor.lastrowid
+        cursor.executemany('INSERT INTO sync_tasks (job_id, stock_code, start_date) VALUES (?, ?, ?)',
+                           [(job_id, code, start) for code, start in tasks])
+    return job_id
+
+def get_resumable_job() -> Optional[Dict]:
+    """获取最近一次未完成的同步运行"""
+    cursor = db.get_cursor()
+    cursor.execute("SELECT * FROM sync_jobs WHERE status != 'completed' ORDER BY id DESC LIMIT 1")
+    row = cursor.fetchone()
+    return dict(row) if row else None
+
+def get_runnable_tasks(job_id: int, now: Optional[float] = None) -> List[Tuple[str, str]]:
+    """获取可以执行的任务 [(股票代码, 开始日期)]：未完成、未超过最大尝试次数且已过退避时间"""
+    cursor = db.get_cursor()
+    cursor.execute('''
+        SELECT stock_code, start_date FROM sync_tasks
+        WHERE job_id = ? AND status != ? AND attempts < ? AND next_attempt_at <= ?
+        ORDER BY attempts, stock_code
+    ''', (job_id, DONE, DB_CONFIG['sync_max_attempts'], time.time() if now is None else now))
+    return [(row[0], row[1]) for row in cursor.fetchall()]
+
+def mark_done(job_id: int, stock_code: str, rows: int):
+    """记录任务完成及写入的行数"""
+    with db.write_cursor() as cursor:
+        cursor.execute('''
+            UPDATE sync_tasks SET status = ?, attempts = attempts + 1, rows = ?, last_error = NULL,
+                updated_at = CURRENT_TIMESTAMP
+            WHERE job_id = ? AND stock_code = ?
+        ''', (DONE, rows, job_id, stock_code))
+
+def mark_failed(job_id: int, stock_code: str, error: str, now: Optional[float] = None):
+    """记录任务失败，下次重试时间按该股票的失败次数指数退避"""
+    now = time.time() if now is None else now
+    with db.write_cursor() as cursor:
+        cursor.execute('''
+            UPDATE sync_tasks SET status = ?, attempts = attempts + 1, last_error = ?,
+                next_attempt_at = ? + MIN(?, ? * (1 << attempts)), updated_at = CURRENT_TIMESTAMP
+            WHERE job_id = ? AND stock_code = ?
+        ''', (FAILED, str(error)[:500], now, DB_CONFIG['sync_retry_max_seconds'],
+              DB_CONFIG['sync_retry_base_seconds'], job_id, stock_code))
+
+def finish_job(job_id: int) -> Dict[str, int]:
+    """根据任务状态结束同步运行，全部完成时标记为 completed，返回各状态的任务数"""
+    summary = get_job_summary(job_id)
+    status = 'completed' if summary.get(DONE, 0) == sum(summary.values()) else 'incomplete'
+    with db.write_cursor() as cursor:
+        cursor.execute('UPDATE sync_jobs SET status = ?, finished_at = CURRENT_TIMESTAMP WHERE id = ?',
+                       (status, job_id))
+    return summary
+
+def get_job_summary(job_id: int) -> Dict[str, int]:
+    """各状态的任务数"""
+    cursor = db.get_cursor()
+    cursor.execute('SELECT status, COUNT(*) FROM sync_tasks WHERE job_id = ? GROUP BY status', (job_id,))
+    return {row[0]: row[1] for row in cursor.fetchall()}
+
+def get_tasks(job_id: int) -> List[Dict]:
+    """同步运行的全部任务"""
+    cursor = db.get_cursor()
+    cursor.execute('SELECT * FROM sync_tasks WHERE job_id = ? ORDER BY stock_code', (job_id,))
+    return [dict(row) for row in cursor.fetchall()]
@@ -0,0 +1,33 @@
+import logging
+from typing import Iterable
+import numpy as np
+from .connection import db
+from .dates import to_days
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+def init_table():
+    """初始化交易日历表"""
+    with db.write_cursor() as cursor:
+        # 交易日以 1970-01-01 起的天数存储
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS trading_days (
+            date INTEGER PRIMARY KEY
+        ) WITHOUT ROWID
+        ''')
+
+def save_days(dates: Iterable) -> int:
+    """整体替换交易日历，返回交易日数量"""
+    days = np.unique(to_days(list(dates)))
+    with db.write_cursor() as cursor:
+        cursor.execute('DELETE FROM trading_days')
+        cursor.executemany('INSERT INTO trading_days (date) VALUES (?)', [(int(d),) for d in days])
+    logger.info(f"交易日历已更新: {len(days)} 个交易日")
+    return len(days)
+
+def get_days() -> np.ndarray:
+    """获取全部交易日，升序的 int32 天数数组"""
+    cursor = db.get_cursor()
+    cursor.execute('SELECT date FROM trading_days ORDER BY date')
+    return np.array([row[0] for row in cursor.fetchall()], dtype=np.int32)
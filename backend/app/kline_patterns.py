@@ -3,6 +3,7 @@ import pandas as pd
 import inspect
 from typing import List, Dict, Any
 from .pattern_dector import PatternDector
+from .pattern_registry import chinese_name
 
 def detect_kline_patterns(stock_data: List[Dict[str, Any]], patterns: List[str] = None) -> Dict[str, Any]:
     """
@@ -53,7 +54,7 @@ def detect_kline_patterns(stock_data: List[Dict[str, Any]], patterns: List[str]
                 results["patterns"].append({
                     "date": dates[i],
                     "pattern": pattern_name,
-                    "chinese_name": pattern_dector.get_pattern_chinese_name(pattern_name),
+                    "chinese_name": chinese_name(pattern_name),
                     "value": int(result),
                     "direction": "bullish" if result > 0 else "bearish"
                 })
@@ -0,0 +1,317 @@
+import atexit
+import logging
+import math
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import date, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+import numpy as np
+import pandas as pd
+
+from app.custom_pattern import CustomPatternDetector
+from app.pattern_registry import PATTERNS, PATTERN_CODES
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+# 全市场扫描时读取的历史数据范围(自然日)，覆盖约 270 个交易日，足够所有形态的指标预热
+SCAN_LOOKBACK_DAYS = 400
+
+# 扫描进程池，首次并行扫描时创建并在之后的请求中复用(子进程只在创建时导入一次 pandas/talib)
+_scan_pool: Optional[ProcessPoolExecutor] = None
+_scan_pool_workers = 0
+_scan_pool_lock = threading.Lock()
+
+class BatchPatternDetector(CustomPatternDetector):
+    """在 交易日 × 股票 的 DataFrame 上检测自定义形态
+
+    每只股票是一列，自定义形态中的 shift/rolling/比较等运算一次作用于所有股票；
+    TA-Lib 指标对每列的连续数组直接调用，不为每只股票创建检测器对象。
+    上市前(收盘价为空)的日期成交量也置空，使每只股票的结果与只用其上市后数据单独检测一致。
+    每列上市后的数据须连续，停牌日由 detect_patterns_batch 在构造前压缩掉。
+    """
+
+    def __init__(self, open_p, high_p, low_p, close_p, volume, limit_threshold=0.098, chips=None):
+        # 输入为 股票 × 交易日 矩阵，转置后每只股票为一列
+        close_p = np.asarray(close_p, dtype=np.float64)
+        self.listed = np.maximum.accumulate(~np.isnan(close_p), axis=1).T
+        self.o, self.h, self.l, self.c = (pd.DataFrame(np.asarray(x, dtype=np.float64).T).ffill()
+                                          for x in (open_p, high_p, low_p, close_p))
+        self.v = pd.DataFrame(np.asarray(volume, dtype=np.float64).T).fillna(0).where(self.listed)
+        self.chips = {col: pd.DataFrame(np.asarray(values, dtype=np.float64).T) for col, values in (chips or {}).items()}
+
+        self.n = len(self.c)
+        self.limit_threshold = limit_threshold
+        self._indicator_times = {}
+        self._debug = False
+
+    def _frame(self, values):
+        return pd.DataFrame(values, index=self.c.index, columns=self.c.columns)
+
+    def _ta(self, func, *inputs, **kwargs):
+        """逐列调用 TA-Lib 函数，没有数据的股票结果为 NaN"""
+        arrays = [np.asfortranarray(x.to_numpy(dtype=np.float64)) for x in inputs]
+        outputs = None
+        for j in np.flatnonzero(self.listed.any(axis=0)):
+            result = func(*[a[:, j] for a in arrays], **kwargs)
+            result = result if isinstance(result, tuple) else (result,)
+            if outputs is None:
+                outputs = [np.full(arrays[0].shape, np.nan, order='F') for _ in result]
+            for out, r in zip(outputs, result):
+                out[:, j] = r
+        if outputs is None:
+            outputs = [np.full(arrays[0].shape, np.nan)]
+        frames = tuple(self._frame(out) for out in outputs)
+        return frames if len(frames) > 1 else frames[0]
+
+def _talib_rows(func, o, h, l, c, rows) -> np.ndarray:
+    """对每只股票(行)调用 TA-Lib 形态函数，信号除以 100 后取整 (±100、±80 → ±1，确认信号 ±200 → ±2)"""
+    out = np.zeros(c.shape, dtype=np.int8)
+    for i in rows:
+        out[i] = np.rint(func(o[i], h[i], l[i], c[i]) / 100)
+    return out
+
+def _compact(traded: np.ndarray) -> np.ndarray:
+    """每行把有K线的交易日按原顺序移到末尾，返回各行的日期排列
+
+    停牌日移到开头，相当于晚上市，检测时与只用该股票交易日数据单独检测一致。
+    """
+    return np.argsort(traded, axis=1, kind='stable')
+
+def detect_patterns_batch(open_p, high_p, low_p, close_p, volume, patterns: Optional[Iterable[str]] = None,
+                          timings: Optional[Dict[str, float]] = None,
+                          chips: Optional[Dict[str, np.ndarray]] = None) -> Tuple[np.ndarray, List[str]]:
+    """批量检测多只股票的K线形态
+
+    Args:
+        open_p, high_p, low_p, close_p, volume: 对齐到同一交易日历的 (股票数 × 交易日数) 矩阵，上市前和停牌日为 NaN
+        patterns: 形态代码列表，默认全部形态，未知代码忽略
+        timings: 传入字典时记录每个形态的耗时(秒)
+        chips: 可选的筹码分布 {字段: (股票数 × 交易日数) 矩阵}(见 db.chips.get_chip_panel)，
+            与价格一起压缩停牌日后作为检测器的 chips 属性
+
+    Returns:
+        (signals, codes): signals 为 int8 (股票数 × 形态数 × 交易日数) 信号张量，
+        codes 为与第二维对应的形态代码。信号为只用该股票交易日数据单独检测的结果四舍五入到整数，
+        TA-Lib 形态先除以 100，因此 ±80 的弱信号记为 ±1；停牌日没有信号
+    """
+    codes = [code for code in (patterns or PATTERN_CODES) if code in PATTERNS]
+    close_p = np.asarray(close_p, dtype=np.float64)
+    if close_p.ndim != 2:
+        raise ValueError("价格数据必须是 (股票数 × 交易日数) 矩阵")
+    stocks, days = close_p.shape
+    # 停牌日(收盘价为空)不参与计算: 每只股票压缩到实际交易日，结果再放回原日期
+    order = _compact(~np.isnan(close_p))
+    traded = np.take_along_axis(~np.isnan(close_p), order, axis=1)
+    def compact(x):
+        return np.ascontiguousarray(np.where(traded, np.take_along_axis(np.asarray(x, dtype=np.float64), order, axis=1),
+                                             np.nan))
+
+    arrays = [compact(x) for x in (open_p, high_p, low_p, close_p, volume)]
+    signals = np.zeros((stocks, len(codes), days), dtype=np.int8)
+    detector = BatchPatternDetector(*arrays, chips={col: compact(x) for col, x in (chips or {}).items()})
+    listed = detector.listed.T
+    rows = np.flatnonzero(listed.any(axis=1))
+
+    start = time.perf_counter()
+    for k, code in enumerate(codes):
+        began = time.perf_counter()
+        pattern = PATTERNS[code]
+        try:
+            if pattern.func is not None:
+                signals[:, k] = _talib_rows(pattern.func, *arrays[:4], rows)
+            else:
+                values = np.rint(np.nan_to_num(np.asarray(getattr(detector, code)(), dtype=np.float64))).T
+                signals[:, k] = np.where(listed, values, 0)
+        except Exception as e:
+            logger.error(f"批量检测形态 {code} 失败: {e}")
+        if timings is not None:
+            timings[code] = time.perf_counter() - began
+    np.put_along_axis(signals, np.broadcast_to(order[:, None, :], signals.shape), signals.copy(), axis=2)
+    logger.info(f"批量检测 {stocks} 只股票 × {days} 个交易日 × {len(codes)} 个形态，耗时 {time.perf_counter() - start:.2f}s")
+    return signals, codes
+
+def scan_stocks(stock_codes: Iterable[str], start_date: Optional[str] = None, end_date: Optional[str] = None,
+                patterns: Optional[Iterable[str]] = None, adjust: str = 'qfq', chips: bool = False) -> Dict[str, Any]:
+    """从数据库读取对齐的历史数据并批量检测形态
+
+    chips=True 时同时读取本地筹码分布，对齐到同一交易日历后作为检测输入，并在结果中返回
+
+    Returns:
+        {'stocks': 股票代码列表, 'dates': int32天数数组, 'patterns': 形态代码列表, 'signals': int8 信号张量,
+         'chips': {字段: (股票数 × 交易日数) 矩阵}(仅 chips=True)}
+    """
+    from app.db.stock_history import get_histories
+    from app.db.chips import get_chip_panel
+
+    panel = get_histories(stock_codes, start_date, end_date, align=True, adjust=adjust)
+    if not panel['codes']:
+        codes = [code for code in (patterns or PATTERN_CODES) if code in PATTERNS]
+        result = {'stocks': [], 'dates': np.array([], dtype=np.int32), 'patterns': codes,
+                  'signals': np.zeros((0, len(codes), 0), dtype=np.int8)}
+        if chips:
+            result['chips'] = get_chip_panel([], result['dates'], adjust=adjust)
+        return result
+    chip_panel = get_chip_panel(list(panel['codes']), panel['dates'], adjust=adjust) if chips else None
+    signals, codes = detect_patterns_batch(panel['open'], panel['high'], panel['low'], panel['close'],
+                                           panel['amount'], patterns, chips=chip_panel)
+    result = {'stocks': list(panel['codes']), 'dates': panel['dates'], 'patterns': codes, 'signals': signals}
+    if chips:
+        result['chips'] = chip_panel
+    return result
+
+def _get_scan_pool(workers: int) -> ProcessPoolExecutor:
+    """获取复用的扫描进程池，进程数变化时重建"""
+    global _scan_pool, _scan_pool_workers
+    with _scan_pool_lock:
+        if _scan_pool is None or _scan_pool_workers != workers:
+            if _scan_pool is not None:
+                _scan_pool.shutdown()
+            # 调用方可能是 Web 服务的线程，使用 spawn 避免 fork 带来的锁状态问题
+            _scan_pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+            _scan_pool_workers = workers
+        return _scan_pool
+
+def shutdown_scan_pool():
+    """关闭扫描进程池"""
+    global _scan_pool, _scan_pool_workers
+    with _scan_pool_lock:
+        if _scan_pool is not None:
+            _scan_pool.shutdown()
+            _scan_pool, _scan_pool_workers = None, 0
+
+atexit.register(shutdown_scan_pool)
+
+def _run_shard(db_config: Dict[str, Any], *args) -> Dict[str, Any]:
+    """在扫描子进程中使用主进程当前的数据库配置执行分片，配置变化时关闭旧连接"""
+    from app.db import partitions
+    from app.db.config import DB_CONFIG
+    from app.db.connection import db
+
+    if DB_CONFIG != db_config:
+        db.close()
+        partitions.close()
+        DB_CONFIG.update(db_config)
+    return _scan_shard(*args)
+
+def _hit_direction(code: str, signal: int) -> str:
+    direction = PATTERNS[code].direction
+    if direction == 'both':
+        return 'bullish' if signal > 0 else 'bearish'
+    return direction
+
+def _scan_shard(stock_codes: List[str], start_date: str, end_date: str, patterns: Optional[List[str]],
+                adjust: str, sessions: int) -> Dict[str, Any]:
+    """检测一组股票，返回最近 sessions 个交易日内的信号(可在子进程中运行)
+
+    只返回股票当天有K线的信号，停牌日不会因为前值填充的价格产生信号。
+    """
+    from app.db.stock_history import get_histories
+
+    began = time.perf_counter()
+    panel = get_histories(stock_codes, start_date, end_date, align=True, adjust=adjust)
+    loaded = time.perf_counter()
+    hits, dates = [], []
+    if panel['codes']:
+        signals, codes = detect_patterns_batch(panel['open'], panel['high'], panel['low'], panel['close'],
+                                               panel['amount'], patterns)
+        first = max(0, len(panel['dates']) - sessions)
+        dates = [int(day) for day in panel['dates'][first:]]
+        traded = ~np.isnan(panel['close'][:, first:])
+        for i, k, t in zip(*np.nonzero(signals[:, :, first:] * traded[:, None, :])):
+            hits.append((panel['codes'][i], int(panel['dates'][first + t]), codes[k], int(signals[i, k, first + t])))
+    return {'stocks': len(stock_codes), 'loaded': len(panel['codes']), 'hits': hits, 'dates': dates,
+            'load_seconds': round(loaded - began, 3),
+            'detect_seconds': round(time.perf_counter() - loaded, 3), 'pid': os.getpid()}
+
+def scan_universe(stock_codes: Iterable[str], sessions: int = 1, patterns: Optional[Iterable[str]] = None,
+                  direction: Optional[str] = None, end_date: Optional[str] = None, adjust: str = 'qfq',
+                  workers: Optional[int] = None, shard_size: Optional[int] = None,
+                  lookback_days: int = SCAN_LOOKBACK_DAYS, limit: Optional[int] = None) -> Dict[str, Any]:
+    """扫描一组股票最近几个交易日出现的形态
+
+    股票分片后由进程池并行检测(自定义形态的 pandas 计算受 GIL 限制，线程无法并行)，
+    进程池在多次扫描间复用；只有一个分片或一个进程时在当前进程中执行。
+
+    Args:
+        stock_codes: 股票代码列表
+        sessions: 返回最近多少个交易日的信号
+        patterns: 形态代码列表，默认全部形态
+        direction: 只返回 bullish 或 bearish 信号，默认全部
+        end_date: 扫描截止日期 (YYYY-MM-DD)，默认今天
+        adjust: 复权方式
+        workers: 进程数，默认 settings.SCAN_WORKERS，为 0 时按CPU核数
+        shard_size: 每个分片的股票数，默认平均分给各进程
+        lookback_days: 读取的历史数据范围(自然日)
+        limit: 最多返回的信号数，默认全部
+
+    Returns:
+        {'signals': 按日期从新到旧、信号强度、股票命中数排序的信号列表, 'count': 返回的信号数,
+         'total': 截断前的信号数, 'dates': 扫描的交易日, 'stocks': 股票数, 'workers': 进程数,
+         'shards': 每个分片的股票数和耗时, 'elapsed': 总耗时(秒)}
+    """
+    from app.config import settings
+    from app.db.config import DB_CONFIG
+    from app.db.dates import to_iso
+
+    if sessions < 1:
+        raise ValueError(f"交易日数必须大于0: {sessions}")
+    if direction not in (None, 'bullish', 'bearish'):
+        raise ValueError(f"不支持的方向: {direction}")
+    started = time.perf_counter()
+    codes = list(dict.fromkeys(stock_codes))
+    if patterns:
+        unknown = [code for code in patterns if code not in PATTERNS]
+        if unknown:
+            raise ValueError(f"未知的形态: {unknown}")
+        patterns = list(patterns)
+    else:
+        patterns = None
+    end_date = end_date or date.today().strftime('%Y-%m-%d')
+    start_date = (date.fromisoformat(end_date) - timedelta(days=lookback_days)).strftime('%Y-%m-%d')
+    workers = workers if workers is not None else settings.SCAN_WORKERS
+    workers = max(1, min(workers or os.cpu_count() or 1, len(codes) or 1))
+    shard_size = shard_size or math.ceil(len(codes) / workers) or 1
+    shards = [codes[i:i + shard_size] for i in range(0, len(codes), shard_size)]
+    args = [(shard, start_date, end_date, patterns, adjust, sessions) for shard in shards]
+
+    if workers <= 1 or len(shards) <= 1:
+        workers = 1
+        results = [_scan_shard(*a) for a in args]
+    else:
+        db_config = dict(DB_CONFIG)
+        try:
+            results = list(_get_scan_pool(workers).map(_run_shard, *zip(*[(db_config, *a) for a in args])))
+        except BrokenProcessPool:
+            # 子进程异常退出后进程池不可再用，下次扫描时重建
+            shutdown_scan_pool()
+            raise
+
+    hits = [hit for result in results for hit in result['hits']]
+    # 各分片的交易日历可能不同(整个分片停牌)，统一取全体最近的 sessions 个交易日
+    dates = set(sorted({day for result in results for day in result['dates']}, reverse=True)[:sessions])
+    hits = [hit for hit in hits if hit[1] in dates]
+    if direction:
+        hits = [hit for hit in hits if _hit_direction(hit[2], hit[3]) == direction]
+    per_stock: Dict[str, int] = {}
+    for hit in hits:
+        per_stock[hit[0]] = per_stock.get(hit[0], 0) + 1
+    hits.sort(key=lambda hit: (-hit[1], -abs(hit[3]), -per_stock[hit[0]], hit[0], hit[2]))
+    total = len(hits)
+    if limit:
+        hits = hits[:limit]
+
+    signals = [{'stock_code': stock, 'date': to_iso(day), 'pattern': code, 'name': PATTERNS[code].name,
+                'direction': _hit_direction(code, signal), 'signal': signal}
+               for stock, day, code, signal in hits]
+    shard_stats = [{key: result[key] for key in ('stocks', 'loaded', 'load_seconds', 'detect_seconds', 'pid')}
+                   for result in results]
+    elapsed = time.perf_counter() - started
+    logger.info(f"扫描 {len(codes)} 只股票，{len(shards)} 个分片，{workers} 个进程，"
+                f"{total} 个信号，耗时 {elapsed:.2f}s")
+    return {'signals': signals, 'count': len(signals), 'total': total, 'dates': [to_iso(day) for day in sorted(dates)],
+            'stocks': len(codes), 'workers': workers, 'shards': shard_stats, 'elapsed': round(elapsed, 3)}
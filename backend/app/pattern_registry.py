@@ -0,0 +1,190 @@
+import talib
+import talib.abstract
+from types import MappingProxyType
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+
+# K线数据字段
+OHLC = ('open', 'high', 'low', 'close')
+OHLCV = OHLC + ('volume',)
+
+class PatternInfo(NamedTuple):
+    """K线形态的元数据，导入时创建一次，不可修改"""
+    code: str                   # 形态代码
+    name: str                   # 中文名称
+    source: str                 # 'talib' 或 'custom'
+    direction: str              # 信号方向: 'bullish'、'bearish' 或 'both'(正数看涨，负数看跌)
+    warmup: int                 # 产生第一个有效信号前需要的K线数
+    inputs: Tuple[str, ...]     # 需要的数据字段
+    func: Optional[Callable]    # TA-Lib 检测函数，自定义形态为 None(由 CustomPatternDetector 的同名方法检测)
+
+    def to_dict(self) -> Dict:
+        return {'name': self.code, 'chinese': self.name, 'source': self.source, 'direction': self.direction,
+                'warmup': self.warmup, 'inputs': list(self.inputs)}
+
+# TA-Lib 形态: (形态代码, 中文名称, 信号方向)，所需K线数取自 TA-Lib 的 lookback
+_TALIB_PATTERNS = [
+    ('CDL2CROWS', '两只乌鸦', 'bearish'),
+    ('CDL3BLACKCROWS', '三只乌鸦', 'bearish'),
+    ('CDL3INSIDE', '三内升/降', 'both'),
+    ('CDL3LINESTRIKE', '三线打击', 'both'),
+    ('CDL3OUTSIDE', '三外升/降', 'both'),
+    ('CDL3STARSINSOUTH', '南方三星', 'bullish'),
+    ('CDL3WHITESOLDIERS', '三个白兵', 'bullish'),
+    ('CDLABANDONEDBABY', '弃婴', 'both'),
+    ('CDLADVANCEBLOCK', '前进受阻', 'bearish'),
+    ('CDLBELTHOLD', '捉腰带线', 'both'),
+    ('CDLBREAKAWAY', '脱离', 'both'),
+    ('CDLCLOSINGMARUBOZU', '收盘缺影线', 'both'),
+    ('CDLCONCEALBABYSWALL', '藏婴吞没', 'bullish'),
+    ('CDLCOUNTERATTACK', '反击线', 'both'),
+    ('CDLDARKCLOUDCOVER', '乌云盖顶', 'bearish'),
+    ('CDLDOJI', '十字星', 'both'),
+    ('CDLDOJISTAR', '十字星', 'both'),
+    ('CDLDRAGONFLYDOJI', '蜻蜓十字', 'both'),
+    ('CDLENGULFING', '吞噬模式', 'both'),
+    ('CDLEVENINGDOJISTAR', '黄昏十字星', 'bearish'),
+    ('CDLEVENINGSTAR', '黄昏之星', 'bearish'),
+    ('CDLGAPSIDESIDEWHITE', '向上/向下跳空并列阳线', 'both'),
+    ('CDLGRAVESTONEDOJI', '墓碑十字星', 'both'),
+    ('CDLHAMMER', '锤头', 'bullish'),
+    ('CDLHANGINGMAN', '吊颈', 'bearish'),
+    ('CDLHARAMI', '孕线', 'both'),
+    ('CDLHARAMICROSS', '十字孕线', 'both'),
+    ('CDLHIGHWAVE', '长影线', 'both'),
+    ('CDLHIKKAKE', '陷阱', 'both'),
+    ('CDLHIKKAKEMOD', '修正陷阱', 'both'),
+    ('CDLHOMINGPIGEON', '归巢鸽', 'bullish'),
+    ('CDLIDENTICAL3CROWS', '三乌鸦', 'bearish'),
+    ('CDLINNECK', '颈内线', 'bearish'),
+    ('CDLINVERTEDHAMMER', '倒锤头', 'bullish'),
+    ('CDLKICKING', '反冲', 'both'),
+    ('CDLKICKINGBYLENGTH', '反冲 - 由较长的缺影线决定多/空', 'both'),
+    ('CDLLADDERBOTTOM', '梯底', 'bullish'),
+    ('CDLLONGLEGGEDDOJI', '长脚十字', 'both'),
+    ('CDLLONGLINE', '长蜡烛', 'both'),
+    ('CDLMARUBOZU', '缺影线', 'both'),
+    ('CDLMATCHINGLOW', '相同低价', 'bullish'),
+    ('CDLMATHOLD', '马特 holde', 'both'),
+    ('CDLMORNINGDOJISTAR', '早晨十字星', 'bullish'),
+    ('CDLMORNINGSTAR', '早晨之星', 'bullish'),
+    ('CDLONNECK', '颈上线', 'bearish'),
+    ('CDLPIERCING', '贯穿模式', 'bullish'),
+    ('CDLRICKSHAWMAN', '人力车', 'both'),
+    ('CDLRISEFALL3METHODS', '上升/下降三法', 'both'),
+    ('CDLSEPARATINGLINES', '分离线', 'both'),
+    ('CDLSHOOTINGSTAR', '射击之星', 'bearish'),
+    ('CDLSHORTLINE', '短蜡烛', 'both'),
+    ('CDLSPINNINGTOP', '纺锤线', 'both'),
+    ('CDLSTALLEDPATTERN', '停顿形态', 'bearish'),
+    ('CDLSTICKSANDWICH', 'stick sandwich', 'bullish'),
+    ('CDLTAKURI', '探水杆（带长下影线的蜻蜓十字）', 'bullish'),
+    ('CDLTASUKIGAP', 'tasuki gap', 'both'),
+    ('CDLTHRUSTING', '冲刺形态', 'bearish'),
+    ('CDLTRISTAR', '三星', 'both'),
+    ('CDLUNIQUE3RIVER', '独特三川', 'bullish'),
+    ('CDLUPSIDEGAP2CROWS', '向上跳空两只乌鸦', 'bearish'),
+    ('CDLXSIDEGAP3METHODS', '向上/向下跳空三法', 'both'),
+]
+
+# 自定义形态: (形态代码, 中文名称, 信号方向, 所需K线数, 数据字段)
+# 所需K线数按用到的最长指标窗口估算，如 MA60 和 60 日高低位判断为 59
+_CUSTOM_PATTERNS = [
+    ('DOUBLE_BOTTOM', '双重底', 'bullish', 64, OHLC),
+    ('DRAGONFLY_TOUCH_WATER', '蜻蜓点水', 'bullish', 24, OHLCV),
+    ('GAP_FILLING', '缺口回补', 'both', 2, OHLC),
+    ('THREE_GOLDEN_CROSSES', '三金叉', 'bullish', 35, OHLCV),
+    ('UPSIDE_GAP_3CROWS', '升势三鸦', 'bearish', 12, OHLC), # 注:TALib只有跳空两只乌鸦
+    ('POURING_RAIN', '倾盆大雨', 'bearish', 1, OHLC),
+    ('RISING_SUN', '旭日东升', 'bullish', 11, OHLC),
+    ('JIEDI_FANJI', '绝地反击', 'bullish', 59, OHLCV),
+    ('DAO_BA_YANG_LIU', '倒拔杨柳', 'bearish', 5, OHLCV),
+    ('CHU_SHUI_FU_RONG', '出水芙蓉', 'bullish', 19, OHLCV),
+    ('BACKTEST_MA5', '回踩五日线', 'bullish', 4, OHLC),
+    ('FIVE_LINES_BLOOM', '五线开花', 'bullish', 59, OHLC),
+    ('BOTTOM_SINGLE_PEAK', '底部单峰', 'bullish', 59, OHLCV),
+    ('DUO_FANG_PAO', '多方炮', 'bullish', 2, OHLC),
+    ('LONG_TENG_LOW', '龙腾四海低位', 'bullish', 59, OHLC),
+    ('DEATH_VALLEY', '死亡谷', 'bearish', 19, OHLC),
+    ('SILVER_VALLEY', '银山谷', 'bullish', 19, OHLC),
+    ('BOTTOM_REVERSAL', '底部反转', 'bullish', 12, OHLC),
+    ('SHORT_TERM_BULL', '短线多头', 'bullish', 19, OHLC),
+    ('JU_BAO_PEN', '聚宝盆', 'bullish', 59, OHLCV),
+    ('QIU_YING_JIN_BO', '秋影金波', 'bearish', 59, OHLC),
+    ('SOLDIER_ASSAULT', '士兵突击', 'bullish', 3, OHLC),
+    ('BULL_PIONEER', '多头尖兵', 'bullish', 4, OHLC),
+    ('LOW_BIG_YANG', '低位大阳', 'bullish', 59, OHLC),
+    ('SHRINK_VOL_HIGH', '缩量拉高', 'bearish', 1, OHLCV),
+    ('QING_LONG_WATER', '青龙取水', 'bullish', 59, OHLC),
+    ('TWO_BLACK_ONE_RED', '两黑夹一红', 'bearish', 2, OHLC),
+    ('POOL_DRAGON', '池底巨龙', 'bullish', 29, OHLC),
+    ('BOTTOM_ACCUMULATION', '底部吸筹', 'bullish', 59, OHLCV),
+    ('HUGE_VOL_LONG_YIN', '巨量长阴', 'bearish', 9, OHLCV),
+    ('FAKE_YANG_DOJI', '假阳十字星', 'bearish', 1, OHLC),
+    ('DOLPHIN_MOUTH', '海豚嘴', 'bullish', 20, OHLC),
+    ('MA_ADHESION', '均线粘合', 'bullish', 29, OHLC),
+    ('BOX_BREAKOUT', '箱体突破', 'bullish', 20, OHLC),
+    ('LOOKING_BACK_MOON', '回头望月', 'bullish', 19, OHLCV),
+    ('SOARING_SKY', '一飞冲天', 'bullish', 1, OHLC),
+    ('MA_RESONANCE', '均线共振', 'bullish', 60, OHLC),
+    ('WARRIOR_BREAK_WRIST', '壮士断腕', 'bullish', 20, OHLC),
+    ('COMEBACK', '卷土重来', 'bullish', 3, OHLC),
+    ('XIAO_XIAO_MU_YU', '潇潇暮雨', 'bullish', 59, OHLC),
+    ('CLOUD_MAP', '目送云图', 'bearish', 59, OHLC),
+    ('AMBUSH', '十面埋伏', 'bearish', 59, OHLC),
+    ('TWISTS_TURNS', '峰回路转', 'both', 11, OHLC),
+    ('CLOUD_WALK', '云行雨步', 'bullish', 19, OHLC),
+    ('CURTAIN_WATERFALL', '垂帘瀑布', 'bearish', 4, OHLC),
+    ('CANDLE_SHADOW_RED', '烛影摇红', 'bearish', 59, OHLC),
+    ('FLAT_TOP_PEAK', '平顶尖峰', 'bearish', 59, OHLC),
+    ('ROLLING_TIDES', '万里卷潮', 'bullish', 10, OHLCV),
+    ('LIGHTNING_ROD', '避雷塔针', 'bearish', 0, OHLC),
+    ('FLOWER_FRUIT', '开花结果', 'bullish', 2, OHLC),
+    ('RAIN_CLEAR_EVENING', '雨晴烟晚', 'bullish', 59, OHLCV),
+    ('WEST_WIND_SUNSET', '西风残照', 'bearish', 59, OHLCV),
+    ('BOTTOM_RAISING', '底部抬高', 'bullish', 10, OHLC),
+    ('FIVE_YANG_LINES', '低档五阳线', 'bullish', 59, OHLC),
+    ('ROUNDING_BOTTOM', '圆弧底', 'bullish', 20, OHLC),
+    ('BACK_LIGHT', '回光返照', 'bearish', 19, OHLC),
+    ('LIMIT_UP_HORSE', '涨停回马枪', 'bullish', 19, OHLCV),
+    ('RISING_CHANNEL', '上升通道', 'bullish', 14, OHLC),
+    ('PLATFORM_BREAKOUT', '平台突破', 'bullish', 15, OHLC),
+    ('MODERATE_VOL_INC', '温和放量', 'bullish', 5, OHLCV),
+    ('SHRINK_VOL_RISE', '缩量上涨', 'bullish', 1, OHLCV),
+    ('HIGH_VOL_RISE', '放量上涨', 'bullish', 1, OHLCV),
+    ('FALLING_CHANNEL', '下降通道', 'bearish', 14, OHLC),
+    ('PLATFORM_CONSOLIDATION', '平台整理', 'bullish', 10, OHLC),
+    ('BEAR_ARRANGEMENT', '空头排列', 'bearish', 19, OHLC),
+    ('HIGH_SIDEWAYS', '高位横盘', 'bearish', 59, OHLC),
+    ('IMMORTAL_POINT_WAY', '仙人指路', 'bullish', 0, OHLC),
+    ('OLD_DUCK_HEAD', '老鸭头', 'bullish', 69, OHLCV),
+    ('OLD_DUCK_HEAD_LIKE', '宽松老鸭头', 'bullish', 69, OHLCV),
+    ('TOP_VOL_SPIKE', '顶部放量', 'bearish', 59, OHLCV),
+    ('ROCKET_LAUNCH', '火箭升空', 'bullish', 1, OHLCV),
+    ('CRANE_POINTER', '仙鹤指针', 'bullish', 0, OHLC),
+    ('GOLDEN_SPIDER', '金蜘蛛', 'bullish', 20, OHLC),
+]
+
+def _build(items: List[PatternInfo]) -> MappingProxyType:
+    return MappingProxyType({info.code: info for info in items})
+
+TALIB_PATTERNS = _build([
+    PatternInfo(code, name, 'talib', direction, talib.abstract.Function(code).lookback, OHLC, getattr(talib, code))
+    for code, name, direction in _TALIB_PATTERNS
+])
+
+CUSTOM_PATTERNS = _build([
+    PatternInfo(code, name, 'custom', direction, warmup, inputs, None)
+    for code, name, direction, warmup, inputs in _CUSTOM_PATTERNS
+])
+
+# 全部形态，TA-Lib 形态在前
+PATTERNS = MappingProxyType({**TALIB_PATTERNS, **CUSTOM_PATTERNS})
+PATTERN_CODES = tuple(PATTERNS)
+
+def get_pattern(code: str) -> Optional[PatternInfo]:
+    return PATTERNS.get(code)
+
+def chinese_name(code: str) -> str:
+    """获取形态代码对应的中文名称，未知代码原样返回"""
+    info = PATTERNS.get(code)
+    return info.name if info else code
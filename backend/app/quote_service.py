@@ -0,0 +1,258 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import asyncio
+import logging
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional
+import requests
+
+from app.config import settings
+from app.symbol_index import exchange_of
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+# 行情缓存有效期(秒)
+QUOTE_TTL = 5.0
+
+# 最近多少秒内被请求过的证券由后台线程持续刷新
+HOT_SECONDS = 60.0
+
+EXCHANGE_NAMES = {'SH': '上海证券交易所', 'SZ': '深圳证券交易所', 'BJ': '北京证券交易所'}
+
+def normalize_symbol(symbol: str) -> str:
+    """统一证券代码格式为 SH600519，支持 600519、600519.SH、sh600519"""
+    symbol = symbol.strip().upper()
+    if '.' in symbol:
+        code, market = symbol.split('.', 1)
+        return f"{market}{code}"
+    if symbol[:2] in EXCHANGE_NAMES:
+        return symbol
+    return f"{exchange_of(symbol)}{symbol}"
+
+def _number(value) -> Optional[float]:
+    return None if value is None else float(value)
+
+def parse_quote(quote: Dict[str, Any]) -> Dict[str, Any]:
+    """把雪球行情条目一次解析为行情字典"""
+    symbol = quote['symbol']
+    return {
+        'symbol': symbol,
+        'name': quote.get('name'),
+        'exchange': EXCHANGE_NAMES.get(symbol[:2], symbol[:2]),
+        'currency': quote.get('currency') or 'CNY',
+        'price': _number(quote.get('current')) or 0.0,
+        'change': _number(quote.get('chg')) or 0.0,
+        'changePercent': _number(quote.get('percent')) or 0.0,
+        'marketCap': _number(quote.get('market_capital')) or 0.0,
+        'volume': int(quote.get('volume') or 0),
+        'pe': _number(quote.get('pe_ttm')),
+        'dividend': _number(quote.get('dividend_yield')),
+        'timestamp': quote.get('timestamp'),
+    }
+
+class TokenExpired(Exception):
+    """雪球 xq_a_token 失效"""
+
+class XueqiuQuoteFetcher:
+    """雪球批量行情接口，一次请求获取多只证券的行情"""
+
+    URL = 'https://stock.xueqiu.com/v5/stock/batch/quote.json'
+    TOKEN_URL = 'https://xueqiu.com/hq'
+    HEADERS = {'user-agent': 'Mozilla'}
+
+    def __init__(self, timeout: float = 10.0):
+        self.timeout = timeout
+        self._token_task: Optional[asyncio.Future] = None
+
+    def _request(self, symbols: List[str], token: str) -> Dict[str, Dict[str, Any]]:
+        r = requests.get(self.URL, params={'symbol': ','.join(symbols), 'extend': 'detail'},
+                         cookies={'xq_a_token': token}, headers=self.HEADERS, timeout=self.timeout)
+        if r.status_code in (400, 401, 403):
+            raise TokenExpired(f"雪球接口返回 {r.status_code}")
+        r.raise_for_status()
+        items = (r.json().get('data') or {}).get('items') or []
+        quotes = [parse_quote(item['quote']) for item in items if item.get('quote')]
+        return {quote['symbol']: quote for quote in quotes}
+
+    def _fetch_token(self) -> str:
+        r = requests.get(self.TOKEN_URL, headers=self.HEADERS, timeout=self.timeout)
+        return r.cookies['xq_a_token']
+
+    async def _refresh_token(self):
+        """在线程中刷新 token，并发的刷新请求共享同一次刷新"""
+        if self._token_task is None or self._token_task.done():
+            self._token_task = asyncio.ensure_future(asyncio.to_thread(self._fetch_token))
+        settings.XUEQIU_TOKEN = await self._token_task
+        logger.info("已更新 xq_a_token")
+
+    async def fetch(self, symbols: List[str]) -> Dict[str, Dict[str, Any]]:
+        if not settings.XUEQIU_TOKEN:
+            await self._refresh_token()
+        try:
+            return await asyncio.to_thread(self._request, symbols, settings.XUEQIU_TOKEN)
+        except TokenExpired:
+            await self._refresh_token()
+            return await asyncio.to_thread(self._request, symbols, settings.XUEQIU_TOKEN)
+
+class QuoteService:
+    """实时行情服务
+
+    - 按证券代码缓存行情，有效期 ttl 秒
+    - 同一证券的并发请求共享一次进行中的请求
+    - 缺失的证券合并为批量请求，每批最多 batch_size 只
+    - 后台线程运行事件循环，定期刷新最近被请求过的证券，使页面读取时通常直接命中缓存
+
+    缓存和进行中的请求只在后台事件循环中访问，不需要加锁；同步调用方使用 get_quotes，
+    其他事件循环中的协程使用 get_quotes_async。
+    """
+
+    def __init__(self, fetcher=None, ttl: float = QUOTE_TTL, batch_size: int = 50,
+                 refresh_interval: Optional[float] = None, hot_seconds: float = HOT_SECONDS):
+        self.fetcher = fetcher or XueqiuQuoteFetcher()
+        self.ttl = ttl
+        self.batch_size = batch_size
+        self.refresh_interval = ttl if refresh_interval is None else refresh_interval
+        self.hot_seconds = hot_seconds
+        self.fetches = 0
+        self._cache: Dict[str, tuple] = {}
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._requested: Dict[str, float] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+
+    def start(self):
+        """启动后台事件循环线程(重复调用无副作用)"""
+        with self._start_lock:
+            if self._thread is not None:
+                return
+            self._loop = asyncio.new_event_loop()
+            self._thread = threading.Thread(target=self._run, name='quote-service', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        asyncio.set_event_loop(self._loop)
+        if self.refresh_interval > 0:
+            self._loop.create_task(self._refresh_loop())
+        self._loop.run_forever()
+
+    def stop(self):
+        """停止后台线程"""
+        with self._start_lock:
+            if self._thread is None:
+                return
+            asyncio.run_coroutine_threadsafe(self._shutdown(), self._loop)
+            self._thread.join()
+            self._loop.close()
+            self._thread = None
+            self._loop = None
+
+    async def _shutdown(self):
+        """取消后台刷新和进行中的请求后停止事件循环"""
+        tasks = [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._inflight.clear()
+        asyncio.get_running_loop().stop()
+
+    def get_quotes(self, symbols: Iterable[str], timeout: float = 15.0) -> Dict[str, Dict[str, Any]]:
+        """同步获取行情: {规范化代码: 行情}，获取失败的证券不包含在结果中"""
+        self.start()
+        future = asyncio.run_coroutine_threadsafe(self._get_quotes(list(symbols)), self._loop)
+        return future.result(timeout)
+
+    async def get_quotes_async(self, symbols: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+        """在其他事件循环中获取行情"""
+        self.start()
+        future = asyncio.run_coroutine_threadsafe(self._get_quotes(list(symbols)), self._loop)
+        return await asyncio.wrap_future(future)
+
+    async def _get_quotes(self, symbols: List[str]) -> Dict[str, Dict[str, Any]]:
+        now = time.monotonic()
+        wanted = list(dict.fromkeys(normalize_symbol(s) for s in symbols))
+        result: Dict[str, Dict[str, Any]] = {}
+        waiting: Dict[str, asyncio.Future] = {}
+        missing = []
+        for symbol in wanted:
+            self._requested[symbol] = now
+            cached = self._cache.get(symbol)
+            if cached is not None and now - cached[0] < self.ttl:
+                result[symbol] = cached[1]
+            elif symbol in self._inflight:
+                waiting[symbol] = self._inflight[symbol]
+            else:
+                missing.append(symbol)
+
+        if missing:
+            self._start_fetch(missing)
+            waiting.update({symbol: self._inflight[symbol] for symbol in missing})
+        for symbol, future in waiting.items():
+            quote = await asyncio.shield(future)
+            if quote is not None:
+                result[symbol] = quote
+        return result
+
+    def _start_fetch(self, symbols: List[str]):
+        """为每只证券登记进行中的请求，并按批次发起批量请求"""
+        loop = asyncio.get_running_loop()
+        for symbol in symbols:
+            self._inflight[symbol] = loop.create_future()
+        for i in range(0, len(symbols), self.batch_size):
+            loop.create_task(self._fetch_batch(symbols[i:i + self.batch_size]))
+
+    async def _fetch_batch(self, symbols: List[str]):
+        self.fetches += 1
+        try:
+            quotes = await self.fetcher.fetch(symbols)
+        except Exception as e:
+            logger.error(f"获取行情失败 {symbols[:3]}...: {e}")
+            quotes = {}
+        now = time.monotonic()
+        for symbol in symbols:
+            quote = quotes.get(symbol)
+            if quote is not None:
+                self._cache[symbol] = (now, quote)
+            future = self._inflight.pop(symbol, None)
+            if future is not None and not future.done():
+                # 失败时返回仍在缓存中的旧行情
+                cached = self._cache.get(symbol)
+                future.set_result(quote if quote is not None else (cached[1] if cached else None))
+
+    async def _refresh_loop(self):
+        """定期批量刷新最近被请求过且即将过期的证券，长时间未被请求的证券移出缓存"""
+        while True:
+            await asyncio.sleep(self.refresh_interval)
+            try:
+                now = time.monotonic()
+                for symbol in [s for s, t in self._requested.items() if now - t > self.hot_seconds]:
+                    del self._requested[symbol]
+                    self._cache.pop(symbol, None)
+                stale = [s for s in self._requested
+                         if s not in self._inflight and now - self._cache.get(s, (0.0,))[0] >= self.ttl * 0.8]
+                if stale:
+                    self._start_fetch(stale)
+            except Exception as e:
+                logger.error(f"刷新行情缓存失败: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        return {'cached': len(self._cache), 'hot': len(self._requested), 'inflight': len(self._inflight),
+                'fetches': self.fetches}
+
+_service: Optional[QuoteService] = None
+_lock = threading.Lock()
+
+def get_service() -> QuoteService:
+    """获取进程内共享的行情服务"""
+    global _service
+    if _service is None:
+        with _lock:
+            if _service is None:
+                _service = QuoteService()
+    return _service
+
+def get_quotes(symbols: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+    return get_service().get_quotes(symbols)
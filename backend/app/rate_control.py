@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import asyncio
+import inspect
+import random
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, Dict, List, Optional, Tuple
+from app.config import settings
+
+class TokenBucket:
+    """异步令牌桶限流器
+
+    令牌以 rate 个/秒的速度补充，最多积累 capacity 个；每次请求消耗一个令牌，
+    令牌不足时按先来先得的顺序等待。rate <= 0 表示不限流。
+    """
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity or max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self, tokens: float = 1.0):
+        """获取令牌，不足时等待"""
+        if self.rate <= 0:
+            return
+        # 持有锁等待，保证先到的请求先拿到令牌
+        async with self._lock:
+            self._refill()
+            while self._tokens < tokens:
+                await asyncio.sleep((tokens - self._tokens) / self.rate)
+                self._refill()
+            self._tokens -= tokens
+
+    def set_rate(self, rate: float):
+        """调整补充速度"""
+        self._refill()
+        self.rate = rate
+
+def backoff_delay(attempt: int, base: float = 1.0, cap: float = 30.0) -> float:
+    """带完全抖动的指数退避时间：在 [0, min(cap, base * 2^attempt)] 内随机取值，避免并发请求同时重试"""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+class SourceController:
+    """单个数据源的自适应并发控制器
+
+    - AIMD: 请求成功且延迟低于目标时并发上限加性增长(每个上限周期 +1)，
+      出错或延迟超过目标时乘性减小，减小后冷却一段时间再允许下一次减小
+    - 熔断: 最近窗口内错误率超过阈值时打开熔断，暂停该数据源；冷却结束后进入半开状态，
+      只放行一个探测请求，成功则恢复，失败则以加倍的冷却时间再次打开
+    - 延迟分位数: 保留最近 latency_window 次成功请求的延迟，用于决定对冲请求的发起时机
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, name: str, max_limit: int = 20, min_limit: int = 1, initial_limit: Optional[int] = None,
+                 target_latency: float = 3.0, decrease_factor: float = 0.5, decrease_cooldown: float = 1.0,
+                 window: int = 20, error_threshold: float = 0.5, min_calls: int = 5,
+                 open_seconds: float = 10.0, max_open_seconds: float = 300.0, latency_window: int = 200):
+        self.name = name
+        self.max_limit = max_limit
+        self.min_limit = min_limit
+        self.limit = float(initial_limit or min(4, max_limit))
+        self.target_latency = target_latency
+        self.decrease_factor = decrease_factor
+        self.decrease_cooldown = decrease_cooldown
+        self.error_threshold = error_threshold
+        self.min_calls = min_calls
+        self.open_seconds = open_seconds
+        self.max_open_seconds = max_open_seconds
+
+        self.state = self.CLOSED
+        self.in_flight = 0
+        self.requests = 0
+        self.errors = 0
+        self.latency_ewma: Optional[float] = None
+        self._outcomes: deque = deque(maxlen=window)
+        self._latencies: deque = deque(maxlen=latency_window)
+        self._last_decrease = 0.0
+        self._opened_at = 0.0
+        self._open_for = open_seconds
+        self._probing = False
+        self._cond: Optional[asyncio.Condition] = None
+        self._loop = None
+
+    def _condition(self) -> asyncio.Condition:
+        # 条件变量绑定事件循环，在新的事件循环中使用时重新创建
+        loop = asyncio.get_running_loop()
+        if self._cond is None or self._loop is not loop:
+            self._cond = asyncio.Condition()
+            self._loop = loop
+        return self._cond
+
+    def _can_start(self) -> Tuple[bool, Optional[float]]:
+        """判断能否发起请求，不能时返回需要等待的秒数(None 表示等待其他请求结束)"""
+        if self.state == self.OPEN:
+            remaining = self._opened_at + self._open_for - time.monotonic()
+            if remaining > 0:
+                return False, remaining
+            self.state = self.HALF_OPEN
+        if self.state == self.HALF_OPEN:
+            return not self._probing, None
+        return self.in_flight < int(self.limit), None
+
+    async def acquire(self):
+        """等待并占用一个并发名额"""
+        cond = self._condition()
+        async with cond:
+            while True:
+                ok, wait = self._can_start()
+                if ok:
+                    break
+                try:
+                    await asyncio.wait_for(cond.wait(), timeout=wait)
+                except asyncio.TimeoutError:
+                    pass
+            if self.state == self.HALF_OPEN:
+                self._probing = True
+            self.in_flight += 1
+
+    async def release(self, success: Optional[bool], latency: float):
+        """释放并发名额并记录请求结果，success 为 None 表示请求被取消，不计入统计"""
+        cond = self._condition()
+        async with cond:
+            self.in_flight -= 1
+            if success is None:
+                self._probing = False
+            else:
+                self._record(success, latency)
+            cond.notify_all()
+
+    @asynccontextmanager
+    async def slot(self):
+        """在并发名额内执行一次请求，退出时按是否抛出异常记录结果(被取消的请求不记录)"""
+        await self.acquire()
+        start = time.monotonic()
+        success = False
+        try:
+            yield
+            success = True
+        except asyncio.CancelledError:
+            success = None
+            raise
+        finally:
+            await self.release(success, time.monotonic() - start)
+
+    def _record(self, success: bool, latency: float):
+        now = time.monotonic()
+        self.requests += 1
+        self.errors += 0 if success else 1
+        self.latency_ewma = latency if self.latency_ewma is None else 0.8 * self.latency_ewma + 0.2 * latency
+        self._outcomes.append(success)
+        if success:
+            self._latencies.append(latency)
+
+        if self.state == self.HALF_OPEN:
+            self._probing = False
+            if success:
+                self.state = self.CLOSED
+                self._open_for = self.open_seconds
+                self._outcomes.clear()
+            else:
+                self._open(now, self._open_for * 2)
+            return
+
+        if success and latency <= self.target_latency:
+            self.limit = min(self.max_limit, self.limit + 1.0 / self.limit)
+        elif now - self._last_decrease >= self.decrease_cooldown:
+            self.limit = max(self.min_limit, self.limit * self.decrease_factor)
+            self._last_decrease = now
+
+        errors = self._outcomes.count(False)
+        if len(self._outcomes) >= self.min_calls and errors / len(self._outcomes) >= self.error_threshold:
+            self._open(now, self._open_for)
+
+    def _open(self, now: float, seconds: float):
+        self.state = self.OPEN
+        self._opened_at = now
+        self._open_for = min(self.max_open_seconds, seconds)
+        self.limit = float(self.min_limit)
+        self._outcomes.clear()
+
+    def latency_quantile(self, q: float = 0.95, min_samples: int = 20) -> Optional[float]:
+        """最近成功请求延迟的分位数(秒)，样本不足时返回 None"""
+        if len(self._latencies) < min_samples:
+            return None
+        ordered = sorted(self._latencies)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    def is_open(self) -> bool:
+        """熔断打开且仍在冷却中"""
+        return self.state == self.OPEN and time.monotonic() < self._opened_at + self._open_for
+
+    def stats(self) -> Dict[str, Any]:
+        """数据源的并发、延迟和错误统计"""
+        p95 = self.latency_quantile(0.95, min_samples=1)
+        return {
+            'source': self.name,
+            'state': self.state,
+            'limit': round(self.limit, 2),
+            'in_flight': self.in_flight,
+            'requests': self.requests,
+            'errors': self.errors,
+            'error_rate': round(self.errors / self.requests, 4) if self.requests else 0.0,
+            'latency_ms': round(self.latency_ewma * 1000, 1) if self.latency_ewma is not None else None,
+            'p95_ms': round(p95 * 1000, 1) if p95 is not None else None,
+        }
+
+# 各数据源共享的控制器，以及创建时的完整参数
+_controllers: Dict[str, SourceController] = {}
+_controller_options: Dict[str, Dict[str, Any]] = {}
+
+def get_controller(name: str, **kwargs) -> SourceController:
+    """获取数据源控制器，首次获取时按参数创建
+
+    同名数据源在进程内共享一个控制器，并发上限默认取 settings.MAX_CONCURRENT；
+    控制器已存在时传入与创建参数不同的值会抛出 ValueError，而不是静默忽略
+    """
+    controller = _controllers.get(name)
+    if controller is None:
+        kwargs.setdefault('max_limit', settings.MAX_CONCURRENT)
+        defaults = {key: param.default for key, param in inspect.signature(SourceController).parameters.items()
+                    if param.default is not inspect.Parameter.empty}
+        controller = _controllers[name] = SourceController(name, **kwargs)
+        _controller_options[name] = {**defaults, **kwargs}
+        return controller
+    options = _controller_options[name]
+    conflicts = {key: value for key, value in kwargs.items() if options.get(key) != value}
+    if conflicts:
+        created = {key: options.get(key) for key in conflicts}
+        raise ValueError(f"数据源 {name} 的控制器已创建，参数 {conflicts} 与创建时的 {created} 不一致")
+    return controller
+
+def get_all_stats() -> List[Dict[str, Any]]:
+    """所有数据源的统计"""
+    return [controller.stats() for controller in _controllers.values()]
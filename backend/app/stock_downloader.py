@@ -7,16 +7,22 @@ import numpy as np
 import logging
 import re
 import os
-from typing import Optional, List, Tuple
+from typing import Dict, Optional, List, Set, Tuple
 import akshare as ak
 from datetime import datetime
 from app.config import settings
+from app.rate_control import TokenBucket, backoff_delay, get_controller
+from app import symbol_index, quote_service
+from app.data_sources import DataSource, LIVE_SOURCES
 
 # 配置日志
 logging.basicConfig(level=logging.INFO, 
                     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+class DownloadError(Exception):
+    """数据下载重试耗尽后仍然失败"""
+
 # 定义StockInfo类
 class StockInfo:
     def __init__(self, symbol: str, name: str, exchange: str, currency: str, 
@@ -39,14 +45,35 @@ class StockInfo:
         return f"StockInfo(symbol='{self.symbol}', name='{self.name}', price={self.price}, change={self.changePercent}%)"
 
 class StockDownloader:
-    def __init__(self, max_concurrent: int = 20):
+    def __init__(self, max_concurrent: int = 20, rate_limiter: Optional[TokenBucket] = None,
+                 sources: Optional[List[DataSource]] = None, hedge_quantile: float = 0.95,
+                 hedge_delay: float = 3.0, max_hedges: int = 4):
         """
         股票历史数据下载器初始化
         
         Args:
-            max_concurrent: 最大并发请求数
+            max_concurrent: 最大并发请求数(各数据源的自适应并发上限由 settings.MAX_CONCURRENT 统一配置)
+            rate_limiter: 全局限流器，每次请求数据源(包括重试和对冲请求)前获取令牌
+            sources: 日K数据源列表，第一个为主数据源，其余为对冲/备用数据源，默认直连腾讯、东方财富和新浪
+            hedge_quantile: 请求耗时超过该数据源此分位数的延迟时，向下一个数据源发起对冲请求
+            hedge_delay: 延迟样本不足时发起对冲请求的等待时间(秒)
+            max_hedges: 同时执行的额外请求(对冲请求及后台执行的落选请求)上限，达到上限时只等待原请求
         """
         self.max_concurrent = max_concurrent
+        self.rate_limiter = rate_limiter
+        self.sources = list(sources) if sources else [cls() for cls in LIVE_SOURCES]
+        self.hedge_quantile = hedge_quantile
+        self.hedge_delay = hedge_delay
+        self.max_hedges = max_hedges
+        # 对冲请求次数，以及对冲请求先于原请求返回的次数
+        self.hedges = 0
+        self.hedge_wins = 0
+        # 正在执行的数据源请求(含后台执行的落选请求)及正在进行的对冲调用数
+        self._requests: Set[asyncio.Task] = set()
+        self._requests_in_flight = 0
+        self._calls_in_flight = 0
+        # 各数据源的自适应并发与熔断控制，同名数据源的所有下载器实例共享(并发上限见 settings.MAX_CONCURRENT)
+        self.controllers = {source.name: get_controller(source.name) for source in self.sources}
         # AKShare初始化配置
         # 注意：新版本akshare可能不支持set_option方法，移除该配置
     
@@ -56,15 +83,142 @@ class StockDownloader:
         """
         return await asyncio.to_thread(func, *args, **kwargs)
     
-    async def get_stock_historical_data(self, stock_code: str, start_date: str, end_date: str) -> pd.DataFrame:
+    async def _fetch(self, source: DataSource, symbol: str, start_date: str, end_date: str) -> pd.DataFrame:
+        """在限流和数据源并发名额内请求一次日K"""
+        if self.rate_limiter:
+            await self.rate_limiter.acquire()
+        async with self.controllers[source.name].slot():
+            return await source.daily_bars(symbol, start_date, end_date)
+    
+    def _hedge_after(self, source: DataSource) -> float:
+        """等待多久后向下一个数据源发起对冲请求"""
+        latency = self.controllers[source.name].latency_quantile(self.hedge_quantile)
+        return self.hedge_delay if latency is None else latency
+    
+    async def _fetch_hedged(self, symbol: str, start_date: str, end_date: str) -> Tuple[Optional[DataSource], pd.DataFrame]:
+        """
+        对冲请求: 先请求主数据源，耗时超过其延迟分位数时向下一个数据源发起对冲请求，
+        请求出错时立即切换到下一个数据源；采用最先返回的有效数据。
+        数据源正常返回空数据(如停牌)即为结果，不再请求其他数据源。
+        
+        数据源的 HTTP 请求在线程中执行、无法中止，落选的请求不取消而是在后台执行完毕(结果丢弃)，
+        期间继续占用数据源的并发名额；未结束的额外请求(对冲及落选请求)达到 max_hedges 时不再发起对冲。
+        
+        Returns:
+            (返回数据的数据源, 数据)，数据源返回空数据时为 (None, 空DataFrame)
+            
+        Raises:
+            所有数据源都请求出错时，抛出最后一个错误
+        """
+        # 熔断中的数据源排在最后
+        queue = sorted(self.sources, key=lambda source: self.controllers[source.name].is_open())
+        pending: Dict[asyncio.Task, DataSource] = {}
+        last_error = None
+        # 已有数据源正常返回空数据，此后只等待已发出的请求
+        empty = False
+        
+        def launch() -> DataSource:
+            source = queue.pop(0)
+            task = asyncio.create_task(self._fetch(source, symbol, start_date, end_date))
+            self._requests_in_flight += 1
+            self._requests.add(task)
+            task.add_done_callback(self._request_done)
+            pending[task] = source
+            return source
+        
+        self._calls_in_flight += 1
+        try:
+            current = launch()
+            while pending:
+                timeout = self._hedge_after(current) if queue and not empty and self._can_hedge() else None
+                done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    # 等待期间其他调用可能已用满对冲名额
+                    if not self._can_hedge():
+                        continue
+                    logger.info(f"数据源 {current.name} 获取 {symbol} 超过 {timeout:.2f} 秒，发起对冲请求")
+                    self.hedges += 1
+                    current = launch()
+                    continue
+                for task in done:
+                    source = pending.pop(task)
+                    try:
+                        df = task.result()
+                    except Exception as e:
+                        last_error = e
+                        logger.error(f"数据源 {source.name} 获取 {symbol} 数据失败: {e}")
+                        continue
+                    if df is not None and not df.empty:
+                        if source is not self.sources[0] and pending:
+                            self.hedge_wins += 1
+                        return source, df
+                    logger.info(f"数据源 {source.name} 返回 {symbol} 空数据")
+                    empty = True
+                if pending:
+                    continue
+                if empty:
+                    return None, pd.DataFrame()
+                if queue:
+                    current = launch()
+        finally:
+            self._calls_in_flight -= 1
+        
+        raise last_error
+    
+    def _can_hedge(self) -> bool:
+        """未结束的额外请求(对冲请求及后台执行的落选请求)未达到上限"""
+        return self._requests_in_flight - self._calls_in_flight < self.max_hedges
+    
+    def _request_done(self, task: asyncio.Task):
+        """请求结束(包括后台执行完毕的落选请求)时更新计数，并取走落选请求的异常避免未处理告警"""
+        self._requests_in_flight -= 1
+        self._requests.discard(task)
+        if not task.cancelled():
+            task.exception()
+    
+    async def drain(self):
+        """等待后台仍在执行的落选请求结束"""
+        if self._requests:
+            await asyncio.gather(*self._requests, return_exceptions=True)
+    
+    async def get_adjust_factors(self, stock_code: str) -> Optional[pd.DataFrame]:
+        """
+        获取单只股票的后复权因子，依次尝试支持复权因子的数据源
+        
+        Returns:
+            date, factor 两列的DataFrame；没有数据源支持复权因子时返回 None
+            
+        Raises:
+            DownloadError: 所有支持复权因子的数据源都请求失败
+        """
+        market, code = self._get_market_and_code(stock_code)
+        symbol = f"{market.lower()}{code}"
+        sources = [source for source in self.sources if source.has_factors]
+        if not sources:
+            return None
+        last_error = None
+        for source in sources:
+            try:
+                if self.rate_limiter:
+                    await self.rate_limiter.acquire()
+                async with self.controllers[source.name].slot():
+                    return await source.adjust_factors(symbol)
+            except Exception as e:
+                last_error = e
+                logger.error(f"数据源 {source.name} 获取 {symbol} 复权因子失败: {e}")
+        raise DownloadError(f"获取 {stock_code} 复权因子失败: {last_error}")
+    
+    async def get_stock_historical_data(self, stock_code: str, start_date: str, end_date: str,
+                                        raise_on_error: bool = False) -> pd.DataFrame:
         """
-        获取单只股票的历史数据
+        获取单只股票的不复权历史数据
         实现主备用接口切换
         
         Args:
             stock_code: 股票代码 如 600519
             start_date: 开始日期 (YYYY-MM-DD)
             end_date: 结束日期 (YYYY-MM-DD)
+            raise_on_error: 重试耗尽且最后一次请求出错时抛出 DownloadError，而不是返回空数据
             
         Returns:
             股票历史数据DataFrame
@@ -73,6 +227,7 @@ class StockDownloader:
         market, stock_code = self._get_market_and_code(stock_code)
         
         full_symbol = f"{market.lower()}{stock_code}"
+        last_error = None
 
         for attempt in range(3):  # 重试3次
             try:
@@ -80,29 +235,29 @@ class StockDownloader:
                 
                 # 尝试使用主接口获取数据
                 df = None
+                failed = False
+                last_error = None
                 
                 try:
-                    logger.info(f"使用腾讯接口 stock_zh_a_hist_tx 获取 {full_symbol} 数据")
                     # 格式化日期，去除横杠
                     start_date_str = start_date.replace('-', '')
                     end_date_str = end_date.replace('-', '')
                     
-                    df = await self._run_sync(
-                        ak.stock_zh_a_hist_tx, 
-                        symbol=full_symbol,
-                        start_date=start_date_str,
-                        end_date=end_date_str,
-                        adjust="qfq"
-                    )
-                    logger.info(f"腾讯接口获取数据成功，数据行数: {len(df)}")
-                    # 检查返回数据格式
-                    if df is not None and not df.empty:
-                        logger.info(f"腾讯接口返回列: {list(df.columns)}")
+                    source, df = await self._fetch_hedged(full_symbol, start_date_str, end_date_str)
+                    if source is not None:
+                        logger.info(f"数据源 {source.name} 获取数据成功，数据行数: {len(df)}")
                 except Exception as e:
-                    logger.error(f"腾讯接口 stock_zh_a_hist_tx 获取 {full_symbol} 数据失败: {e}")
-                
+                    failed = True
+                    last_error = e
+                    logger.error(f"所有数据源获取 {full_symbol} 数据失败: {e}")
                 
                 if df is None or df.empty:
+                    # 所有数据源都正常返回空数据时不再重试，接口报错时退避后重试
+                    if not failed:
+                        logger.info(f"{full_symbol} 在 {start_date} 至 {end_date} 没有数据")
+                        return pd.DataFrame()
+                    if attempt < 2:
+                        await asyncio.sleep(backoff_delay(attempt + 1, base=2.0))
                     continue
                 
                 # 处理不同接口返回的数据格式差异
@@ -137,6 +292,7 @@ class StockDownloader:
                 if not all(col in df.columns for col in required_columns):
                     logger.error(f"返回数据缺少必要列: {required_columns}")
                     logger.error(f"实际返回列: {list(df.columns)}")
+                    last_error = f"返回数据缺少必要列: {list(df.columns)}"
                     continue
                 
                 # 只保留需要的列
@@ -159,16 +315,19 @@ class StockDownloader:
                 
             except Exception as e:
                 logger.error(f"获取 {stock_code} 历史数据失败 (尝试 {attempt+1}/3): {e}")
+                last_error = e
                 import traceback
                 traceback.print_exc()
                 
-                # 重试前等待
+                # 重试前等待(带随机抖动，避免并发任务同时重试)
                 if attempt < 2:
-                    wait_time = 2 * (2 ** attempt)
-                    logger.info(f"等待 {wait_time} 秒后重试...")
+                    wait_time = backoff_delay(attempt + 1, base=2.0)
+                    logger.info(f"等待 {wait_time:.1f} 秒后重试...")
                     await asyncio.sleep(wait_time)
         
         logger.error(f"获取 {stock_code} 历史数据失败，已重试3次")
+        if raise_on_error and last_error is not None:
+            raise DownloadError(f"获取 {stock_code} 历史数据失败: {last_error}")
         return pd.DataFrame()
     
     async def search_stocks(self, query: str) -> List[StockInfo]:
@@ -183,25 +342,22 @@ class StockDownloader:
         """
         try:
             logger.info(f"正在搜索股票: {query}")
-            # 获取A股股票列表
-            stock_info_a_code_name_df = await self._run_sync(ak.stock_info_a_code_name)
-            
-            # 过滤匹配的股票
-            filtered_stocks = stock_info_a_code_name_df[
-                stock_info_a_code_name_df['code'].str.contains(query) | 
-                stock_info_a_code_name_df['name'].str.contains(query)
-            ]
+            # 在本地证券代码索引中查找，不再每次下载完整的代码列表
+            matches = await self._run_sync(symbol_index.search, query, None)
             
             results = []
-            for _, row in filtered_stocks.iterrows():
+            for row in matches:
                 # 判断交易所
                 code = row['code']
-                if code.startswith('6'):
+                if row['exchange'] == 'SH':
                     exchange = "上海证券交易所"
                     symbol = f"{code}.SH"
-                else:
+                elif row['exchange'] == 'SZ':
                     exchange = "深圳证券交易所"
                     symbol = f"{code}.SZ"
+                else:
+                    exchange = "北京证券交易所"
+                    symbol = f"{code}.BJ"
                 
                 stock_info = StockInfo(
                     symbol=symbol,
@@ -235,131 +391,63 @@ class StockDownloader:
 
 
     async def get_stock_info(self, symbol: str) -> Optional[StockInfo]:
-        """获取股票详细信息"""
+        """获取股票详细信息(实时行情由行情服务缓存并批量获取)"""
         try:
-            market, code = self._get_market_and_code(symbol)
-            
-            # 获取实时行情
-            try:
-                df = await self._run_sync(ak.stock_individual_spot_xq,symbol=market+code,token=settings.XUEQIU_TOKEN)
-            except Exception as e:
-                print(f"获取xq股票信息失败: {str(e)}")
-                import requests
-                r = requests.get("https://xueqiu.com/hq", headers={"user-agent": "Mozilla"})
-                t = r.cookies["xq_a_token"]
-                settings.XUEQIU_TOKEN = t
-                print(f"更新xq_a_token: {t}")
-                df = await self._run_sync(ak.stock_individual_spot_xq,symbol=market+code,token=settings.XUEQIU_TOKEN)
-            
-            if df.empty:
+            quotes = await quote_service.get_service().get_quotes_async([symbol])
+            quote = quotes.get(quote_service.normalize_symbol(symbol))
+            if quote is None:
                 return None
-                        
-            # 获取股票名称
-            name = df[df['item']=='名称'].iloc[0]['value']
-            
-            # 确定交易所
-            exchange = "上海证券交易所" if market == "SH" else "深圳证券交易所"
-            
-            # 计算涨跌幅
-            price = float(df[df['item']=='现价'].iloc[0]['value']) if not pd.isna(df[df['item']=='现价'].iloc[0]['value']) else 0.0
-            change = float(df[df['item']=='涨跌'].iloc[0]['value']) if not pd.isna(df[df['item']=='涨跌'].iloc[0]['value']) else 0.0
-            change_percent = float(df[df['item']=='涨幅'].iloc[0]['value']) if not pd.isna(df[df['item']=='涨幅'].iloc[0]['value']) else 0.0
-            
-            # 获取市值（亿元转为元）
-            market_cap = float(df[df['item']=='资产净值/总市值'].iloc[0]['value']) if not pd.isna(df[df['item']=='资产净值/总市值'].iloc[0]['value']) else 0.0
-
-            # 获取成交量（单位股）
-            volume = int(float(df[df['item']=='成交量'].iloc[0]['value'])) if not pd.isna(df[df['item']=='成交量'].iloc[0]['value']) else 0
-
-            # 获取市盈率
-            pe = float(df[df['item']=='市盈率(TTM)'].iloc[0]['value']) if not pd.isna(df[df['item']=='市盈率(TTM)'].iloc[0]['value']) else None
-            
-            # 获取股息率
-            dividend = float(df[df['item']=='股息率(TTM)'].iloc[0]['value']) if not pd.isna(df[df['item']=='股息率(TTM)'].iloc[0]['value']) else None
-
-            # 获取货币
-            currency = df[df['item']=='货币'].iloc[0]['value'] if not pd.isna(df[df['item']=='货币'].iloc[0]['value']) else 'CNY'
-            
-            stock_info = StockInfo(
+            return StockInfo(
                 symbol=symbol,
-                name=name,
-                exchange=exchange,
-                currency=currency,
-                price=price,
-                change=change,
-                changePercent=change_percent,
-                marketCap=market_cap,
-                volume=volume,
-                pe=pe,
-                dividend=dividend
+                name=quote['name'],
+                exchange=quote['exchange'],
+                currency=quote['currency'],
+                price=quote['price'],
+                change=quote['change'],
+                changePercent=quote['changePercent'],
+                marketCap=quote['marketCap'],
+                volume=quote['volume'],
+                pe=quote['pe'],
+                dividend=quote['dividend']
             )
-            return stock_info
         except Exception as e:
-            print(f"获取股票信息时出错: {str(e)}")
+            logger.error(f"获取股票信息时出错: {e}")
             return None
     
-    async def get_stock_chip_distribution(self, stock_code: str) -> Optional[pd.DataFrame]:
+    async def get_stock_chip_distribution(self, stock_code: str, raise_on_error: bool = False) -> Optional[pd.DataFrame]:
         """
-        获取股票筹码分布数据
+        获取股票最近的筹码分布数据(东方财富接口只返回最近 90 个交易日)，依次尝试支持筹码分布的数据源
         
         Args:
             stock_code: 股票代码 如 600519 或 600519.SH
+            raise_on_error: 所有数据源都失败时抛出 DownloadError，而不是返回 None
             
         Returns:
-            筹码分布数据DataFrame，包含以下字段：
+            筹码分布数据DataFrame，按日期升序，包含以下字段(成本为不复权价格)：
             - 日期 (date)
             - 获利比例 (profit_ratio)
             - 平均成本 (avg_cost)
-            - 90%筹码集中度 (concentration_90)
-            - 70%筹码集中度 (concentration_70)
+            - 90%筹码成本区间及集中度 (cost_90_low, cost_90_high, concentration_90)
+            - 70%筹码成本区间及集中度 (cost_70_low, cost_70_high, concentration_70)
         """
-        try:
-            logger.info(f"正在获取 {stock_code} 筹码分布数据")
-            
-            # 解析股票代码
-            market, stock_code = self._get_market_and_code(stock_code)
-            
-            # 使用akshare的stock_cyq_em接口获取筹码分布数据
-            df = await self._run_sync(
-                ak.stock_cyq_em,
-                symbol=stock_code
-            )
-            
-            if df is None or df.empty:
-                logger.error(f"未获取到 {stock_code} 筹码分布数据")
-                return None
-            
-            logger.info(f"成功获取 {stock_code} 筹码分布数据，数据行数: {len(df)}")
-            logger.info(f"筹码分布数据列: {list(df.columns)}")
-            
-            # 重命名列名，确保格式统一
-            column_mapping = {
-                '日期': 'date',
-                '获利比例': 'profit_ratio',
-                '平均成本': 'avg_cost',
-                '90集中度': 'concentration_90',
-                '70集中度': 'concentration_70'
-            }
-            
-            # 只保留需要的列
-            df = df.rename(columns=column_mapping)
-            # 选择需要的列
-            df = df[['date', 'profit_ratio', 'avg_cost', 'concentration_90', 'concentration_70']]
-            
-            # 转换日期格式
-            if not df.empty and isinstance(df['date'].iloc[0], str):
-                df['date'] = pd.to_datetime(df['date'])
-            
-            # 按日期排序
-            if not df.empty:
-                df = df.sort_values('date')
-            
-            return df
-        except Exception as e:
-            logger.error(f"获取 {stock_code} 筹码分布数据失败: {e}")
-            import traceback
-            traceback.print_exc()
-            return None
+        logger.info(f"正在获取 {stock_code} 筹码分布数据")
+        market, code = self._get_market_and_code(stock_code)
+        symbol = f"{market.lower()}{code}"
+        last_error = None
+        for source in [source for source in self.sources if source.has_chips]:
+            try:
+                if self.rate_limiter:
+                    await self.rate_limiter.acquire()
+                async with self.controllers[source.name].slot():
+                    df = await source.chip_distribution(symbol)
+                logger.info(f"成功获取 {stock_code} 筹码分布数据，数据行数: {len(df)}")
+                return df
+            except Exception as e:
+                last_error = e
+                logger.error(f"数据源 {source.name} 获取 {stock_code} 筹码分布数据失败: {e}")
+        if raise_on_error:
+            raise DownloadError(f"获取 {stock_code} 筹码分布数据失败: {last_error or '没有支持筹码分布的数据源'}")
+        return None
     
     async def batch_get_stock_data(self, stock_codes: List[str], start_date: str, end_date: str) -> List[pd.DataFrame]:
         """
@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import bisect
+import logging
+import threading
+import time
+from typing import Dict, List, Optional
+import akshare as ak
+
+from app.db import symbols as symbols_db
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+try:
+    from pypinyin import lazy_pinyin, Style
+except ImportError:  # pypinyin 是项目依赖，缺失时代码和名称搜索仍可用，但拼音首字母为空
+    lazy_pinyin = None
+    logger.warning("未安装 pypinyin，证券代码表不包含拼音首字母，请执行 uv sync 安装依赖")
+
+# 匹配类型，数值越小排名越靠前
+EXACT_CODE, CODE_PREFIX, EXACT_NAME, INITIALS_PREFIX, NAME_PREFIX, NAME_INFIX = range(6)
+
+# 内存索引的有效期(秒)，过期后在后台重新下载
+REFRESH_SECONDS = 24 * 3600
+
+def exchange_of(code: str) -> str:
+    """根据代码判断交易所"""
+    if code.startswith('6'):
+        return 'SH'
+    if code.startswith(('0', '3')):
+        return 'SZ'
+    return 'BJ'
+
+def initials_of(name: str) -> str:
+    """名称的拼音首字母(小写)，缺少 pypinyin 时返回空字符串"""
+    if lazy_pinyin is None:
+        return ''
+    return ''.join(lazy_pinyin(name, style=Style.FIRST_LETTER)).lower()
+
+def refresh_symbols() -> int:
+    """从网络下载A股代码和名称并保存到证券代码表，返回证券数量
+
+    缺少 pypinyin 时保留代码表中已有的拼音首字母，不用空值覆盖
+    """
+    df = ak.stock_info_a_code_name()
+    kept = {}
+    if lazy_pinyin is None:
+        logger.error("未安装 pypinyin，刷新证券代码表时保留已有的拼音首字母，新增证券没有拼音首字母")
+        kept = {s['code']: s['initials'] for s in symbols_db.get_symbols()}
+    rows = [{'code': str(code), 'name': str(name).replace(' ', ''), 'exchange': exchange_of(str(code)),
+             'initials': initials_of(str(name)) if lazy_pinyin is not None else kept.get(str(code), '')}
+            for code, name in zip(df['code'], df['name'])]
+    symbols_db.save_symbols(rows)
+    return len(rows)
+
+class SymbolIndex:
+    """证券代码的内存前缀索引
+
+    所有可搜索的键(代码、名称及名称的各个后缀、拼音首字母)排序后存放在数组中，
+    查询时二分定位前缀区间，按匹配类型(代码 > 名称全称 > 拼音首字母 > 名称前缀 > 名称子串)和名称长度排序。
+    """
+
+    def __init__(self, symbols: List[Dict]):
+        self.symbols = symbols
+        entries = []
+        for i, s in enumerate(symbols):
+            entries.append((s['code'], i, CODE_PREFIX))
+            name = s['name'].lower()
+            # 名称的每个后缀都作为键，支持名称中间的子串匹配
+            for pos in range(len(name)):
+                entries.append((name[pos:], i, NAME_PREFIX if pos == 0 else NAME_INFIX))
+            if s.get('initials'):
+                entries.append((s['initials'], i, INITIALS_PREFIX))
+        entries.sort()
+        self._keys = [e[0] for e in entries]
+        self._entries = entries
+        self.loaded_at = time.monotonic()
+
+    def __len__(self):
+        return len(self.symbols)
+
+    def search(self, query: str, limit: Optional[int] = 10) -> List[Dict]:
+        """搜索证券，返回按相关度排序的结果，limit 为 None 时返回全部匹配"""
+        q = query.strip().lower()
+        if not q:
+            return []
+        best: Dict[int, tuple] = {}
+        lo = bisect.bisect_left(self._keys, q)
+        hi = bisect.bisect_left(self._keys, q + '\uffff', lo)
+        for key, i, kind in self._entries[lo:hi]:
+            if kind == CODE_PREFIX and key == q:
+                kind = EXACT_CODE
+            elif kind == NAME_PREFIX and key == q:
+                kind = EXACT_NAME
+            rank = (kind, len(self.symbols[i]['name']), self.symbols[i]['code'])
+            if i not in best or rank < best[i]:
+                best[i] = rank
+        ranked = sorted(best, key=best.get)[:limit]
+        return [self.symbols[i] for i in ranked]
+
+_index: Optional[SymbolIndex] = None
+_lock = threading.Lock()
+_refreshing = False
+
+def _refresh_in_background():
+    global _index, _refreshing
+    try:
+        refresh_symbols()
+        _index = SymbolIndex(symbols_db.get_symbols())
+    except Exception as e:
+        logger.error(f"刷新证券代码表失败: {e}")
+    finally:
+        _refreshing = False
+
+def get_index() -> SymbolIndex:
+    """获取证券代码索引：首次从数据库加载(表为空时同步下载)，过期后在后台刷新"""
+    global _index, _refreshing
+    if _index is None:
+        with _lock:
+            if _index is None:
+                symbols = symbols_db.get_symbols()
+                if not symbols:
+                    try:
+                        refresh_symbols()
+                        symbols = symbols_db.get_symbols()
+                    except Exception as e:
+                        logger.error(f"下载证券代码表失败: {e}")
+                _index = SymbolIndex(symbols)
+    elif time.monotonic() - _index.loaded_at > REFRESH_SECONDS and not _refreshing:
+        _refreshing = True
+        threading.Thread(target=_refresh_in_background, name='symbol-refresh', daemon=True).start()
+    return _index
+
+def reset():
+    """清除内存索引，下次查询时重新加载"""
+    global _index
+    _index = None
+
+def search(query: str, limit: Optional[int] = 10) -> List[Dict]:
+    return get_index().search(query, limit)
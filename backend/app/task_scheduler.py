@@ -4,16 +4,23 @@
 import asyncio
 import logging
 from datetime import datetime, timedelta
-from typing import List
+from typing import List, Optional, Tuple
 import pandas as pd
 
 from app.db import get_companies
 from app.stock_downloader import StockDownloader
+from app.data_sources import DataSource
+from app.rate_control import TokenBucket, get_all_stats
+from app.config import settings
+from app import trading_calendar
 from app.db import (
-    save_stock_history,
-    get_latest_stock_date,
+    get_stock_watermarks,
     get_stock_count
 )
+from app.db.async_writer import AsyncHistoryWriter
+from app.db import sync_jobs
+from app.db import adjust_factors
+from app.db import chips
 
 # 配置日志
 logging.basicConfig(level=logging.INFO, 
@@ -21,30 +28,47 @@ logging.basicConfig(level=logging.INFO,
 logger = logging.getLogger(__name__)
 
 class TaskScheduler:
-    def __init__(self, db_path: str, max_concurrent: int = 50):
+    def __init__(self, db_path: str, max_concurrent: int = 50, rate_limit: Optional[float] = None,
+                 sources: Optional[List[DataSource]] = None):
         """
         任务调度器初始化
         
         Args:
             db_path: 数据库文件路径
-            max_concurrent: 最大并发请求数
+            max_concurrent: 下载工作协程数量(各数据源自适应并发的上限由 settings.MAX_CONCURRENT 统一配置)
+            rate_limit: 数据源请求速率上限(次/秒)，默认使用 settings.RATE_LIMIT
+            sources: 日K数据源列表(主数据源在前)，默认直连腾讯、东方财富和新浪
         """
         self.db_path = db_path
         self.max_concurrent = max_concurrent
-        self.downloader = StockDownloader(max_concurrent)
+        self.rate_limit = settings.RATE_LIMIT if rate_limit is None else rate_limit
+        self.rate_limiter = TokenBucket(self.rate_limit)
+        self.downloader = StockDownloader(max_concurrent, rate_limiter=self.rate_limiter, sources=sources)
     
-    async def run_update(self, start_date: str, end_date: str, stock_codes: List[str] = None):
+    async def run_update(self, start_date: Optional[str] = None, end_date: Optional[str] = None,
+                         stock_codes: List[str] = None, resume: bool = False):
         """
         运行下载任务
         
         Args:
-            start_date: 开始日期 (YYYY-MM-DD)
-            end_date: 结束日期 (YYYY-MM-DD)
+            start_date: 开始日期 (YYYY-MM-DD)，None 表示 settings.START_DATE
+            end_date: 结束日期 (YYYY-MM-DD)，None 表示当前日期
             stock_codes: 指定的股票代码列表，None 表示所有成分股
+            resume: 继续最近一次未完成的同步，只执行其中未完成且已过重试退避时间的任务；
+                该任务沿用创建时的日期范围和股票列表，与本次指定的参数不一致时记录警告
         """
+        if resume:
+            job = sync_jobs.get_resumable_job()
+            if job is not None:
+                self._warn_resume_conflicts(job, start_date, end_date, stock_codes)
+                return await self._run_job(job['id'], job['end_date'], skipped_count=0)
+            logger.info("没有未完成的同步任务，重新规划")
+        
+        start_date = start_date or settings.START_DATE
+        end_date = end_date or datetime.now().strftime('%Y-%m-%d')
         logger.info(f"开始运行下载任务")
         logger.info(f"时间范围: {start_date} 至 {end_date}")
-        logger.info(f"最大并发数: {self.max_concurrent}")
+        logger.info(f"最大并发数: {self.max_concurrent}, 限流: {self.rate_limit} 次/秒")
         logger.info(f"数据库路径: {self.db_path}")
         
         # 1. 获取股票列表
@@ -59,78 +83,200 @@ class TaskScheduler:
         
         logger.info(f"开始下载 {len(stocks)} 只股票的历史数据")
         
-        # 2. 分批次下载数据
-        batch_size = min(50, self.max_concurrent)
-        success_count = 0
-        skipped_count = 0
-        
-        for i in range(0, len(stocks), batch_size):
-            batch = stocks[i:i+batch_size]
-            logger.info(f"正在处理第 {i//batch_size + 1}/{(len(stocks) + batch_size - 1)//batch_size} 批次, {len(batch)} 只股票")
-            
-            # 检查批次中的每只股票是否需要下载
-            stocks_to_download = []
-            for stock in batch:
-                stock_code = stock
-                # 获取该股票的最大日期
-                latest_date = get_latest_stock_date(stock_code)
-                
-                if latest_date is None:
-                    # 没有历史数据，需要下载
-                    stocks_to_download.append(stock)
-                    logger.info(f"股票 {stock_code} 无历史数据，需要下载")
-                elif latest_date < end_date:
-                    # 历史数据的最大日期小于结束日期，需要下载更新
-                    stocks_to_download.append(stock)
-                    logger.info(f"股票 {stock_code} 历史数据最新日期为 {latest_date}，小于结束日期 {end_date}，需要下载更新")
-                else:
-                    # 历史数据已经是最新，跳过下载
-                    logger.info(f"股票 {stock_code} 历史数据已更新到 {latest_date}，无需下载")
-                    skipped_count += 1
-            
-            if not stocks_to_download:
-                logger.info(f"本批次 {len(batch)} 只股票均已存在数据，跳过下载")
-            else:
-                logger.info(f"本批次需下载 {len(stocks_to_download)} 只股票，{len(batch) - len(stocks_to_download)} 只股票跳过")
-                
-                # 为每只需要下载的股票创建下载任务，使用正确的开始日期
-                tasks = []
-                for stock_code in stocks_to_download:
-                    # 获取该股票的历史最大日期
-                    latest_date = get_latest_stock_date(stock_code)
-                    # 计算实际开始日期：如果有历史数据则从最大日期+1开始，否则使用原始start_date
-                    actual_start_date = start_date
-                    if latest_date is not None:
-                        from datetime import datetime, timedelta
-                        latest_date_obj = datetime.strptime(latest_date, '%Y-%m-%d')
-                        next_date_obj = latest_date_obj + timedelta(days=1)
-                        actual_start_date = next_date_obj.strftime('%Y-%m-%d')
-                    # 创建下载任务
-                    task = self.downloader.get_stock_historical_data(stock_code, actual_start_date, end_date)
-                    tasks.append((stock_code, task))
-                
-                # 并发执行所有下载任务
-                results = await asyncio.gather(*[task for _, task in tasks], return_exceptions=True)
-                
-                # 处理下载结果
-                for (stock_code, _), result in zip(tasks, results):
-                    if isinstance(result, Exception):
-                        logger.error(f"下载 {stock_code} 数据失败: {result}")
-                    elif not result.empty:
-                        if save_stock_history(result):
-                            success_count += 1
-                            logger.info(f"成功保存 {stock_code} 数据: {len(result)} 条记录")
-                        else:
-                            logger.error(f"保存 {stock_code} 数据失败")
-                    else:
-                        logger.info(f"{stock_code} 没有新增数据")
-            
-            # 批次间休息,避免请求过快
-            if i + batch_size < len(stocks):
-                await asyncio.sleep(1.0)
+        # 2. 一次查询所有股票的数据水位，确定每只股票需要下载的日期范围
+        #    只下载到最近一个已收盘的交易日，周末、节假日和收盘前不产生请求
+        await asyncio.to_thread(trading_calendar.ensure_calendar)
+        session = min(end_date, trading_calendar.last_completed_session())
+        logger.info(f"最近已收盘交易日: {session}")
+        watermarks = get_stock_watermarks(stocks)
+        jobs = self._plan(stocks, watermarks, start_date, session)
+        skipped_count = len(stocks) - len(jobs)
+        logger.info(f"需下载 {len(jobs)} 只股票，{skipped_count} 只股票已是最新")
+        job_id = sync_jobs.create_job(start_date, end_date, jobs)
+        return await self._run_job(job_id, end_date, skipped_count)
+
+    @staticmethod
+    def _warn_resume_conflicts(job: dict, start_date: Optional[str], end_date: Optional[str],
+                               stock_codes: Optional[List[str]]):
+        """继续未完成的同步时，本次指定的日期范围或股票列表与该任务不一致则记录警告"""
+        if (start_date and start_date != job['start_date']) or (end_date and end_date != job['end_date']):
+            logger.warning(f"继续同步任务 #{job['id']}: 沿用其日期范围 {job['start_date']} 至 {job['end_date']}，"
+                           f"忽略本次指定的 {start_date or job['start_date']} 至 {end_date or job['end_date']}")
+        if stock_codes:
+            planned = {task['stock_code'] for task in sync_jobs.get_tasks(job['id'])}
+            requested = set(stock_codes)
+            if planned - requested:
+                logger.warning(f"继续同步任务 #{job['id']}: 任务中有 {len(planned - requested)} 只股票不在本次指定的股票列表中，"
+                               f"仍会执行")
+            if requested - planned:
+                logger.warning(f"继续同步任务 #{job['id']}: 本次指定的 {len(requested - planned)} 只股票不在该任务中，"
+                               f"不会同步: {sorted(requested - planned)[:10]}")
+
+    async def _run_job(self, job_id: int, end_date: str, skipped_count: int) -> bool:
+        """执行同步运行中可执行的任务，并在任务日志中记录每只股票的结果"""
+        jobs = sync_jobs.get_runnable_tasks(job_id)
+        logger.info(f"同步任务 #{job_id}: 本次执行 {len(jobs)} 只股票")
+        
+        # 3. 工作协程持续从队列取任务，下载完成即提交写线程，不等待同批次的其他股票
+        async with AsyncHistoryWriter() as writer:
+            success_count = await self._run_pool(writer, jobs, end_date, job_id)
         
+        summary = sync_jobs.finish_job(job_id)
+        logger.info(f"同步任务 #{job_id} 状态: {summary}")
+        # 4. K线入库后单独同步复权因子，失败的股票保持待同步状态，下次同步时重试
+        await self.run_factor_update()
+        for stats in get_all_stats():
+            logger.info(f"数据源 {stats['source']} 统计: {stats}")
+        logger.info(f"对冲请求 {self.downloader.hedges} 次，其中 {self.downloader.hedge_wins} 次先于原请求返回")
         logger.info(f"下载任务完成! 成功处理 {success_count} 只股票，跳过 {skipped_count} 只股票，总计 {success_count + skipped_count} 只股票")
         return True
+
+    def _plan(self, stocks: List[str], watermarks: dict, start_date: str, end_date: str) -> List[Tuple[str, str]]:
+        """根据数据水位生成下载任务 [(股票代码, 实际开始日期)]，已是最新的股票跳过"""
+        jobs = []
+        for stock_code in stocks:
+            mark = watermarks.get(stock_code, {})
+            latest_date = mark.get('last_date')
+            if latest_date is None:
+                # 没有历史数据，从原始开始日期下载
+                jobs.append((stock_code, start_date))
+            elif mark.get('price_basis', 'raw') != 'raw':
+                # 已有数据为旧版的前复权价格，覆盖已有数据的全部日期重新下载(旧数据在写入前删除)
+                jobs.append((stock_code, min(start_date, mark.get('first_date') or start_date)))
+            elif latest_date < end_date:
+                # 历史数据的最大日期小于结束日期，从下一个交易日开始下载
+                jobs.append((stock_code, trading_calendar.next_trading_day(latest_date)))
+            else:
+                logger.info(f"股票 {stock_code} 历史数据已更新到 {latest_date}，无需下载")
+        return jobs
+
+    async def _run_pool(self, writer: AsyncHistoryWriter, jobs: List[Tuple[str, str]], end_date: str,
+                        job_id: int) -> int:
+        """固定数量的工作协程并发下载，写入确认后记录任务结果，返回成功数"""
+        queue: asyncio.Queue = asyncio.Queue()
+        for job in jobs:
+            queue.put_nowait(job)
+        confirms = []
+        # 旧版前复权数据的股票(包括继续执行的任务)，新数据写入前删除旧价格
+        marks = get_stock_watermarks([code for code, _ in jobs])
+        legacy = {code for code, mark in marks.items() if mark.get('price_basis', 'raw') != 'raw'}
+
+        async def confirm(stock_code: str, rows: int, ack: asyncio.Future) -> bool:
+            # 任务日志在工作线程中写入，不阻塞事件循环
+            if await ack is None:
+                logger.error(f"保存 {stock_code} 数据失败")
+                await asyncio.to_thread(sync_jobs.mark_failed, job_id, stock_code, '保存数据失败')
+                return False
+            logger.info(f"成功保存 {stock_code} 数据: {rows} 条记录")
+            await asyncio.to_thread(sync_jobs.mark_done, job_id, stock_code, rows)
+            # 有新K线时复权因子可能变化(除权除息只发生在交易日)
+            await asyncio.to_thread(adjust_factors.mark_pending, [stock_code])
+            return True
+
+        async def worker():
+            while True:
+                try:
+                    stock_code, actual_start_date = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                try:
+                    result = await self.downloader.get_stock_historical_data(
+                        stock_code, actual_start_date, end_date, raise_on_error=True)
+                except Exception as e:
+                    logger.error(f"下载 {stock_code} 数据失败: {e}")
+                    await asyncio.to_thread(sync_jobs.mark_failed, job_id, stock_code, str(e))
+                    continue
+                finally:
+                    queue.task_done()
+                if result.empty:
+                    logger.info(f"{stock_code} 没有新增数据")
+                    await asyncio.to_thread(sync_jobs.mark_done, job_id, stock_code, 0)
+                    continue
+                # 旧版前复权数据在写入事务中整体替换，写入失败时旧数据保持不变
+                ack = await writer.submit(result, replace=stock_code in legacy)
+                confirms.append(asyncio.create_task(confirm(stock_code, len(result), ack)))
+
+        workers = [asyncio.create_task(worker()) for _ in range(min(self.max_concurrent, len(jobs)))]
+        await asyncio.gather(*workers)
+
+        return sum(await asyncio.gather(*confirms))
+    
+    async def run_factor_update(self, stock_codes: List[str] = None) -> dict:
+        """
+        同步待更新的复权因子: 写入新K线的股票在 DB_CONFIG['adjust_factor_refresh_days'] 天内只请求一次，
+        单只股票失败只记录在同步状态中，不影响K线数据
+        
+        Returns:
+            {'updated': 因子有变化的股票数, 'unchanged': 因子未变化的股票数, 'failed': 失败的股票数}
+        """
+        stocks = await asyncio.to_thread(adjust_factors.get_due, stock_codes)
+        stats = {'updated': 0, 'unchanged': 0, 'failed': 0}
+        logger.info(f"复权因子: 需同步 {len(stocks)} 只股票")
+        
+        queue: asyncio.Queue = asyncio.Queue()
+        for stock_code in stocks:
+            queue.put_nowait(stock_code)
+        
+        async def worker():
+            while not queue.empty():
+                stock_code = queue.get_nowait()
+                try:
+                    factors = await self.downloader.get_adjust_factors(stock_code)
+                    changed = 0
+                    if factors is not None:
+                        changed = await asyncio.to_thread(adjust_factors.save_factors, stock_code, factors)
+                    await asyncio.to_thread(adjust_factors.mark_synced, stock_code)
+                except Exception as e:
+                    logger.error(f"同步 {stock_code} 复权因子失败: {e}")
+                    await asyncio.to_thread(adjust_factors.mark_failed, stock_code, str(e))
+                    stats['failed'] += 1
+                    continue
+                stats['updated' if changed else 'unchanged'] += 1
+        
+        await asyncio.gather(*[asyncio.create_task(worker()) for _ in range(min(self.max_concurrent, len(stocks)))])
+        logger.info(f"复权因子同步完成: {stats}")
+        return stats
+    
+    async def run_chip_update(self, stock_codes: List[str] = None) -> dict:
+        """
+        增量同步筹码分布: 与历史数据相同按水位规划，已同步到最近已收盘交易日的股票跳过，
+        接口返回最近的数据窗口，只写入水位之后的新数据
+        
+        Returns:
+            {'updated': 写入新数据的股票数, 'skipped': 已是最新的股票数, 'failed': 失败的股票数, 'rows': 写入行数}
+        """
+        stocks = stock_codes or get_companies()
+        await asyncio.to_thread(trading_calendar.ensure_calendar)
+        session = trading_calendar.last_completed_session()
+        watermarks = chips.get_watermarks(stocks)
+        # 接口不支持指定日期范围，规划结果中的开始日期仅用于过滤已入库的数据
+        jobs = self._plan(stocks, watermarks, session, session)
+        stats = {'updated': 0, 'skipped': len(stocks) - len(jobs), 'failed': 0, 'rows': 0}
+        logger.info(f"筹码分布: 需同步 {len(jobs)} 只股票，{stats['skipped']} 只股票已是最新")
+        
+        queue: asyncio.Queue = asyncio.Queue()
+        for job in jobs:
+            queue.put_nowait(job)
+        
+        async def worker():
+            while not queue.empty():
+                stock_code, _ = queue.get_nowait()
+                try:
+                    df = await self.downloader.get_stock_chip_distribution(stock_code, raise_on_error=True)
+                    last_date = watermarks.get(stock_code, {}).get('last_date')
+                    if last_date is not None:
+                        df = df[df['date'].astype(str) > last_date]
+                    rows = await asyncio.to_thread(chips.save_chips, stock_code, df)
+                except Exception as e:
+                    logger.error(f"同步 {stock_code} 筹码分布失败: {e}")
+                    stats['failed'] += 1
+                    continue
+                stats['updated'] += 1 if rows else 0
+                stats['rows'] += rows
+        
+        await asyncio.gather(*[asyncio.create_task(worker()) for _ in range(min(self.max_concurrent, len(jobs)))])
+        logger.info(f"筹码分布同步完成: {stats}")
+        return stats
     
     def get_stock_count_in_db(self):
         """
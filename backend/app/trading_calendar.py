@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import logging
+from datetime import date, datetime, time
+from typing import Optional
+import numpy as np
+import akshare as ak
+
+from app.db import trading_calendar as calendar_db
+from app.db.dates import to_day, to_iso
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+# A股第一个交易日，工作日近似的起点
+FIRST_SESSION = '1990-12-19'
+
+# 收盘后日K数据可用的时间
+SESSION_READY = time(15, 30)
+
+# 当前进程使用的交易日(升序天数数组)
+_days: Optional[np.ndarray] = None
+
+def fetch_trading_days() -> list:
+    """从新浪财经下载A股交易日历"""
+    df = ak.tool_trade_date_hist_sina()
+    return df['trade_date'].tolist()
+
+def _weekdays(start: str, end: date) -> np.ndarray:
+    """以工作日近似交易日(不含节假日)，在无法获取交易日历时使用"""
+    days = np.arange(to_day(start), to_day(end) + 1, dtype=np.int32)
+    # 1970-01-01 是星期四，(天数 + 3) % 7 为 0-6 对应星期一至星期日
+    return days[(days + 3) % 7 < 5]
+
+def ensure_calendar(today: Optional[date] = None) -> np.ndarray:
+    """获取交易日历：优先使用数据库中的日历，未覆盖今天时从网络刷新一次，失败时退化为工作日"""
+    global _days
+    today = today or date.today()
+    if _days is not None and len(_days) and _days[-1] >= to_day(today):
+        return _days
+
+    days = calendar_db.get_days()
+    if not len(days) or days[-1] < to_day(today):
+        try:
+            calendar_db.save_days(fetch_trading_days())
+            days = calendar_db.get_days()
+        except Exception as e:
+            logger.error(f"下载交易日历失败: {e}")
+    if not len(days) or days[-1] < to_day(today):
+        logger.warning("交易日历未覆盖今天，缺失部分使用工作日近似")
+        start = to_iso(days[-1] + 1) if len(days) else FIRST_SESSION
+        days = np.concatenate([days, _weekdays(start, date(today.year + 1, 12, 31))])
+    _days = days
+    return days
+
+def reset():
+    """清除进程内缓存的交易日历"""
+    global _days
+    _days = None
+
+def is_trading_day(value) -> bool:
+    days = ensure_calendar()
+    day = to_day(value)
+    idx = np.searchsorted(days, day)
+    return idx < len(days) and days[idx] == day
+
+def last_completed_session(now: Optional[datetime] = None) -> str:
+    """最近一个已收盘(日K数据可用)的交易日"""
+    now = now or datetime.now()
+    days = ensure_calendar(now.date())
+    today = to_day(now.date())
+    # 今天收盘前只能取到上一个交易日
+    bound = today if now.time() >= SESSION_READY else today - 1
+    idx = np.searchsorted(days, bound, side='right') - 1
+    return to_iso(days[max(idx, 0)])
+
+def next_trading_day(value) -> str:
+    """指定日期之后的第一个交易日"""
+    days = ensure_calendar()
+    day = to_day(value)
+    idx = np.searchsorted(days, day, side='right')
+    if idx < len(days):
+        return to_iso(days[idx])
+    # 超出日历范围时取下一个工作日
+    day += 1
+    while (day + 3) % 7 >= 5:
+        day += 1
+    return to_iso(day)
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import argparse
+import json
+import os
+from app.config import settings
+from app.db import init_tables
+from app.db.config import DB_CONFIG
+from app.db.companies import get_companies, INDEX_TYPES
+from app.db.stock_groups import get_stocks_in_group
+from app.pattern_engine import scan_universe, SCAN_LOOKBACK_DAYS
+
+def parse_args():
+    """
+    解析命令行参数
+    """
+    parser = argparse.ArgumentParser(description='ABot 全市场K线形态扫描工具')
+    parser.add_argument('--db-path', type=str, default=None,
+                        help=f'数据库路径 (默认: {DB_CONFIG["database"]})')
+    parser.add_argument('--index', choices=sorted(INDEX_TYPES), default=None,
+                        help='只扫描指定指数的成分股 (默认: 所有公司)')
+    parser.add_argument('--group', type=int, default=None,
+                        help='只扫描指定分组中的股票')
+    parser.add_argument('--stock-codes', type=str, nargs='*', default=None,
+                        help='指定的股票代码列表，多个股票代码用空格分隔')
+    parser.add_argument('--patterns', type=str, default=None,
+                        help='形态代码，多个用逗号分隔 (默认: 全部形态)')
+    parser.add_argument('--direction', choices=['bullish', 'bearish'], default=None,
+                        help='只显示看涨或看跌信号')
+    parser.add_argument('--sessions', type=int, default=1,
+                        help='扫描最近多少个交易日 (默认: 1)')
+    parser.add_argument('--end-date', type=str, default=None,
+                        help='扫描截止日期 (默认: 当前日期)')
+    parser.add_argument('--adjust', choices=['qfq', 'hfq', 'none'], default='qfq',
+                        help='复权方式 (默认: qfq)')
+    parser.add_argument('--workers', type=int, default=settings.SCAN_WORKERS,
+                        help='并行进程数，0 表示按CPU核数 (默认: settings.SCAN_WORKERS)')
+    parser.add_argument('--shard-size', type=int, default=None,
+                        help='每个进程一次检测的股票数 (默认: 平均分给各进程)')
+    parser.add_argument('--lookback-days', type=int, default=SCAN_LOOKBACK_DAYS,
+                        help=f'读取的历史数据范围，自然日 (默认: {SCAN_LOOKBACK_DAYS})')
+    parser.add_argument('--limit', type=int, default=50,
+                        help='最多返回的信号数，0 表示全部 (默认: 50)')
+    parser.add_argument('--json', action='store_true',
+                        help='以 JSON 输出结果')
+    return parser.parse_args()
+
+def main(args):
+    """
+    程序主入口
+    """
+    if args.db_path:
+        DB_CONFIG['database'] = os.path.abspath(args.db_path)
+    init_tables()
+
+    if args.stock_codes:
+        stock_codes = args.stock_codes
+    elif args.group is not None:
+        stock_codes = [code.split('.')[0] for code in get_stocks_in_group(args.group)]
+        if args.index:
+            constituents = set(get_companies(args.index))
+            stock_codes = [code for code in stock_codes if code in constituents]
+    else:
+        stock_codes = get_companies(args.index)
+
+    patterns = None
+    if args.patterns:
+        patterns = [p.strip().upper() for p in args.patterns.split(',') if p.strip()]
+
+    results = scan_universe(stock_codes, sessions=args.sessions, patterns=patterns, direction=args.direction,
+                            end_date=args.end_date, adjust=args.adjust, workers=args.workers,
+                            shard_size=args.shard_size, lookback_days=args.lookback_days, limit=args.limit)
+    if args.json:
+        print(json.dumps(results, ensure_ascii=False, indent=2))
+        return
+
+    for item in results['signals']:
+        print(f"{item['date']}  {item['stock_code']}  {item['signal']:+d}  {item['direction']:<7}  "
+              f"{item['pattern']} {item['name']}")
+    print(f"\n=== 扫描完成 ===")
+    print(f"股票数: {results['stocks']}, 交易日: {', '.join(results['dates'])}, 信号数: {results['total']}")
+    for i, shard in enumerate(results['shards']):
+        print(f"分片 {i}: {shard['stocks']} 只股票 ({shard['loaded']} 只有数据), "
+              f"读取 {shard['load_seconds']:.2f} 秒, 检测 {shard['detect_seconds']:.2f} 秒, 进程 {shard['pid']}")
+    print(f"进程数: {results['workers']}, 总耗时: {results['elapsed']:.2f} 秒")
+
+if __name__ == "__main__":
+    args = parse_args()
+    main(args)
@@ -3,28 +3,59 @@
 
 import asyncio
 import argparse
+import os
+import time
 from datetime import datetime, timedelta
 from app.task_scheduler import TaskScheduler
 from app.config import settings
 from app.companies_updater import CompaniesUpdater
+from app.symbol_index import refresh_symbols
+from app.db.symbols import get_symbols
+from app.db import init_tables, partitions
+from app.db.config import DB_CONFIG
+from app.data_sources import create_sources
 
 def parse_args():
     """
     解析命令行参数
     """
     parser = argparse.ArgumentParser(description='ABot 股票数据更新工具')
-    parser.add_argument('--db-path', type=str, default=settings.DB_PATH, 
-                        help='数据库路径 (默认: ./data/stock_history.db)')
+    parser.add_argument('--db-path', type=str, default=None,
+                        help=f'数据库路径 (默认: {DB_CONFIG["database"]})')
     parser.add_argument('--max-concurrent', type=int, default=settings.MAX_CONCURRENT, 
                         help=f'最大并发数 (默认: {settings.MAX_CONCURRENT})')
-    parser.add_argument('--start-date', type=str, default=settings.START_DATE, 
+    parser.add_argument('--rate-limit', type=float, default=settings.RATE_LIMIT,
+                        help=f'数据源请求速率上限，次/秒，0 表示不限流 (默认: {settings.RATE_LIMIT})')
+    parser.add_argument('--start-date', type=str, default=None, 
                         help=f'开始日期 (默认: {settings.START_DATE})')
-    parser.add_argument('--end-date', type=str, default=(datetime.now()).strftime('%Y-%m-%d'), 
+    parser.add_argument('--end-date', type=str, default=None, 
                         help='结束日期 (默认: 当前日期)')
     parser.add_argument('--update-companies', type=bool, default=settings.UPDATE_COMPANIES, 
                         help=f'是否更新公司列表 (默认: {settings.UPDATE_COMPANIES})')
     parser.add_argument('--stock-codes', type=str, nargs='*', default=None, 
                         help='指定的股票代码列表，多个股票代码用空格分隔 (默认: 所有公司)')
+    parser.add_argument('--resume', action='store_true',
+                        help='继续最近一次未完成的同步，只重试未完成或失败且已过退避时间的股票')
+    parser.add_argument('--partition-by-year', action='store_true',
+                        help='把历史数据迁移到按年份划分的分区文件，之后按分区读写')
+    parser.add_argument('--freeze-before', type=int, default=None,
+                        help='同步完成后把该年份之前的分区冻结为只读文件')
+    parser.add_argument('--chips', action='store_true',
+                        help='同时增量同步筹码分布')
+    parser.add_argument('--refresh-symbols', action='store_true',
+                        help='重新下载证券代码表 (默认: 仅在代码表为空时下载)')
+    parser.add_argument('--source', choices=['live', 'record', 'fake'], default='live',
+                        help='日K数据源: live 直连, record 直连并录制响应, fake 回放录制或生成模拟数据 (默认: live)')
+    parser.add_argument('--source-dir', type=str, default=None,
+                        help='record/fake 使用的录制目录')
+    parser.add_argument('--fake-latency', type=float, default=0.05,
+                        help='fake 数据源每次请求的平均延迟，秒 (默认: 0.05)')
+    parser.add_argument('--fake-error-rate', type=float, default=0.0,
+                        help='fake 数据源请求失败的概率 (默认: 0)')
+    parser.add_argument('--fake-tail-rate', type=float, default=0.0,
+                        help='fake 数据源请求出现长尾延迟的概率 (默认: 0)')
+    parser.add_argument('--fake-universe', type=int, default=None,
+                        help='fake 数据源下未指定股票代码时生成的股票数量 (默认: 使用公司列表)')
     return parser.parse_args()
 
 async def main(args):
@@ -32,25 +63,63 @@ async def main(args):
     程序主入口
     """
     # 配置参数
-    db_path = args.db_path
+    if args.db_path:
+        DB_CONFIG['database'] = os.path.abspath(args.db_path)
+    db_path = DB_CONFIG['database']
     max_concurrent = args.max_concurrent
-    start_date = args.start_date
-    end_date = args.end_date
+    start_date = args.start_date or settings.START_DATE
+    end_date = args.end_date or datetime.now().strftime('%Y-%m-%d')
+    
+    # 初始化数据库表
+    init_tables()
+    
+    if args.partition_by_year:
+        DB_CONFIG['partition_by_year'] = True
+        moved = partitions.split_table()
+        print(f"已迁移 {moved} 条历史数据到年份分区")
     
     # 创建任务调度器
-    scheduler = TaskScheduler(db_path, max_concurrent)
+    sources = create_sources(args.source, args.source_dir, latency=args.fake_latency,
+                             error_rate=args.fake_error_rate, tail_rate=args.fake_tail_rate)
+    scheduler = TaskScheduler(db_path, max_concurrent, rate_limit=args.rate_limit, sources=sources)
+    
+    stock_codes = args.stock_codes
+    if args.source == 'fake':
+        # 离线运行，不访问网络更新公司列表和证券代码表
+        if not stock_codes and args.fake_universe:
+            stock_codes = [f"{600000 + i:06d}" for i in range(args.fake_universe)]
+    else:
+        # 运行完整更新任务
+        if args.update_companies:
+            CompaniesUpdater(db_path).update_companies()
+        
+        # 证券代码表变化很少，API 服务每天在后台刷新，同步时默认不重复下载
+        if args.refresh_symbols or not get_symbols():
+            try:
+                symbol_count = refresh_symbols()
+                print(f"证券代码表已刷新: {symbol_count} 只")
+            except Exception as e:
+                print(f"刷新证券代码表失败: {e}")
+    
+    started = time.perf_counter()
+    # 传入命令行原样的日期(未指定为 None)，--resume 时调度器据此判断是否与未完成任务的日期范围冲突
+    await scheduler.run_update(args.start_date, args.end_date, stock_codes=stock_codes, resume=args.resume)
+    elapsed = time.perf_counter() - started
     
-    # 运行完整更新任务
-    if args.update_companies:
-        CompaniesUpdater(db_path).update_companies()
+    if args.chips:
+        chip_stats = await scheduler.run_chip_update(stock_codes)
+        print(f"筹码分布同步完成: {chip_stats}")
     
-    await scheduler.run_update(start_date, end_date, stock_codes=args.stock_codes)
+    if args.freeze_before:
+        frozen = partitions.freeze_before(args.freeze_before)
+        print(f"已冻结分区: {frozen}")
     
     # 统计数据库中的数据条数
     count = scheduler.get_stock_count_in_db()
     print(f"\n=== 任务完成 ===")
     print(f"数据库中历史数据总条数: {count}")
     print(f"时间范围: {start_date} 至 {end_date}")
+    print(f"数据源: {args.source}, 同步耗时: {elapsed:.2f} 秒")
     print(f"数据库路径: {db_path}")
 
 if __name__ == "__main__":
@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from app.db import init_tables
+from app.db.config import DB_CONFIG
+from app.db.connection import db
+
+
+def make_bars(stock_code, start='2024-01-01', periods=30, seed=0):
+    """生成测试用日K数据"""
+    rng = np.random.default_rng(seed)
+    dates = pd.bdate_range(start, periods=periods)
+    close = 10 + np.cumsum(rng.normal(0, 0.2, periods))
+    return pd.DataFrame({
+        'date': dates.date,
+        'open': close + rng.normal(0, 0.05, periods),
+        'close': close,
+        'high': close + 0.3,
+        'low': close - 0.3,
+        'amount': rng.integers(1000, 5000, periods).astype(float),
+        'stock_code': stock_code,
+    })
+
+
+def make_ohlcv(n=200, seed=0):
+    rng = np.random.default_rng(seed)
+    c = 10 * np.exp(np.cumsum(rng.normal(0, 0.02, n)))
+    o = c * (1 + rng.normal(0, 0.01, n))
+    h = np.maximum(o, c) * (1 + rng.uniform(0, 0.02, n))
+    l = np.minimum(o, c) * (1 - rng.uniform(0, 0.02, n))
+    v = rng.uniform(1e4, 1e5, n)
+    return o, h, l, c, v
+
+
+def make_trend_ohlcv(n, seed):
+    """带阶段性趋势的随机游走日K，价格保留两位小数，成交量为整数(手)，与下载的数据一致"""
+    rng = np.random.default_rng(seed)
+    drift = np.repeat(rng.normal(0, 0.01, n // 50 + 1), 50)[:n]
+    c = np.round(10 * np.exp(np.cumsum(rng.normal(0, 0.015, n) + drift)), 2)
+    o = np.round(c * (1 + rng.normal(0, 0.008, n)), 2)
+    h = np.round(np.maximum(o, c) * (1 + rng.uniform(0, 0.02, n)), 2)
+    l = np.round(np.minimum(o, c) * (1 - rng.uniform(0, 0.02, n)), 2)
+    v = rng.integers(10000, 100000, n).astype(float)
+    # 停牌日成交量为0
+    v[rng.integers(0, n, 5)] = 0
+    return o, h, l, c, v
+
+
+@pytest.fixture
+def temp_db(tmp_path, monkeypatch):
+    """使用临时数据库文件"""
+    db.close()
+    monkeypatch.setitem(DB_CONFIG, 'database', str(tmp_path / 'stock_history.db'))
+    init_tables()
+    yield
+    db.close()
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+测试复权因子存储与读取时复权
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from app.db import adjust_factors
+from app.db.connection import db
+from app.db.stock_history import save_to_database, get_history, get_histories, get_watermarks, get_data_version
+from app.task_scheduler import TaskScheduler
+from conftest import make_bars
+
+
+def factors(*pairs):
+    return pd.DataFrame({'date': [d for d, _ in pairs], 'factor': [f for _, f in pairs]})
+
+
+def test_history_adjust_modes(temp_db):
+    """不复权数据按因子在读取时复权，前复权的最新价格等于不复权价格"""
+    df = make_bars('600519', start='2024-01-01', periods=20)
+    assert save_to_database(df)
+    assert adjust_factors.save_factors('600519', factors(('2020-01-01', 1.0), ('2024-01-15', 1.2))) == 2
+
+    raw = get_history('600519', limit=None, adjust='none')
+    hfq = get_history('600519', limit=None, adjust='hfq')
+    qfq = get_history('600519', limit=None)
+    assert [row['close'] for row in raw] == pytest.approx(df['close'].tolist())
+
+    split = [row['date'] for row in raw].index('2024-01-15')
+    raw_close = np.array([row['close'] for row in raw])
+    assert [row['close'] for row in hfq] == pytest.approx(np.round(raw_close * np.r_[[1.0] * split, [1.2] * (20 - split)], 2))
+    assert [row['close'] for row in qfq] == pytest.approx(np.round(raw_close * np.r_[[1 / 1.2] * split, [1.0] * (20 - split)], 2))
+    # 成交量不复权
+    assert [row['amount'] for row in qfq] == [row['amount'] for row in raw]
+
+    with pytest.raises(ValueError):
+        get_history('600519', adjust='bad')
+
+
+def test_factor_update_invalidates_cache(temp_db):
+    """新增除权因子只写入变化的行，并使已缓存的复权结果失效"""
+    assert save_to_database(make_bars('000001', start='2024-01-01', periods=20))
+    adjust_factors.save_factors('000001', factors(('2020-01-01', 1.0)))
+    before = get_history('000001', limit=None)
+    version = get_data_version('000001')
+
+    # 重复保存相同的因子不产生写入
+    assert adjust_factors.save_factors('000001', factors(('2020-01-01', 1.0))) == 0
+    assert get_data_version('000001') == version
+
+    assert adjust_factors.save_factors('000001', factors(('2020-01-01', 1.0), ('2024-01-22', 2.0))) == 1
+    assert get_data_version('000001') == version + 1
+    after = get_history('000001', limit=None)
+    assert after[0]['close'] == pytest.approx(round(before[0]['close'] / 2, 2))
+    assert after[-1]['close'] == before[-1]['close']
+
+
+def test_histories_adjust(temp_db):
+    assert save_to_database(pd.concat([make_bars('600000', periods=10), make_bars('600001', periods=10, seed=1)]))
+    adjust_factors.save_factors('600000', factors(('2024-01-05', 1.0), ('2024-01-10', 1.1)))
+
+    raw = get_histories(['600000', '600001'], adjust='none')
+    hfq = get_histories(['600000', '600001'], adjust='hfq')
+    # 早于第一个因子的日期按第一个因子计算
+    expected = np.round(raw['600000']['close'] * np.where(hfq['600000']['date'] >= hfq['600000']['date'][7], 1.1, 1.0), 2)
+    assert np.allclose(hfq['600000']['close'], expected)
+    assert np.array_equal(hfq['600001']['close'], raw['600001']['close'])
+
+
+def test_legacy_qfq_stock_replanned(temp_db):
+    """旧版前复权数据的股票重新全量下载，保存后价格基准变为不复权"""
+    assert save_to_database(make_bars('600519', periods=10))
+    with db.write_cursor() as cursor:
+        cursor.execute("UPDATE stock_watermarks SET price_basis = 'qfq'")
+    marks = get_watermarks(['600519'])
+    assert marks['600519']['price_basis'] == 'qfq'
+
+    scheduler = TaskScheduler('test.db')
+    assert scheduler._plan(['600519'], marks, '2020-01-01', '2024-01-31') == [('600519', '2020-01-01')]
+
+    assert save_to_database(make_bars('600519', periods=10))
+    assert get_watermarks(['600519'])['600519']['price_basis'] == 'raw'
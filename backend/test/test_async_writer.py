@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+测试异步历史数据写入器
+"""
+
+import sys
+import os
+import asyncio
+import threading
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+from app.db import async_writer
+from app.db.async_writer import AsyncHistoryWriter
+from app.db.stock_history import get_history, get_watermarks
+from conftest import make_bars
+
+
+@pytest.mark.asyncio
+async def test_writer_merges_frames_into_transactions(temp_db):
+    """队列中的多批数据合并到同一事务，确认结果按股票返回"""
+    codes = [f'6000{i:02d}' for i in range(10)]
+    async with AsyncHistoryWriter(batch_seconds=0.2) as writer:
+        acks = [await writer.submit(make_bars(code, periods=5, seed=i)) for i, code in enumerate(codes)]
+        results = await asyncio.gather(*acks)
+
+    assert results[0] == {'600000': {'inserted': 5, 'updated': 0}}
+    assert writer.transactions < len(codes)
+    assert set(get_watermarks(codes)) == set(codes)
+    assert len(get_history('600009', limit=None)) == 5
+
+
+@pytest.mark.asyncio
+async def test_writer_backpressure(temp_db, monkeypatch):
+    """写线程阻塞时，待写入数据达到上限后提交方等待"""
+    gate = threading.Event()
+    original = async_writer.save_many
+
+    def slow_save_many(frames, **kwargs):
+        gate.wait()
+        return original(frames, **kwargs)
+
+    monkeypatch.setattr(async_writer, 'save_many', slow_save_many)
+    async with AsyncHistoryWriter(max_pending=2, batch_seconds=0) as writer:
+        first = await writer.submit(make_bars('600519', periods=3))
+        await writer.submit(make_bars('000001', periods=3))
+        third = asyncio.ensure_future(writer.submit(make_bars('000002', periods=3)))
+        await asyncio.sleep(0.1)
+        assert not third.done()
+
+        gate.set()
+        assert await first == {'600519': {'inserted': 3, 'updated': 0}}
+        await asyncio.wait_for(third, timeout=5)
+
+    assert set(get_watermarks()) == {'600519', '000001', '000002'}
+
+
+@pytest.mark.asyncio
+async def test_writer_reports_failure(temp_db, monkeypatch):
+    monkeypatch.setattr(async_writer, 'save_many', lambda frames, **kwargs: None)
+    async with AsyncHistoryWriter() as writer:
+        assert await writer.save(make_bars('600519', periods=3)) is None
+
+
+@pytest.mark.asyncio
+async def test_writer_retries_frames_after_failed_transaction(temp_db):
+    """合并的事务因一批坏数据失败时，其余数据逐批重试并正常写入"""
+    bad = make_bars('000001', periods=3)
+    bad['date'] = ['2024-01-02', 'not a date', '2024-01-04']
+    async with AsyncHistoryWriter(batch_seconds=0.2) as writer:
+        acks = [await writer.submit(make_bars('600519', periods=3)), await writer.submit(bad),
+                await writer.submit(make_bars('000002', periods=3))]
+        results = await asyncio.gather(*acks)
+
+    assert results == [{'600519': {'inserted': 3, 'updated': 0}}, None, {'000002': {'inserted': 3, 'updated': 0}}]
+    assert writer.transactions == 4
+    assert set(get_watermarks()) == {'600519', '000002'}
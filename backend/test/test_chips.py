@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+测试筹码分布存储与增量同步
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from app.db import chips, adjust_factors
+from app.data_sources import FakeSource, synthetic_bars, synthetic_chips
+from app.task_scheduler import TaskScheduler
+from app.db.dates import to_day
+from app import trading_calendar
+
+
+@pytest.fixture(autouse=True)
+def offline_calendar(monkeypatch):
+    def fail():
+        raise ConnectionError('offline')
+
+    monkeypatch.setattr(trading_calendar, 'fetch_trading_days', fail)
+    trading_calendar.reset()
+    yield
+    trading_calendar.reset()
+
+
+def test_save_and_read_chips(temp_db):
+    df = synthetic_chips('sh600519', end_date='2024-03-29', days=30)
+    assert chips.save_chips('600519', df) == 30
+    # 重复保存未变化的数据不产生写入
+    assert chips.save_chips('600519', df) == 0
+
+    marks = chips.get_watermarks(['600519', '000001'])
+    assert marks == {'600519': {'first_date': str(df['date'].iloc[0]), 'last_date': '2024-03-29', 'row_count': 30}}
+
+    rows = chips.get_chips('600519', start_date='2024-03-01', adjust='none')
+    assert rows[-1]['date'] == '2024-03-29'
+    assert rows[-1]['avg_cost'] == pytest.approx(df['avg_cost'].iloc[-1])
+    assert set(rows[0]) == {'date', *chips.CHIP_COLUMNS}
+
+
+def test_chip_costs_adjusted(temp_db):
+    df = synthetic_chips('sh600000', end_date='2024-03-29', days=20)
+    chips.save_chips('600000', df)
+    adjust_factors.save_factors('600000', pd.DataFrame({'date': ['2020-01-01', '2024-03-20'], 'factor': [1.0, 2.0]}))
+
+    raw = chips.get_chip_histories(['600000'], adjust='none')['600000']
+    qfq = chips.get_chip_histories(['600000'])['600000']
+    before = raw['date'] < to_day('2024-03-20')
+    assert np.allclose(qfq['avg_cost'][before], np.round(raw['avg_cost'][before] / 2, 2))
+    assert qfq['avg_cost'][-1] == round(raw['avg_cost'][-1], 2)
+    # 比例类字段不复权
+    assert np.array_equal(qfq['profit_ratio'], raw['profit_ratio'])
+
+
+@pytest.mark.asyncio
+async def test_incremental_chip_sync(temp_db):
+    """已同步到最近交易日的股票跳过，其余只写入水位之后的数据"""
+    session = trading_calendar.last_completed_session()
+    scheduler = TaskScheduler('test.db', max_concurrent=4, rate_limit=0, sources=[FakeSource(latency=0)])
+    # 600000 已是最新，600001 缺少最近 5 个交易日
+    chips.save_chips('600000', synthetic_chips('sh600000', end_date=session))
+    partial = synthetic_chips('sh600001', end_date=session).iloc[:-5]
+    chips.save_chips('600001', partial)
+
+    stats = await scheduler.run_chip_update(['600000', '600001', '600002'])
+    assert stats == {'updated': 2, 'skipped': 1, 'failed': 0, 'rows': 5 + 90}
+    marks = chips.get_watermarks(['600000', '600001', '600002'])
+    assert {mark['last_date'] for mark in marks.values()} == {session}
+
+
+def test_scan_stocks_with_chips(temp_db, monkeypatch):
+    """筹码分布对齐到K线交易日后作为批量检测的输入，停牌日与价格一起压缩"""
+    from app import pattern_engine
+    from app.db.stock_history import save_many
+
+    bars = synthetic_bars('sh600519', '20240101', '20240229').assign(stock_code='600519')
+    # 000001 在 2024-02-05 停牌
+    other = synthetic_bars('sz000001', '20240101', '20240229').assign(stock_code='000001')
+    save_many([bars, other[other['date'].astype(str) != '2024-02-05']])
+    df = synthetic_chips('sh600519', end_date='2024-02-29', days=20)
+    chips.save_chips('600519', df)
+    chips.save_chips('000001', synthetic_chips('sz000001', end_date='2024-02-29', days=20))
+
+    seen = {}
+    original = pattern_engine.BatchPatternDetector
+
+    def spy(*args, **kwargs):
+        seen.update(kwargs['chips'])
+        return original(*args, **kwargs)
+
+    monkeypatch.setattr(pattern_engine, 'BatchPatternDetector', spy)
+    result = pattern_engine.scan_stocks(['600519', '000001'], patterns=['SHORT_TERM_BULL'], adjust='none', chips=True)
+    panel = result['chips']
+    assert set(panel) == set(chips.CHIP_COLUMNS)
+    assert panel['avg_cost'].shape == (2, len(result['dates']))
+
+    row = result['stocks'].index('600519')
+    has_chips = ~np.isnan(panel['avg_cost'][row])
+    assert has_chips.sum() == 20
+    assert panel['avg_cost'][row, has_chips] == pytest.approx(df['avg_cost'].to_numpy())
+    assert not has_chips[:-20].any()
+
+    # 检测器收到的筹码矩阵与价格一样把停牌日移到开头
+    row = result['stocks'].index('000001')
+    assert np.isnan(seen['avg_cost'][row, 0])
+    assert np.isnan(seen['avg_cost'][row]).sum() == np.isnan(panel['avg_cost'][row]).sum() + 1
+
+    assert 'chips' not in pattern_engine.scan_stocks(['600519'], patterns=['SHORT_TERM_BULL'])
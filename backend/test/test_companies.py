@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+测试成分股数据更新
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.db.companies import update_companies_from_data, get_companies_with_details, get_company_changes
+from app.db.connection import db
+
+
+def make_stock(code, type_='1', close=10.0):
+    return {
+        'SECUCODE': f'{code}.SH', 'SECURITY_CODE': code, 'TYPE': type_,
+        'SECURITY_NAME_ABBR': f'股票{code}', 'CLOSE_PRICE': close, 'INDUSTRY': '银行',
+        'REGION': '上海', 'WEIGHT': None, 'EPS': 1.0, 'BPS': 5.0, 'ROE': 0.1,
+        'TOTAL_SHARES': 1e9, 'FREE_SHARES': 8e8, 'FREE_CAP': 8e9, 'f2': close, 'f3': 0.5,
+    }
+
+
+def test_update_companies_writes_only_changes(temp_db):
+    hs300 = [make_stock('600000'), make_stock('600001'), make_stock('600002')]
+    csi500 = [make_stock('000001', type_='3')]
+    assert update_companies_from_data(hs300)
+    assert update_companies_from_data(csi500)
+    ids = {row['security_code']: row['id'] for row in get_companies_with_details()}
+
+    # data_version 在其他连接提交写入后变化，用只读连接观察写连接是否写入
+    cursor = db.get_cursor()
+    version = cursor.execute('PRAGMA data_version').fetchone()[0]
+    assert update_companies_from_data(hs300)
+    # 数据未变化时不写入任何行
+    assert cursor.execute('PRAGMA data_version').fetchone()[0] == version
+    assert len(get_company_changes()) == 4
+
+    # 600001 价格变化，600002 调出，600003 调入；中证500 成分股不受影响
+    refreshed = [make_stock('600000'), make_stock('600001', close=11.0), make_stock('600003')]
+    assert update_companies_from_data(refreshed)
+
+    rows = {row['security_code']: row for row in get_companies_with_details()}
+    assert set(rows) == {'600000', '600001', '600003', '000001'}
+    assert rows['600001']['close_price'] == 11.0
+    assert rows['600001']['id'] == ids['600001']
+    assert rows['600000']['weight'] == 0.0
+
+    changes = [(c['security_code'], c['change']) for c in get_company_changes()]
+    assert ('600002', 'removed') in changes
+    assert ('600003', 'added') in changes
+    assert ('000001', 'removed') not in changes
@@ -0,0 +1,33 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+测试自定义形态检测器的指标按需计算
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.custom_pattern import CustomPatternDetector
+from app.pattern_dector import PatternDector
+from conftest import make_ohlcv
+
+
+def test_indicators_computed_on_demand():
+    """只计算所检测形态读取的指标，依赖先于指标本身计算"""
+    dector = PatternDector(*make_ohlcv())
+    dector.detect_patterns(['BACKTEST_MA5'])
+    assert set(dector.indicator_stats()) == {'ma5', 'close_prev'}
+
+    dector.detect_patterns(['THREE_GOLDEN_CROSSES'])
+    assert {'macd', 'diff', 'dea', 'vma5', 'vma10', 'ma10'} <= set(dector.indicator_stats())
+    assert 'ma60' not in dector.indicator_stats()
+
+    detector = CustomPatternDetector(*make_ohlcv())
+    assert detector.indicator_deps('natr') == ('atr',)
+    natr = detector.natr
+    assert list(detector.indicator_stats()) == ['atr', 'natr']
+    # 已计算的指标直接读取缓存
+    assert detector.natr is natr
+    assert set(CustomPatternDetector.indicator_names()) >= {'ma5', 'ma60', 'atr', 'low_pos', 'high_pos'}
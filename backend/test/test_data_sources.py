@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+测试数据源录制与回放
+"""
+
+import sys
+import os
+import time
+import asyncio
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pandas as pd
+import pytest
+
+from app.data_sources import DataSource, RecordingSource, FakeSource, synthetic_bars, normalize_bars
+from app.stock_downloader import StockDownloader
+from app.task_scheduler import TaskScheduler
+from app import trading_calendar
+from app.db.stock_history import get_watermarks
+from app.db.adjust_factors import get_factors
+
+
+class StaticSource(DataSource):
+    """返回固定数据并记录调用次数的数据源，可指定延迟、失败或返回空数据"""
+
+    def __init__(self, name='static', delay=0.0, error=None, empty=False):
+        self.name = name
+        self.delay = delay
+        self.error = error
+        self.empty = empty
+        self.calls = 0
+        self.cancelled = 0
+
+    async def daily_bars(self, symbol, start_date, end_date):
+        self.calls += 1
+        try:
+            await asyncio.sleep(self.delay)
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        if self.error:
+            raise self.error
+        if self.empty:
+            return normalize_bars(None, {})
+        return synthetic_bars(symbol, start_date, end_date).assign(close=1.5)
+
+
+@pytest.mark.asyncio
+async def test_record_then_replay(tmp_path):
+    """录制的响应可以离线回放，相同内容只存一份"""
+    inner = StaticSource()
+    recorder = RecordingSource(inner, str(tmp_path))
+    recorded = await recorder.daily_bars('sh600000', '20240101', '20240131')
+    await recorder.daily_bars('sh600000', '20240101', '20240131')
+    assert inner.calls == 2
+    assert len(os.listdir(tmp_path / 'blobs')) == 1
+
+    replay = FakeSource(cache_dir=str(tmp_path), recorded_name='static', latency=0)
+    replayed = await replay.daily_bars('sh600000', '20240101', '20240131')
+    pd.testing.assert_frame_equal(replayed, recorded)
+    assert (replayed['close'] == 1.5).all()
+
+    # 未录制的请求使用模拟数据
+    other = await replay.daily_bars('sh600001', '20240101', '20240131')
+    assert (other['close'] != 1.5).all()
+
+
+@pytest.mark.asyncio
+async def test_synthetic_bars_consistent():
+    """模拟数据只取决于代码和日期，增量请求与全量请求一致"""
+    full = synthetic_bars('sz000001', '20240101', '20240331')
+    tail = synthetic_bars('sz000001', '20240301', '20240331')
+    assert len(full) == 65
+    pd.testing.assert_frame_equal(full[full['date'].astype(str) >= '2024-03-01'].reset_index(drop=True), tail)
+    assert (full['high'] >= full[['open', 'close']].max(axis=1)).all()
+    assert (full['low'] <= full[['open', 'close']].min(axis=1)).all()
+
+
+@pytest.mark.asyncio
+async def test_fake_source_error_rate():
+    source = FakeSource(latency=0, error_rate=1.0, seed=1)
+    with pytest.raises(ConnectionError):
+        await source.daily_bars('sh600000', '20240101', '20240131')
+
+
+@pytest.mark.asyncio
+async def test_downloader_uses_source():
+    downloader = StockDownloader(sources=[FakeSource(latency=0)])
+    df = await downloader.get_stock_historical_data('600000', '2024-01-01', '2024-01-31')
+    assert len(df) == 23
+    assert list(df.columns[:2]) == ['date', 'open']
+    assert (df['stock_code'] == '600000').all()
+
+
+@pytest.mark.asyncio
+async def test_offline_sync_with_fake_source(temp_db, monkeypatch):
+    """fake 数据源下完整同步不访问网络"""
+    def fail():
+        raise ConnectionError('offline')
+
+    monkeypatch.setattr(trading_calendar, 'fetch_trading_days', fail)
+    trading_calendar.reset()
+    codes = [f'6000{i:02d}' for i in range(20)]
+    scheduler = TaskScheduler(temp_db, max_concurrent=8, rate_limit=0, sources=[FakeSource(latency=0.01)])
+    await scheduler.run_update('2024-01-01', '2024-01-31', stock_codes=codes)
+    trading_calendar.reset()
+
+    marks = get_watermarks(codes)
+    assert set(marks) == set(codes)
+    assert all(mark['row_count'] == 23 for mark in marks.values())
+    # 有新K线的股票同时同步复权因子
+    assert set(get_factors(codes)) == set(codes)
+
+
+@pytest.mark.asyncio
+async def test_hedged_request_first_response_wins():
+    """主数据源超过对冲等待时间后请求备用数据源，采用先返回的结果，慢请求在后台执行完毕"""
+    slow = StaticSource('hedge_slow', delay=0.3)
+    fast = StaticSource('hedge_fast', delay=0.01)
+    downloader = StockDownloader(sources=[slow, fast], hedge_delay=0.05)
+    start = time.monotonic()
+    df = await downloader.get_stock_historical_data('600000', '2024-01-01', '2024-01-31')
+    assert time.monotonic() - start < 0.25
+    assert len(df) == 23
+    assert (slow.calls, fast.calls) == (1, 1)
+    assert (downloader.hedges, downloader.hedge_wins) == (1, 1)
+    # 慢请求无法中止，执行完毕前仍占用并发名额
+    assert downloader.controllers['hedge_slow'].stats()['in_flight'] == 1
+    await downloader.drain()
+    assert slow.cancelled == 0
+    stats = downloader.controllers['hedge_slow'].stats()
+    assert (stats['errors'], stats['in_flight']) == (0, 0)
+
+
+@pytest.mark.asyncio
+async def test_hedges_capped():
+    """后台未结束的额外请求达到上限时不再发起对冲"""
+    slow = StaticSource('capped_slow', delay=0.2)
+    fast = StaticSource('capped_fast', delay=0.01)
+    downloader = StockDownloader(sources=[slow, fast], hedge_delay=0.02, max_hedges=1)
+    results = await asyncio.gather(*[
+        downloader.get_stock_historical_data(code, '2024-01-01', '2024-01-31') for code in ('600000', '600001')
+    ])
+    assert all(len(df) == 23 for df in results)
+    assert (slow.calls, fast.calls, downloader.hedges) == (2, 1, 1)
+    await downloader.drain()
+
+
+@pytest.mark.asyncio
+async def test_failover_on_error():
+    """主数据源出错时立即切换到下一个数据源"""
+    broken = StaticSource('failover_broken', error=ConnectionError('boom'))
+    good = StaticSource('failover_good')
+    downloader = StockDownloader(sources=[broken, good], hedge_delay=10)
+    df = await downloader.get_stock_historical_data('000001', '2024-01-01', '2024-01-31')
+    assert len(df) == 23
+    assert (broken.calls, good.calls) == (1, 1)
+    assert downloader.hedges == 0
+
+
+@pytest.mark.asyncio
+async def test_empty_response_is_final():
+    """数据源正常返回空数据(如停牌)即为结果，不再请求其他数据源"""
+    broken = StaticSource('final_broken', error=ConnectionError('boom'))
+    empty = StaticSource('final_empty', empty=True)
+    good = StaticSource('final_good')
+    downloader = StockDownloader(sources=[broken, empty, good], hedge_delay=10)
+    df = await downloader.get_stock_historical_data('000001', '2024-01-01', '2024-01-31')
+    assert df.empty
+    assert (broken.calls, empty.calls, good.calls) == (1, 1, 0)
+
+
+@pytest.mark.asyncio
+async def test_all_sources_empty_not_retried():
+    sources = [StaticSource(f'all_empty_{i}', empty=True) for i in range(3)]
+    downloader = StockDownloader(sources=sources, hedge_delay=10)
+    df = await downloader.get_stock_historical_data('000001', '2024-01-01', '2024-01-31')
+    assert df.empty
+    assert [source.calls for source in sources] == [1, 0, 0]
+
+
+def test_normalize_sina_volume():
+    raw = pd.DataFrame({'date': ['2024-01-02'], 'open': [1.0], 'high': [1.2], 'low': [0.9], 'close': [1.1],
+                        'volume': [12300.0], 'amount': [13530.0]})
+    df = normalize_bars(raw, {'volume': 'amount', 'amount': 'turnover'}, volume_scale=0.01)
+    assert list(df.columns) == ['date', 'open', 'close', 'high', 'low', 'amount']
+    assert df['amount'].iloc[0] == 123.0
+    assert df['close'].iloc[0] == 1.1
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+测试数据库连接池
+"""
+
+import sys
+import os
+import sqlite3
+import threading
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+from app.db.connection import db
+from app.db.stock_groups import create_group, get_all_groups
+
+
+def test_wal_mode(temp_db):
+    cursor = db.get_cursor()
+    assert cursor.execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+
+
+def test_reader_per_thread(temp_db):
+    """每个线程使用独立的只读连接"""
+    conns = []
+    barrier = threading.Barrier(4)
+
+    def worker():
+        conns.append(db.connect())
+        barrier.wait()
+
+    threads = [threading.Thread(target=worker) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    conns.append(db.connect())
+    assert len({id(c) for c in conns}) == 5
+
+
+def test_reader_is_read_only(temp_db):
+    with pytest.raises(sqlite3.OperationalError):
+        db.get_cursor().execute("INSERT INTO stock_groups (name) VALUES ('x')")
+
+
+def test_read_during_write(temp_db):
+    """写事务未提交时，其他线程仍可读取已提交的数据"""
+    assert create_group('自选') > 0
+    results = []
+
+    with db.write_cursor() as cursor:
+        cursor.execute("INSERT INTO stock_groups (name) VALUES ('未提交')")
+        t = threading.Thread(target=lambda: results.append(get_all_groups()))
+        t.start()
+        t.join(timeout=5)
+
+    assert [g['name'] for g in results[0]] == ['自选']
+    assert len(get_all_groups()) == 2
+
+
+def test_write_rollback_on_error(temp_db):
+    with pytest.raises(RuntimeError):
+        with db.write_cursor() as cursor:
+            cursor.execute("INSERT INTO stock_groups (name) VALUES ('回滚')")
+            raise RuntimeError('boom')
+    assert get_all_groups() == []
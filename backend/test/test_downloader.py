@@ -29,7 +29,7 @@ async def test_get_stock_historical_data(stock_downloader):
     assert df['stock_code'].iloc[0] == '302132'
 
 @pytest.mark.asyncio
-async def test_search_stocks(stock_downloader):
+async def test_search_stocks(stock_downloader, temp_db):
     """测试搜索股票功能"""
     # 测试搜索股票功能
     search_result = await stock_downloader.search_stocks('茅台')
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+测试向量化的老鸭头形态与向量化之前的结果一致
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from app.custom_pattern import CustomPatternDetector
+from conftest import make_trend_ohlcv
+
+
+# 向量化之前(逐日循环版本)的 OLD_DUCK_HEAD / OLD_DUCK_HEAD_LIKE 在 make_trend_ohlcv(800, seed) 上的输出，
+# 记录为出现形态的下标(seed 0 开头三天收盘价缺失)
+BASELINE_SIGNALS = {
+    0: ([], []),
+    1: ([], []),
+    2: ([], [754, 755, 756, 757]),
+    3: ([156, 157, 158, 159], [156, 157, 158, 159]),
+    4: ([], []),
+    5: ([], []),
+    6: ([206], [205, 206, 481, 482, 483, 484]),
+    7: ([], []),
+    8: ([], []),
+    9: ([], []),
+    10: ([], []),
+    11: ([], [636, 637, 638, 639, 645, 646, 647, 648]),
+    12: ([], []),
+    13: ([295, 296, 297, 298], [153, 154, 155, 156, 172, 173, 174, 175, 295, 296, 297, 298, 481, 482, 483, 484]),
+    14: ([], []),
+    15: ([278, 279, 280, 281], [278, 279, 280, 281]),
+    16: ([125, 126, 127, 128], [125, 126, 127, 128]),
+    17: ([], []),
+    18: ([], []),
+    19: ([], []),
+    20: ([], []),
+    21: ([], []),
+    22: ([], []),
+    23: ([], []),
+}
+
+
+def loop_duck_head(d: CustomPatternDetector, like: bool) -> np.ndarray:
+    """逐日循环的参考实现，与向量化之前的 OLD_DUCK_HEAD / OLD_DUCK_HEAD_LIKE 逻辑相同"""
+    n = d.n
+    ma5, ma10, ma60 = d.ma5, d.ma10, d.ma60
+    idx = pd.Series(range(n))
+    gold_cross = (ma5 > ma10) & (ma5.shift(1) <= ma10.shift(1))
+    dead_cross = (ma5 < ma10) & (ma5.shift(1) >= ma10.shift(1))
+    neck_cross = (ma5 > ma60) & (ma5.shift(1) <= ma60.shift(1))
+    last_dead = idx.where(dead_cross).ffill()
+    last_gold = idx.where(gold_cross).ffill()
+    last_neck = idx.where(neck_cross).ffill()
+
+    if like:
+        pct = (ma60 - ma60.shift(10)) / ma60.shift(10)
+        trend = ((pct > 0) | ((pct > -0.005) & (d.c > ma60))).fillna(False)
+    else:
+        trend = (ma60 - ma60.shift(10) > 0).fillna(False)
+    recent_gold = gold_cross.rolling(4).max()
+    neck_before_dead = last_neck < last_dead
+    diff_days = last_gold - last_dead
+    sequence = (diff_days > 0) & (diff_days < 20)
+
+    support, shrink, height, neck_ok, platform = (pd.Series(False, index=idx.index) for _ in range(5))
+    for i in range(n):
+        dead, gold, neck = last_dead.iloc[i], last_gold.iloc[i], last_neck.iloc[i]
+        if not pd.isna(dead) and not pd.isna(gold) and dead <= gold:
+            dead_i, gold_i = int(dead), int(gold)
+            support.iloc[i] = (d.l.iloc[dead_i:gold_i + 1] > ma60.iloc[dead_i:gold_i + 1] * 0.98).mean() >= 0.9
+            head_vol = d.v.iloc[dead_i:gold_i + 1]
+            under = (head_vol < d.vma20.iloc[dead_i:gold_i + 1]).mean()
+            if not like:
+                shrink.iloc[i] = under >= 0.6
+            else:
+                neck_vol = d.v.iloc[max(0, dead_i - max(15, gold_i - dead_i)):dead_i]
+                if not neck_vol.empty:
+                    shrink.iloc[i] = head_vol.mean() < neck_vol.mean() * 0.7 or under >= 0.5
+        if not pd.isna(dead) and dead >= 10:
+            dead_i = int(dead)
+            pre = d.c.iloc[dead_i - 10]
+            if pre != 0:
+                height.iloc[i] = (d.c.iloc[dead_i] - pre) / pre * 100 >= 5
+            highs = d.h.iloc[dead_i - 10:dead_i - 4]
+            if highs.min() != 0:
+                platform.iloc[i] = (highs.max() - highs.min()) / highs.min() * 100 <= (15 if like else 10)
+        if not pd.isna(neck) and not pd.isna(dead) and neck < dead:
+            neck_ok.iloc[i] = (ma5.iloc[int(neck):int(dead) + 1] > ma60.iloc[int(neck):int(dead) + 1] * 0.95).all()
+
+    final = trend & recent_gold & neck_before_dead & sequence & support & shrink & height & neck_ok & platform
+    return final.fillna(0).astype(int).values
+
+
+@pytest.mark.parametrize('seed', range(8))
+def test_vectorized_matches_loops(seed):
+    o, h, l, c, v = make_trend_ohlcv(800, seed)
+    if seed == 0:
+        # 开头缺失的价格
+        c[:3] = np.nan
+    detector = CustomPatternDetector(o, h, l, c, v)
+    detector._debug = False
+    assert np.array_equal(detector.OLD_DUCK_HEAD(), loop_duck_head(detector, like=False))
+    assert np.array_equal(detector.OLD_DUCK_HEAD_LIKE(), loop_duck_head(detector, like=True))
+
+
+@pytest.mark.parametrize('seed', sorted(BASELINE_SIGNALS))
+def test_matches_baseline_outputs(seed):
+    o, h, l, c, v = make_trend_ohlcv(800, seed)
+    if seed == 0:
+        c[:3] = np.nan
+    detector = CustomPatternDetector(o, h, l, c, v)
+    detector._debug = False
+    duck_head, duck_head_like = BASELINE_SIGNALS[seed]
+    assert np.flatnonzero(detector.OLD_DUCK_HEAD()).tolist() == duck_head
+    assert np.flatnonzero(detector.OLD_DUCK_HEAD_LIKE()).tolist() == duck_head_like
+
+
+def test_patterns_found():
+    """测试数据中确实出现了形态，避免等价性测试只比较全零结果"""
+    found = [0, 0]
+    for seed in range(8):
+        detector = CustomPatternDetector(*make_trend_ohlcv(800, seed))
+        detector._debug = False
+        found[0] += detector.OLD_DUCK_HEAD().sum()
+        found[1] += detector.OLD_DUCK_HEAD_LIKE().sum()
+    assert found[0] > 0 and found[1] > found[0]
+
+
+def test_short_series():
+    detector = CustomPatternDetector(*make_trend_ohlcv(8, 1))
+    detector._debug = False
+    assert detector.OLD_DUCK_HEAD().tolist() == [0] * 8
+    assert detector.OLD_DUCK_HEAD_LIKE().tolist() == [0] * 8
@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+测试按年份分区的历史数据存储
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import sqlite3
+import numpy as np
+import pandas as pd
+import pytest
+
+from app.db import columnar, partitions, stock_history
+from app.db.connection import db
+from app.db.config import DB_CONFIG
+from app.db.stock_history import (
+    save_many, get_history, get_histories, get_watermarks, get_stock_count, get_latest_date
+)
+from conftest import make_bars
+
+
+@pytest.fixture
+def partitioned(temp_db, monkeypatch):
+    monkeypatch.setitem(DB_CONFIG, 'partition_by_year', True)
+    monkeypatch.setitem(DB_CONFIG, 'partition_workers', 1)
+    yield
+    partitions.close()
+
+
+def test_partitioned_roundtrip(partitioned):
+    """跨年数据写入各年份分区，读取结果与写入一致"""
+    a = make_bars('600519', start='2023-12-01', periods=40)
+    b = make_bars('000001', start='2023-12-20', periods=10, seed=1)
+    stats = save_many([a, b])
+    assert stats['inserted'] == 50
+    assert sorted(partitions.list_partitions()) == [2023, 2024]
+    assert get_stock_count() == 50
+
+    rows = get_history('600519', limit=None)
+    assert [r['date'] for r in rows] == [str(d) for d in a['date']]
+    assert np.allclose([r['close'] for r in rows], a['close'])
+    assert len(get_history('600519', limit=25)) == 25
+
+    marks = get_watermarks(['600519'])['600519']
+    assert marks['first_date'] == '2023-12-01'
+    assert marks['row_count'] == 40
+    assert get_latest_date('600519') == str(a['date'].iloc[-1])
+
+    # 再次写入重叠数据只统计变化
+    stats = save_many([a.iloc[-5:]])
+    assert stats['stocks']['600519'] == {'inserted': 0, 'updated': 0}
+
+    os.remove(columnar._path('000001'))
+    result = get_histories(['600519', '000001'], '2023-12-25', '2024-01-10', fields=['close'])
+    assert len(result['000001']['date']) == len(get_history('000001', '2023-12-25', '2024-01-10', limit=None))
+    assert len(columnar.get_history_arrays('600519')['date']) == 40
+
+
+def test_queries_only_touch_covering_partitions(partitioned):
+    save_many([make_bars('600519', start='2022-12-01', periods=300)])
+    assert sorted(partitions.list_partitions()) == [2022, 2023, 2024]
+    partitions.close()
+
+    get_history('600519', '2023-03-01', '2023-06-01', limit=None)
+    opened = {path for _, path in partitions._readers}
+    assert opened == {partitions.list_partitions()[2023]}
+
+
+def test_parallel_partition_writes(partitioned, monkeypatch):
+    """数据量大时多个年份分区由进程池并行写入，进程池在多次写入间复用"""
+    monkeypatch.setitem(DB_CONFIG, 'partition_workers', 2)
+    monkeypatch.setitem(DB_CONFIG, 'partition_parallel_rows', 100)
+    df = make_bars('600519', start='2022-06-01', periods=400)
+    try:
+        assert save_many([df])['inserted'] == 400
+        pool = partitions._pool
+        assert pool is not None
+        assert save_many([make_bars('000001', start='2022-06-01', periods=400)])['inserted'] == 400
+        assert partitions._pool is pool
+    finally:
+        partitions.shutdown_pool()
+    assert len(get_history('600519', limit=None)) == 400
+
+
+def test_small_writes_stay_in_process(partitioned, monkeypatch):
+    monkeypatch.setitem(DB_CONFIG, 'partition_workers', 2)
+    save_many([make_bars('600519', start='2023-12-01', periods=40)])
+    assert partitions._pool is None
+
+
+def test_failed_partition_keeps_watermark_consistent(partitioned, monkeypatch):
+    """部分年份写入失败时，水位与已写入分区的数据一致"""
+    write_year = partitions._write_year
+
+    def fail_2024(path, grouped, replace=()):
+        if '2024' in os.path.basename(path):
+            raise sqlite3.OperationalError('disk I/O error')
+        return write_year(path, grouped, replace)
+
+    monkeypatch.setattr(partitions, '_write_year', fail_2024)
+    df = make_bars('600519', start='2023-12-01', periods=40)
+    assert save_many([df]) is None
+    marks = get_watermarks(['600519'])['600519']
+    written = int((df['date'] < pd.Timestamp('2024-01-01').date()).sum())
+    assert marks['row_count'] == written
+    assert len(get_history('600519', limit=None)) == written
+
+    monkeypatch.setattr(partitions, '_write_year', write_year)
+    assert save_many([df])['inserted'] == 40 - written
+    assert get_watermarks(['600519'])['600519']['row_count'] == 40
+
+
+def test_partition_listing_sees_other_processes(partitioned):
+    save_many([make_bars('600519', start='2023-12-01', periods=5)])
+    assert list(partitions.list_partitions()) == [2023]
+    # 其他进程新建的分区文件
+    sqlite3.connect(os.path.join(partitions.partition_dir(), 'stock_history_2025.db')).close()
+    assert list(partitions.list_partitions()) == [2023, 2025]
+
+
+def test_split_existing_table(temp_db):
+    """已有数据迁移到分区后自动按分区读写"""
+    df = make_bars('600519', start='2023-12-01', periods=40)
+    save_many([df])
+    assert not partitions.enabled()
+    try:
+        assert partitions.split_table() == 40
+        assert partitions.enabled()
+        assert len(get_history('600519', limit=None)) == 40
+        assert get_stock_count() == 40
+    finally:
+        partitions.close()
+
+
+def test_frozen_partition_is_read_only(partitioned):
+    df = make_bars('600519', start='2023-12-01', periods=40)
+    save_many([df])
+    assert partitions.freeze_before(2024) == [2023]
+    path = partitions.list_partitions()[2023]
+    assert partitions.is_frozen(path)
+
+    assert len(get_history('600519', limit=None)) == 40
+    # 冻结年份不允许写入，未冻结年份正常写入
+    assert save_many([df.iloc[:5].assign(close=1.0)]) is None
+    assert save_many([make_bars('000001', start='2024-03-01', periods=5)])['inserted'] == 5
+
+
+def test_replace_rolls_back_failed_partition(partitioned, monkeypatch):
+    """整体替换的股票: 分区写事务失败时该分区的旧数据保留，价格基准仍为前复权以便下次重新替换"""
+    old = make_bars('600519', start='2023-12-01', periods=40)
+    assert save_many([old.assign(close=old['close'] * 0.5)])
+    with db.write_cursor() as cursor:
+        cursor.execute("UPDATE stock_watermarks SET price_basis = 'qfq'")
+    write_year = partitions._write_year
+
+    def fail_after_write(path, grouped, replace=()):
+        conn = sqlite3.connect(path)
+        try:
+            with conn:
+                stock_history.upsert_grouped(conn.cursor(), grouped, replace)
+                raise sqlite3.OperationalError('disk I/O error')
+        finally:
+            conn.close()
+
+    monkeypatch.setattr(partitions, '_write_year', fail_after_write)
+    assert save_many([old], replace=['600519']) is None
+    marks = get_watermarks(['600519'])['600519']
+    assert marks['price_basis'] == 'qfq' and marks['row_count'] == 40
+    assert [r['close'] for r in get_history('600519', limit=None, adjust='none')] == \
+        pytest.approx((old['close'] * 0.5).tolist())
+
+    monkeypatch.setattr(partitions, '_write_year', write_year)
+    # 新数据只覆盖 2024 年，2023 年分区中的旧数据也被删除
+    new = old[old['date'] >= pd.Timestamp('2024-01-01').date()]
+    assert save_many([new], replace=['600519'])['inserted'] == len(new)
+    marks = get_watermarks(['600519'])['600519']
+    assert marks['price_basis'] == 'raw' and marks['row_count'] == len(new)
+    assert [r['close'] for r in get_history('600519', limit=None, adjust='none')] == pytest.approx(new['close'].tolist())
@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+测试批量形态检测引擎
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import contextlib
+import io
+import numpy as np
+import pandas as pd
+import pytest
+
+from app import pattern_registry, pattern_engine
+from app.pattern_dector import PatternDector
+from app.pattern_engine import detect_patterns_batch, scan_stocks, scan_universe, SCAN_LOOKBACK_DAYS
+from app.db.stock_history import save_to_database
+from app.db.companies import update_companies_from_data
+from app.db.stock_groups import create_group, add_stock_to_group
+from app.api import create_app
+from conftest import make_bars, make_trend_ohlcv
+
+
+def make_panel(stocks, days):
+    """股票 × 交易日 矩阵，部分股票晚上市(之前为 NaN)，部分股票中途停牌"""
+    bars = [make_trend_ohlcv(days, seed) for seed in range(stocks)]
+    panel = [np.array([b[k] for b in bars]) for k in range(5)]
+    for i in range(1, stocks, 3):
+        for matrix in panel:
+            matrix[i, :i * 20] = np.nan
+    for i in range(2, stocks, 3):
+        for matrix in panel:
+            # 停牌一天和连续停牌三天
+            matrix[i, days // 3] = np.nan
+            matrix[i, days // 2:days // 2 + 3] = np.nan
+    return panel
+
+
+def test_batch_matches_single_stock():
+    """每只股票的批量结果与只用其交易日数据单独检测一致，上市前和停牌日无信号"""
+    o, h, l, c, v = make_panel(9, 400)
+    signals, codes = detect_patterns_batch(o, h, l, c, v)
+    assert signals.dtype == np.int8
+    assert signals.shape == (9, len(pattern_registry.PATTERNS), 400)
+    assert codes == list(pattern_registry.PATTERN_CODES)
+    assert signals.any()
+
+    for i in range(9):
+        traded = ~np.isnan(c[i])
+        with contextlib.redirect_stdout(io.StringIO()):
+            expected = PatternDector(o[i, traded], h[i, traded], l[i, traded], c[i, traded],
+                                     v[i, traded]).detect_patterns()
+        for k, code in enumerate(codes):
+            values = np.asarray(expected[code], dtype=np.float64)
+            if code in pattern_registry.TALIB_PATTERNS:
+                values = values / 100
+            values = np.rint(values)
+            assert np.array_equal(signals[i, k, traded], values), (i, code)
+            assert not signals[i, k, ~traded].any(), (i, code)
+
+
+def test_selected_patterns_and_empty_rows():
+    o, h, l, c, v = make_panel(4, 120)
+    for matrix in (o, h, l, c, v):
+        matrix[2] = np.nan
+    timings = {}
+    signals, codes = detect_patterns_batch(o, h, l, c, v, patterns=['CDLHAMMER', 'NOPE', 'SILVER_VALLEY'],
+                                           timings=timings)
+    assert codes == ['CDLHAMMER', 'SILVER_VALLEY']
+    assert signals.shape == (4, 2, 120)
+    assert set(timings) == set(codes)
+    # 没有数据的股票没有信号
+    assert not signals[2].any()
+
+    with pytest.raises(ValueError):
+        detect_patterns_batch(o[0], h[0], l[0], c[0], v[0])
+
+
+def test_scan_stocks_from_db(temp_db):
+    assert save_to_database(pd.concat([make_bars('600000', periods=120), make_bars('600001', periods=80, seed=1)]))
+    result = scan_stocks(['600000', '600001', '600002'], patterns=['SHORT_TERM_BULL', 'CDLDOJI'], adjust='none')
+    assert result['stocks'] == ['600000', '600001']
+    assert result['patterns'] == ['SHORT_TERM_BULL', 'CDLDOJI']
+    assert result['signals'].shape == (2, 2, len(result['dates']))
+
+    empty = scan_stocks(['600002'])
+    assert empty['stocks'] == [] and empty['signals'].shape[0] == 0
+
+
+SCAN_CODES = ['600000', '600001', '600002', '000001', '000002']
+
+
+def save_universe(periods=300):
+    """保存测试股票的日K和成分股，000002 最后两个交易日停牌"""
+    dates = pd.bdate_range('2024-01-01', periods=periods)
+    frames = []
+    for seed, code in enumerate(SCAN_CODES):
+        o, h, l, c, v = make_trend_ohlcv(periods, seed)
+        df = pd.DataFrame({'date': dates.date, 'open': o, 'close': c, 'high': h, 'low': l, 'amount': v,
+                           'stock_code': code})
+        frames.append(df.iloc[:-2] if code == '000002' else df)
+    assert save_to_database(pd.concat(frames))
+    assert update_companies_from_data([{'SECURITY_CODE': code, 'TYPE': '1' if code.startswith('6') else '3',
+                                        'SECURITY_NAME_ABBR': code} for code in SCAN_CODES])
+    return str(dates[-1].date())
+
+
+def test_scan_universe_ranks_latest_sessions(temp_db):
+    end = save_universe()
+    start = str((pd.Timestamp(end) - pd.Timedelta(days=SCAN_LOOKBACK_DAYS)).date())
+    expected = scan_stocks(SCAN_CODES, start_date=start, end_date=end, adjust='none')
+    last = len(expected['dates']) - 3
+    hits = {(expected['stocks'][i], expected['patterns'][k], int(expected['signals'][i, k, last + t]))
+            for i, k, t in zip(*np.nonzero(expected['signals'][:, :, last:]))
+            if expected['stocks'][i] != '000002' or t == 0}
+
+    result = scan_universe(SCAN_CODES, sessions=3, end_date=end, adjust='none', workers=1)
+    assert len(result['dates']) == 3 and result['dates'][-1] == end
+    assert result['workers'] == 1 and len(result['shards']) == 1
+    assert {(item['stock_code'], item['pattern'], item['signal']) for item in result['signals']} == hits
+    keys = [(item['date'], abs(item['signal'])) for item in result['signals']]
+    assert keys == sorted(keys, key=lambda key: (key[0], key[1]), reverse=True)
+    # 停牌日不产生信号
+    assert not any(item['stock_code'] == '000002' and item['date'] > result['dates'][0]
+                   for item in result['signals'])
+
+    # 多进程分片的结果与单进程一致，进程池在多次扫描间复用
+    parallel = scan_universe(SCAN_CODES, sessions=3, end_date=end, adjust='none', workers=2, shard_size=2)
+    assert parallel['signals'] == result['signals']
+    assert parallel['workers'] == 2
+    assert [shard['stocks'] for shard in parallel['shards']] == [2, 2, 1]
+    pool = pattern_engine._scan_pool
+    again = scan_universe(SCAN_CODES, sessions=3, end_date=end, adjust='none', workers=2, shard_size=2, limit=2)
+    assert pattern_engine._scan_pool is pool
+    assert again['signals'] == result['signals'][:2]
+    assert again['count'] == 2 and again['total'] == result['total'] == result['count']
+
+    bullish = scan_universe(SCAN_CODES, sessions=3, end_date=end, adjust='none', direction='bullish', workers=1)
+    assert bullish['signals'] and all(item['direction'] == 'bullish' for item in bullish['signals'])
+    assert len(bullish['signals']) < len(result['signals'])
+
+    with pytest.raises(ValueError):
+        scan_universe(SCAN_CODES, patterns=['NOPE'])
+
+
+def test_scan_endpoint(temp_db):
+    end = save_universe()
+    group_id = create_group('scan')
+    for code in ('600000', '000001'):
+        assert add_stock_to_group(group_id, code)
+    client = create_app().test_client()
+
+    body = client.get(f'/scan?index=hs300&sessions=5&end={end}&adjust=none').get_json()
+    assert body['stocks'] == 3 and body['count'] == len(body['signals'])
+    assert {item['stock_code'] for item in body['signals']} <= {'600000', '600001', '600002'}
+    assert body['shards'] and 'detect_seconds' in body['shards'][0]
+
+    body = client.get(f'/scan?group={group_id}&index=hs300&sessions=5&end={end}&adjust=none&limit=1').get_json()
+    assert body['stocks'] == 1 and len(body['signals']) == body['count'] == 1
+    assert body['total'] >= body['count']
+
+    assert client.get('/scan?direction=up').status_code == 400
+    assert client.get('/scan?index=sz50').status_code == 400
+    assert client.get('/scan?patterns=NOPE').status_code == 400
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+测试K线形态注册表
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import pytest
+
+from app import pattern_registry
+from app.custom_pattern import CustomPatternDetector
+from app.pattern_dector import PatternDector
+from app.kline_patterns import detect_kline_patterns
+from app.api import create_app
+from conftest import make_ohlcv
+
+
+def test_registry_metadata():
+    patterns = pattern_registry.PATTERNS
+    assert len(patterns) == len(pattern_registry.TALIB_PATTERNS) + len(pattern_registry.CUSTOM_PATTERNS)
+    assert patterns['CDLHAMMER'].source == 'talib' and patterns['CDLHAMMER'].warmup > 0
+    assert patterns['OLD_DUCK_HEAD'].inputs[-1] == 'volume'
+    # 每个自定义形态都有同名检测方法
+    for code in pattern_registry.CUSTOM_PATTERNS:
+        assert callable(getattr(CustomPatternDetector, code))
+    assert all(info.direction in ('bullish', 'bearish', 'both') for info in patterns.values())
+    assert pattern_registry.chinese_name('CDLDOJI') == '十字星'
+    assert pattern_registry.chinese_name('UNKNOWN') == 'UNKNOWN'
+
+    with pytest.raises(TypeError):
+        patterns['NEW'] = patterns['CDLDOJI']
+
+
+def test_detector_binds_data_only():
+    """构造检测器不创建自定义形态检测器，只检测 TA-Lib 形态时也不创建"""
+    dector = PatternDector(*make_ohlcv())
+    assert dector._pattern_detector is None
+    results = dector.detect_patterns(['CDLENGULFING', 'NOT_A_PATTERN'])
+    assert list(results) == ['CDLENGULFING']
+    assert dector._pattern_detector is None
+
+    results = dector.detect_patterns(['SILVER_VALLEY'])
+    assert dector._pattern_detector is not None
+    assert len(results['SILVER_VALLEY']) == 200
+
+
+def test_warmup_respected():
+    """在所需K线数之前不会产生信号"""
+    o, h, l, c, v = make_ohlcv(300, seed=3)
+    results = PatternDector(o, h, l, c, v).detect_patterns()
+    assert set(results) == set(pattern_registry.PATTERN_CODES)
+    for code, values in results.items():
+        warmup = pattern_registry.PATTERNS[code].warmup
+        assert not np.any(np.asarray(values)[:warmup]), code
+
+
+def test_detect_kline_patterns_names():
+    o, h, l, c, v = make_ohlcv(120, seed=1)
+    data = [{'date': f'd{i}', 'open': o[i], 'high': h[i], 'low': l[i], 'close': c[i], 'amount': v[i]}
+            for i in range(120)]
+    results = detect_kline_patterns(data, ['CDLSPINNINGTOP', 'SHORT_TERM_BULL'])
+    assert results['patterns']
+    for item in results['patterns']:
+        assert item['chinese_name'] == pattern_registry.PATTERNS[item['pattern']].name
+
+
+def test_patterns_endpoint(temp_db):
+    client = create_app().test_client()
+    body = client.get('/patterns').get_json()
+    assert body['count'] == len(pattern_registry.PATTERNS)
+    assert body['patterns'][0] == {'name': 'CDL2CROWS', 'chinese': '两只乌鸦', 'source': 'talib',
+                                   'direction': 'bearish', 'warmup': 12, 'inputs': ['open', 'high', 'low', 'close']}
+
+
+def test_signal_sign_matches_direction():
+    """看涨形态不输出负数信号，看跌形态不输出正数信号"""
+    fired = set()
+    for seed in range(3):
+        results = PatternDector(*make_ohlcv(3000, seed=seed)).detect_patterns(list(pattern_registry.PATTERNS))
+        for code, signal in results.items():
+            signal = np.nan_to_num(np.asarray(signal, dtype=float))
+            direction = pattern_registry.PATTERNS[code].direction
+            assert not (direction == 'bullish' and (signal < 0).any()), code
+            assert not (direction == 'bearish' and (signal > 0).any()), code
+            if signal.any():
+                fired.add(code)
+    assert 'UPSIDE_GAP_3CROWS' in fired
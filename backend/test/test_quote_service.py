@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+测试实时行情服务
+"""
+
+import sys
+import os
+import time
+import asyncio
+import threading
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+from app.config import settings
+from app.quote_service import QuoteService, XueqiuQuoteFetcher, TokenExpired, normalize_symbol, parse_quote
+
+
+class FakeFetcher:
+    """记录每次批量请求的行情接口"""
+
+    def __init__(self, delay=0.05):
+        self.delay = delay
+        self.calls = []
+
+    async def fetch(self, symbols):
+        self.calls.append(list(symbols))
+        await asyncio.sleep(self.delay)
+        return {s: {'symbol': s, 'price': float(len(self.calls))} for s in symbols}
+
+
+@pytest.fixture
+def service():
+    svc = QuoteService(FakeFetcher(), ttl=0.5, batch_size=50, refresh_interval=0)
+    yield svc
+    svc.stop()
+
+
+def test_normalize_symbol():
+    assert normalize_symbol('600519') == 'SH600519'
+    assert normalize_symbol('000001.sz') == 'SZ000001'
+    assert normalize_symbol('sh600519') == 'SH600519'
+
+
+def test_parse_quote():
+    quote = parse_quote({'symbol': 'SH600519', 'name': '贵州茅台', 'current': 1500.5, 'chg': -3.2, 'percent': -0.21,
+                         'market_capital': 1.9e12, 'volume': 123456, 'pe_ttm': 25.1, 'dividend_yield': None})
+    assert quote['exchange'] == '上海证券交易所'
+    assert (quote['price'], quote['change'], quote['volume'], quote['dividend']) == (1500.5, -3.2, 123456, None)
+    assert quote['currency'] == 'CNY'
+
+
+def test_group_costs_one_fetch(service):
+    """50 只股票的行情一次批量请求获取，有效期内再次读取命中缓存"""
+    codes = [f'6000{i:02d}' for i in range(50)]
+    quotes = service.get_quotes(codes)
+    assert len(quotes) == 50 and len(service.fetcher.calls) == 1
+    service.get_quotes(codes[:10])
+    assert len(service.fetcher.calls) == 1
+
+    time.sleep(0.6)
+    service.get_quotes(codes[:10])
+    assert service.fetcher.calls[-1] == [normalize_symbol(c) for c in codes[:10]]
+
+    service.get_quotes([f'0000{i:02d}' for i in range(1, 121)])
+    assert [len(c) for c in service.fetcher.calls[-3:]] == [50, 50, 20]
+
+
+def test_concurrent_callers_coalesced(service):
+    """并发请求同一只股票只产生一次请求"""
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(service.get_quotes(['600519'])))
+               for _ in range(20)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(results) == 20
+    assert len(service.fetcher.calls) == 1
+    assert all(r['SH600519']['price'] == 1.0 for r in results)
+
+
+@pytest.mark.asyncio
+async def test_async_callers_coalesced(service):
+    results = await asyncio.gather(*[service.get_quotes_async(['600519', '000001']) for _ in range(10)])
+    assert len(service.fetcher.calls) == 1
+    assert all(set(r) == {'SH600519', 'SZ000001'} for r in results)
+
+
+def test_background_refresh():
+    """最近被请求过的股票在过期前由后台刷新"""
+    svc = QuoteService(FakeFetcher(delay=0), ttl=0.2, refresh_interval=0.05)
+    try:
+        svc.get_quotes(['600519'])
+        time.sleep(0.5)
+        assert len(svc.fetcher.calls) >= 2
+        calls = len(svc.fetcher.calls)
+        # 缓存一直新鲜，读取不再产生请求
+        assert svc.get_quotes(['600519'])['SH600519']['price'] >= 2.0
+        assert len(svc.fetcher.calls) <= calls + 1
+    finally:
+        svc.stop()
+
+
+@pytest.mark.asyncio
+async def test_token_refresh_shared(monkeypatch):
+    """token 失效时并发请求只刷新一次 token，且刷新不阻塞事件循环"""
+    fetcher = XueqiuQuoteFetcher()
+    tokens = []
+
+    def fetch_token():
+        time.sleep(0.1)
+        tokens.append('new')
+        return 'new'
+
+    def request(symbols, token):
+        if token != 'new':
+            raise TokenExpired('expired')
+        return {s: {'symbol': s} for s in symbols}
+
+    monkeypatch.setattr(settings, 'XUEQIU_TOKEN', 'old')
+    monkeypatch.setattr(fetcher, '_fetch_token', fetch_token)
+    monkeypatch.setattr(fetcher, '_request', request)
+
+    ticks = 0
+
+    async def ticker():
+        nonlocal ticks
+        for _ in range(5):
+            await asyncio.sleep(0.01)
+            ticks += 1
+
+    results, _ = await asyncio.gather(asyncio.gather(*[fetcher.fetch([f'SH60000{i}']) for i in range(5)]), ticker())
+    assert tokens == ['new']
+    assert ticks == 5
+    assert [list(r) for r in results] == [[f'SH60000{i}'] for i in range(5)]
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+测试数据源限流
+"""
+
+import sys
+import os
+import time
+import asyncio
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+from app import rate_control
+from app.config import settings
+from app.rate_control import TokenBucket, SourceController, backoff_delay
+
+
+@pytest.mark.asyncio
+async def test_token_bucket_limits_rate():
+    bucket = TokenBucket(rate=20, capacity=5)
+    start = time.monotonic()
+    await asyncio.gather(*[bucket.acquire() for _ in range(15)])
+    # 初始 5 个令牌立即可用，其余 10 个按 20 次/秒补充
+    assert time.monotonic() - start >= 0.45
+
+
+@pytest.mark.asyncio
+async def test_token_bucket_unlimited():
+    bucket = TokenBucket(rate=0)
+    start = time.monotonic()
+    for _ in range(1000):
+        await bucket.acquire()
+    assert time.monotonic() - start < 0.1
+
+
+@pytest.mark.asyncio
+async def test_controller_aimd():
+    """成功请求逐步增加并发上限，出错后成倍减小"""
+    controller = SourceController('test', max_limit=10, initial_limit=2, decrease_cooldown=0, min_calls=100)
+    for _ in range(20):
+        async with controller.slot():
+            pass
+    grown = controller.limit
+    assert 4 < grown <= 10
+
+    with pytest.raises(ValueError):
+        async with controller.slot():
+            raise ValueError('throttled')
+    assert controller.limit == pytest.approx(grown * 0.5)
+    assert controller.stats()['errors'] == 1
+
+
+@pytest.mark.asyncio
+async def test_controller_limits_concurrency():
+    controller = SourceController('test', max_limit=3, initial_limit=3)
+    peak = 0
+
+    async def call():
+        nonlocal peak
+        async with controller.slot():
+            peak = max(peak, controller.in_flight)
+            await asyncio.sleep(0.01)
+
+    await asyncio.gather(*[call() for _ in range(12)])
+    assert peak == 3
+    assert controller.in_flight == 0
+
+
+@pytest.mark.asyncio
+async def test_circuit_breaker_opens_and_recovers():
+    controller = SourceController('test', min_calls=3, open_seconds=0.2)
+
+    async def fail():
+        async with controller.slot():
+            raise RuntimeError('down')
+
+    for _ in range(3):
+        with pytest.raises(RuntimeError):
+            await fail()
+    assert controller.state == SourceController.OPEN
+
+    # 熔断期间请求被暂停，冷却结束后探测成功即恢复
+    start = time.monotonic()
+    async with controller.slot():
+        assert controller.state == SourceController.HALF_OPEN
+    assert time.monotonic() - start >= 0.15
+    assert controller.state == SourceController.CLOSED
+
+
+def test_backoff_delay_is_jittered():
+    delays = [backoff_delay(3, base=1.0, cap=5.0) for _ in range(200)]
+    assert all(0 <= d <= 5.0 for d in delays)
+    assert len(set(delays)) > 1
+
+
+def test_get_controller_rejects_conflicting_options(monkeypatch):
+    """同名数据源共享一个控制器，参数不一致时报错而不是静默忽略"""
+    monkeypatch.setattr(rate_control, '_controllers', {})
+    monkeypatch.setattr(rate_control, '_controller_options', {})
+    controller = rate_control.get_controller('test', target_latency=1.0)
+    assert controller.max_limit == settings.MAX_CONCURRENT
+    assert rate_control.get_controller('test') is controller
+    assert rate_control.get_controller('test', target_latency=1.0, max_limit=settings.MAX_CONCURRENT) is controller
+    with pytest.raises(ValueError):
+        rate_control.get_controller('test', max_limit=settings.MAX_CONCURRENT + 1)
+    with pytest.raises(ValueError):
+        rate_control.get_controller('test', window=5)
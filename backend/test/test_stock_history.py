@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+测试股票历史数据存储
+"""
+
+import sys
+import os
+import sqlite3
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from app.db import columnar, init_tables, stock_history
+from app.db.config import DB_CONFIG
+from app.db.connection import db
+from app.db.models import get_schema_version, SCHEMA_VERSION
+from app.db.dates import to_day
+from app.db.stock_history import save_to_database, save_many, get_history, get_histories, get_watermarks
+from conftest import make_bars
+
+
+def test_history_arrays_match_history(temp_db):
+    """列式读取结果与 get_history 一致"""
+    df = make_bars('600519')
+    assert save_to_database(df)
+
+    rows = get_history('600519', '2024-01-10', '2024-01-31', limit=None)
+    arrays = columnar.get_history_arrays('600519', '2024-01-10', '2024-01-31')
+
+    assert len(rows) == len(arrays['date'])
+    assert arrays['date'][0] == to_day(rows[0]['date'])
+    assert np.allclose(arrays['close'], [row['close'] for row in rows])
+    assert np.allclose(arrays['amount'], [row['amount'] for row in rows])
+    # 切片是内存映射文件上的视图，不产生拷贝
+    assert not arrays['close'].flags.owndata
+    assert not arrays['close'].flags.writeable
+
+
+def test_history_arrays_refresh_after_save(temp_db):
+    """追加数据后重新映射列式文件"""
+    df = make_bars('000001', periods=40)
+    assert save_to_database(df.iloc[:20])
+    assert len(columnar.get_history_arrays('000001')['date']) == 20
+
+    assert save_to_database(df.iloc[20:])
+    assert len(columnar.get_history_arrays('000001')['date']) == 40
+
+
+def test_history_arrays_append_tail(temp_db, monkeypatch):
+    """只新增更晚日期时追加到列式文件末尾，修改已有日期时从数据库重建"""
+    df = make_bars('000001', periods=40)
+    assert save_many([df.iloc[:20]])
+    rebuilt = []
+    rebuild_stock = columnar.rebuild_stock
+    monkeypatch.setattr(columnar, 'rebuild_stock', lambda code: rebuilt.append(code) or rebuild_stock(code))
+
+    # 增量数据与已有数据重叠一天
+    assert save_many([df.iloc[19:30]])
+    assert save_many([df.iloc[30:]])
+    assert rebuilt == []
+    arrays = columnar.get_history_arrays('000001')
+    rows = get_history('000001', limit=None)
+    assert arrays['date'].tolist() == [to_day(r['date']) for r in rows]
+    assert np.allclose(arrays['close'], [r['close'] for r in rows])
+
+    assert save_many([df.iloc[5:6].assign(close=1.0)])
+    assert rebuilt == ['000001']
+    assert columnar.get_history_arrays('000001')['close'][5] == 1.0
+
+
+def test_failed_refresh_removes_columnar_file(temp_db, monkeypatch):
+    """列式文件刷新失败时删除该文件，读取回退到数据库而不是返回过期数据"""
+    df = make_bars('600519', periods=20)
+    assert save_many([df])
+    assert os.path.exists(columnar._path('600519'))
+
+    def fail(stock_code, arrays):
+        raise OSError('disk full')
+
+    monkeypatch.setattr(columnar, 'write_arrays', fail)
+    assert save_many([df.iloc[:1].assign(close=1.0)])
+    assert not os.path.exists(columnar._path('600519'))
+    assert get_histories(['600519'], fields=['close'])['600519']['close'][0] == 1.0
+
+
+def test_history_arrays_missing_stock(temp_db):
+    assert columnar.get_history_arrays('999999') is None
+
+
+def test_save_many_upsert_counts(temp_db):
+    """重叠数据不会导致整批失败，并区分新增和更新行数"""
+    a = make_bars('600519', periods=20)
+    b = make_bars('000001', periods=10, seed=1)
+    stats = save_many([a.iloc[:15], b])
+    assert stats['inserted'] == 25
+    assert stats['updated'] == 0
+
+    # 与已有数据重叠：10 行重复(其中 2 行价格修正)，5 行新增
+    overlap = a.iloc[5:20].copy()
+    overlap.loc[overlap.index[:2], 'close'] += 1.0
+    stats = save_many([overlap])
+    assert stats['stocks']['600519'] == {'inserted': 5, 'updated': 2}
+
+    rows = get_history('600519', limit=None)
+    assert len(rows) == 20
+    assert rows[5]['close'] == pytest.approx(a['close'].iloc[5] + 1.0)
+
+
+def test_save_many_skips_incomplete_rows(temp_db):
+    df = make_bars('600519', periods=5)
+    df.loc[2, 'close'] = np.nan
+    assert save_many([df])['inserted'] == 4
+
+
+def test_watermarks_follow_saves(temp_db):
+    df = make_bars('600519', periods=20)
+    save_many([df.iloc[5:15], make_bars('000001', periods=3)])
+    save_many([df.iloc[:5]])
+
+    marks = get_watermarks(['600519', '000001', '999999'])
+    assert set(marks) == {'600519', '000001'}
+    assert marks['600519']['first_date'] == str(df['date'].iloc[0])
+    assert marks['600519']['last_date'] == str(df['date'].iloc[14])
+    assert marks['600519']['row_count'] == 15
+    assert marks['000001']['row_count'] == 3
+    assert set(get_watermarks()) == {'600519', '000001'}
+
+
+LEGACY_SCHEMA = '''
+CREATE TABLE stock_history (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    stock_code TEXT NOT NULL,
+    date TEXT NOT NULL,
+    open REAL NOT NULL,
+    close REAL NOT NULL,
+    high REAL NOT NULL,
+    low REAL NOT NULL,
+    amount REAL NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    UNIQUE(stock_code, date)
+)
+'''
+
+
+def test_migrate_legacy_schema(tmp_path, monkeypatch):
+    """旧版表结构分块迁移，迁移期间的并发写入不会丢失"""
+    path = str(tmp_path / 'stock_history.db')
+    legacy = sqlite3.connect(path)
+    legacy.execute(LEGACY_SCHEMA)
+    rows = [('600519', f'2024-01-{d:02d}', d, d, d, d, d) for d in range(1, 11)]
+    rows.append(('000001', '2024-01-02 00:00:00', 1, 2, 3, 4, 5))
+    legacy.executemany('INSERT INTO stock_history (stock_code, date, open, close, high, low, amount) VALUES (?, ?, ?, ?, ?, ?, ?)', rows)
+    legacy.commit()
+
+    db.close()
+    monkeypatch.setitem(DB_CONFIG, 'database', path)
+    monkeypatch.setitem(DB_CONFIG, 'migration_chunk_size', 3)
+
+    # 模拟其他进程在复制过程中按旧格式写入
+    progress_calls = []
+    original_info = stock_history.logger.info
+
+    def info(msg, *args):
+        if msg.startswith('stock_history 迁移进度') and not progress_calls:
+            legacy.execute("UPDATE stock_history SET close = 99 WHERE stock_code = '600519' AND date = '2024-01-01'")
+            legacy.execute("UPDATE stock_history SET close = 98 WHERE stock_code = '600519' AND date = '2024-01-09'")
+            legacy.execute("INSERT INTO stock_history (stock_code, date, open, close, high, low, amount) VALUES ('600519', '2024-01-11', 1, 1, 1, 1, 1)")
+            legacy.execute("DELETE FROM stock_history WHERE stock_code = '600519' AND date = '2024-01-10'")
+            legacy.commit()
+        progress_calls.append(msg)
+        original_info(msg, *args)
+
+    monkeypatch.setattr(stock_history.logger, 'info', info)
+    try:
+        init_tables()
+        assert get_schema_version() == SCHEMA_VERSION
+        assert len(progress_calls) > 1
+
+        history = get_history('600519', limit=None)
+        assert [r['date'] for r in history] == [f'2024-01-{d:02d}' for d in list(range(1, 10)) + [11]]
+        assert history[0]['close'] == 99
+        assert history[8]['close'] == 98
+        assert get_history('000001')[0]['date'] == '2024-01-02'
+        assert get_watermarks(['600519'])['600519']['last_date'] == '2024-01-11'
+
+        columns = {r['name']: r['type'] for r in db.get_cursor().execute('PRAGMA table_info(stock_history)')}
+        assert columns['date'] == 'INTEGER' and 'id' not in columns
+    finally:
+        legacy.close()
+        db.close()
+
+
+def test_get_histories(temp_db):
+    """批量读取与逐只读取结果一致，列式文件缺失时走 SQL 查询"""
+    a = make_bars('600519', periods=20)
+    b = make_bars('000001', start='2024-01-08', periods=10, seed=1)
+    save_many([a, b])
+    os.remove(columnar._path('000001'))
+
+    result = get_histories(['600519', '000001', '999999'], '2024-01-05', '2024-01-25', fields=['close'])
+    assert list(result) == ['600519', '000001']
+    for code in result:
+        rows = get_history(code, '2024-01-05', '2024-01-25', limit=None)
+        assert [to_day(r['date']) for r in rows] == result[code]['date'].tolist()
+        assert np.allclose([r['close'] for r in rows], result[code]['close'])
+
+
+def test_get_histories_aligned(temp_db):
+    a = make_bars('600519', periods=10)
+    b = make_bars('000001', start='2024-01-08', periods=10, seed=1)
+    save_many([a, b])
+
+    aligned = get_histories(['600519', '000001'], align=True)
+    assert aligned['codes'] == ['600519', '000001']
+    assert aligned['close'].shape == (2, 15)
+    # 000001 前 5 个交易日没有数据
+    assert np.isnan(aligned['close'][1, :5]).all()
+    assert np.allclose(aligned['close'][0, :10], a['close'])
+    assert np.isnan(aligned['close'][0, 10:]).all()
+
+
+def test_history_cache_invalidated_by_save(temp_db):
+    """重复查询命中缓存，写入新数据后缓存失效"""
+    df = make_bars('600519', periods=20)
+    save_to_database(df.iloc[:10])
+    stats = stock_history.get_history_cache_stats()
+
+    first = get_history('600519', limit=None)
+    assert get_history('600519', limit=None) is first
+    after = stock_history.get_history_cache_stats()
+    assert after['hits'] == stats['hits'] + 1
+    assert after['misses'] == stats['misses'] + 1
+
+    # 重复写入相同数据不改变版本号
+    version = stock_history.get_data_version('600519')
+    save_to_database(df.iloc[:10])
+    assert stock_history.get_data_version('600519') == version
+
+    save_to_database(df.iloc[10:])
+    assert stock_history.get_data_version('600519') == version + 1
+    assert len(get_history('600519', limit=None)) == 20
+
+
+def test_history_cache_evicts_by_size():
+    from app.db.history_cache import HistoryCache
+    rows = [{'date': '2024-01-01', 'close': 1.0}] * 100
+    size = HistoryCache.estimate_size(rows)
+    cache = HistoryCache(max_bytes=size * 2)
+    cache.put('a', 1, rows)
+    cache.put('b', 1, rows)
+    assert cache.get('a', 1) is rows
+    cache.put('c', 1, rows)
+    # 'b' 最久未使用，被淘汰
+    assert cache.get('b', 1) is None
+    assert cache.get('a', 1) is rows
+    assert cache.get('a', 2) is None
+    assert cache.stats()['bytes'] <= size * 2
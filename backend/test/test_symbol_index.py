@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+测试证券代码索引
+"""
+
+import sys
+import os
+import time
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pandas as pd
+import pytest
+
+from app import symbol_index
+from app.db import symbols as symbols_db
+from app.symbol_index import SymbolIndex
+
+SYMBOLS = [
+    {'code': '600519', 'name': '贵州茅台', 'exchange': 'SH', 'initials': 'gzmt'},
+    {'code': '000001', 'name': '平安银行', 'exchange': 'SZ', 'initials': 'payh'},
+    {'code': '601318', 'name': '中国平安', 'exchange': 'SH', 'initials': 'zgpa'},
+    {'code': '600000', 'name': '浦发银行', 'exchange': 'SH', 'initials': 'pfyh'},
+    {'code': '300750', 'name': '宁德时代', 'exchange': 'SZ', 'initials': 'ndsd'},
+]
+
+
+def codes(results):
+    return [r['code'] for r in results]
+
+
+def test_search_ranking():
+    index = SymbolIndex(SYMBOLS)
+    assert codes(index.search('600519')) == ['600519']
+    # 代码前缀匹配按代码排序
+    assert codes(index.search('600')) == ['600000', '600519']
+    # 名称前缀优先于名称中间的匹配
+    assert codes(index.search('平安')) == ['000001', '601318']
+    assert codes(index.search('银行')) == ['000001', '600000']
+    assert codes(index.search('GZ')) == ['600519']
+    assert index.search('') == []
+    assert index.search('不存在') == []
+
+
+def test_search_is_fast():
+    symbols = [{'code': f'{i:06d}', 'name': f'测试股份{i}', 'exchange': 'SZ', 'initials': f'csgf{i}'}
+               for i in range(6000)]
+    index = SymbolIndex(symbols)
+    start = time.perf_counter()
+    for _ in range(100):
+        index.search('0012')
+        index.search('股份59')
+    assert (time.perf_counter() - start) / 200 < 0.001
+
+
+def test_save_symbols_and_load_index(temp_db, monkeypatch):
+    assert symbols_db.save_symbols(SYMBOLS) == {'inserted': 5, 'updated': 0, 'deleted': 0}
+    changed = [dict(s) for s in SYMBOLS[:4]]
+    changed[0]['name'] = '贵州茅台A'
+    assert symbols_db.save_symbols(changed) == {'inserted': 0, 'updated': 1, 'deleted': 1}
+
+    monkeypatch.setattr(symbol_index, 'refresh_symbols', lambda: pytest.fail('不应下载'))
+    symbol_index.reset()
+    try:
+        assert codes(symbol_index.search('茅台')) == ['600519']
+        assert symbol_index.search('宁德') == []
+    finally:
+        symbol_index.reset()
+
+
+def test_search_limit():
+    symbols = [{'code': f'6000{i:02d}', 'name': f'测试银行{i}', 'exchange': 'SH', 'initials': ''} for i in range(30)]
+    index = SymbolIndex(symbols)
+    assert len(index.search('银行')) == 10
+    assert len(index.search('银行', limit=None)) == 30
+
+
+def test_initials():
+    pytest.importorskip('pypinyin')
+    assert symbol_index.initials_of('贵州茅台') == 'gzmt'
+
+
+def test_refresh_keeps_initials_without_pypinyin(temp_db, monkeypatch):
+    """缺少 pypinyin 时刷新代码表不把已有的拼音首字母覆盖为空"""
+    symbols_db.save_symbols(SYMBOLS[:2])
+    listing = pd.DataFrame({'code': ['600519', '000001', '601318'], 'name': ['贵州茅台', '平安银行', '中国平安']})
+    monkeypatch.setattr(symbol_index.ak, 'stock_info_a_code_name', lambda: listing)
+    monkeypatch.setattr(symbol_index, 'lazy_pinyin', None)
+
+    assert symbol_index.refresh_symbols() == 3
+    initials = {s['code']: s['initials'] for s in symbols_db.get_symbols()}
+    assert initials == {'600519': 'gzmt', '000001': 'payh', '601318': ''}
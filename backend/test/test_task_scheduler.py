@@ -0,0 +1,251 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+测试下载任务调度
+"""
+
+import sys
+import os
+import asyncio
+import sqlite3
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pandas as pd
+import pytest
+
+from app.task_scheduler import TaskScheduler
+from app.stock_downloader import DownloadError
+from app.db import sync_jobs, adjust_factors
+from app.db.connection import db
+from app.db.config import DB_CONFIG
+from app import trading_calendar
+from app.db.stock_history import get_watermarks, get_history, save_many
+from conftest import make_bars
+
+
+@pytest.fixture(autouse=True)
+def offline_calendar(monkeypatch):
+    """不访问网络，交易日历退化为工作日"""
+    def fail():
+        raise ConnectionError('offline')
+
+    monkeypatch.setattr(trading_calendar, 'fetch_trading_days', fail)
+    trading_calendar.reset()
+    yield
+    trading_calendar.reset()
+
+
+class FakeDownloader:
+    """按股票代码返回固定数据的下载器，可指定慢速股票"""
+
+    hedges = 0
+    hedge_wins = 0
+
+    def __init__(self, slow=(), delay=0.5, failing=(), factors=None, factors_failing=False):
+        self.slow = set(slow)
+        self.delay = delay
+        self.failing = set(failing)
+        self.factors = factors
+        self.factors_failing = factors_failing
+        self.calls = []
+        self.factor_calls = []
+        self.finished = []
+
+    async def get_stock_historical_data(self, stock_code, start_date, end_date, raise_on_error=False):
+        self.calls.append((stock_code, start_date))
+        if stock_code in self.failing:
+            raise DownloadError(f'{stock_code} 下载失败')
+        await asyncio.sleep(self.delay if stock_code in self.slow else 0.01)
+        self.finished.append(stock_code)
+        df = make_bars(stock_code, periods=10)
+        return df[df['date'].astype(str) >= start_date].reset_index(drop=True)
+
+    async def get_adjust_factors(self, stock_code):
+        self.factor_calls.append(stock_code)
+        if self.factors_failing:
+            raise DownloadError(f'{stock_code} 复权因子获取失败')
+        return self.factors
+
+
+@pytest.mark.asyncio
+async def test_slow_stock_does_not_block_pool(temp_db):
+    """慢速股票只占用一个工作协程，其余股票持续下载并入库"""
+    codes = [f'6000{i:02d}' for i in range(12)]
+    scheduler = TaskScheduler('unused', max_concurrent=3, rate_limit=0)
+    scheduler.downloader = FakeDownloader(slow=['600000'])
+
+    assert await scheduler.run_update('2024-01-01', '2024-12-31', stock_codes=codes)
+    assert scheduler.downloader.finished[-1] == '600000'
+    assert set(get_watermarks(codes)) == set(codes)
+
+
+@pytest.mark.asyncio
+async def test_incremental_plan(temp_db):
+    save_many([make_bars('600519', periods=5), make_bars('000001', periods=10)])
+    scheduler = TaskScheduler('unused', max_concurrent=2, rate_limit=0)
+    scheduler.downloader = FakeDownloader()
+
+    assert await scheduler.run_update('2024-01-01', '2024-01-12', stock_codes=['600519', '000001', '000002'])
+    # 000001 已更新到 2024-01-12，无需下载；600519 从水位之后的下一个交易日开始
+    assert sorted(scheduler.downloader.calls) == [('000002', '2024-01-01'), ('600519', '2024-01-08')]
+    assert get_watermarks(['600519'])['600519']['row_count'] == 10
+
+
+@pytest.mark.asyncio
+async def test_resume_retries_only_failed_tasks(temp_db, monkeypatch):
+    """失败的股票记录在任务日志中，--resume 只重试失败且已过退避时间的股票"""
+    codes = ['600519', '000001', '000002']
+    scheduler = TaskScheduler('unused', max_concurrent=2, rate_limit=0)
+    scheduler.downloader = FakeDownloader(failing=['000001'])
+    await scheduler.run_update('2024-01-01', '2024-01-12', stock_codes=codes)
+
+    job = sync_jobs.get_resumable_job()
+    tasks = {t['stock_code']: t for t in sync_jobs.get_tasks(job['id'])}
+    assert job['status'] == 'incomplete'
+    assert tasks['000001']['status'] == sync_jobs.FAILED
+    assert tasks['000001']['attempts'] == 1
+    assert '下载失败' in tasks['000001']['last_error']
+    assert tasks['600519']['rows'] == 10
+
+    # 退避时间未到，不重试
+    scheduler.downloader = FakeDownloader()
+    await scheduler.run_update('2024-01-01', '2024-01-12', stock_codes=codes, resume=True)
+    assert scheduler.downloader.calls == []
+
+    monkeypatch.setitem(DB_CONFIG, 'sync_retry_base_seconds', 0)
+    sync_jobs.mark_failed(job['id'], '000001', 'retry now')
+    await scheduler.run_update('2024-01-01', '2024-01-12', stock_codes=codes, resume=True)
+    assert scheduler.downloader.calls == [('000001', '2024-01-01')]
+    assert sync_jobs.get_job_summary(job['id']) == {sync_jobs.DONE: 3}
+    assert sync_jobs.get_resumable_job() is None
+
+
+@pytest.mark.asyncio
+async def test_skip_stocks_at_last_session(temp_db, monkeypatch):
+    """结束日期晚于最近已收盘交易日时，已更新到该交易日的股票不再下载"""
+    save_many([make_bars('600519', periods=10)])
+    monkeypatch.setattr(trading_calendar, 'last_completed_session', lambda: '2024-01-12')
+    scheduler = TaskScheduler('unused', max_concurrent=2, rate_limit=0)
+    scheduler.downloader = FakeDownloader()
+
+    assert await scheduler.run_update('2024-01-01', '2024-01-14', stock_codes=['600519'])
+    assert scheduler.downloader.calls == []
+
+
+@pytest.mark.asyncio
+async def test_factor_failure_keeps_bars(temp_db):
+    """复权因子接口失败时K线照常入库，因子保持待同步并在下次同步时重试"""
+    scheduler = TaskScheduler('unused', max_concurrent=2, rate_limit=0)
+    scheduler.downloader = FakeDownloader(factors_failing=True)
+    assert await scheduler.run_update('2024-01-01', '2024-01-12', stock_codes=['600519'])
+
+    job = sync_jobs.get_resumable_job() or {}
+    assert get_watermarks(['600519'])['600519']['row_count'] == 10
+    status = adjust_factors.get_sync_status(['600519'])['600519']
+    assert status['pending'] == 1 and status['attempts'] == 1 and '复权因子' in status['last_error']
+    assert job.get('status') != 'incomplete'
+
+    # 没有新K线时也重试待同步的因子
+    factors = pd.DataFrame({'date': ['2020-01-01'], 'factor': [1.5]})
+    scheduler.downloader = FakeDownloader(factors=factors)
+    assert await scheduler.run_update('2024-01-01', '2024-01-12', stock_codes=['600519'])
+    assert scheduler.downloader.calls == []
+    assert scheduler.downloader.factor_calls == ['600519']
+    assert adjust_factors.get_sync_status(['600519'])['600519']['pending'] == 0
+    assert '600519' in adjust_factors.get_factors(['600519'])
+
+
+@pytest.mark.asyncio
+async def test_factors_refreshed_at_most_once_per_interval(temp_db):
+    save_many([make_bars('600519', periods=5)])
+    adjust_factors.mark_synced('600519')
+    scheduler = TaskScheduler('unused', max_concurrent=2, rate_limit=0)
+    scheduler.downloader = FakeDownloader(factors=pd.DataFrame({'date': ['2020-01-01'], 'factor': [1.0]}))
+
+    # 有新K线，但距上次同步因子不足间隔天数，不请求因子接口
+    await scheduler.run_update('2024-01-01', '2024-01-12', stock_codes=['600519'])
+    assert scheduler.downloader.calls == [('600519', '2024-01-08')]
+    assert scheduler.downloader.factor_calls == []
+    assert adjust_factors.get_sync_status(['600519'])['600519']['pending'] == 1
+    assert adjust_factors.get_due(['600519']) == []
+    assert adjust_factors.get_due(['600519'], today='2099-01-01') == ['600519']
+
+
+@pytest.mark.asyncio
+async def test_legacy_rows_before_start_replaced(temp_db):
+    """旧版前复权数据早于本次开始日期的部分也被重新下载，不残留前复权价格"""
+    legacy = make_bars('600519', periods=10)
+    assert save_many([legacy.assign(close=legacy['close'] * 0.5)])
+    with db.write_cursor() as cursor:
+        cursor.execute("UPDATE stock_watermarks SET price_basis = 'qfq'")
+
+    scheduler = TaskScheduler('unused', max_concurrent=2, rate_limit=0)
+    scheduler.downloader = FakeDownloader()
+    await scheduler.run_update('2024-01-08', '2024-01-12', stock_codes=['600519'])
+    assert scheduler.downloader.calls == [('600519', '2024-01-01')]
+
+    marks = get_watermarks(['600519'])['600519']
+    assert marks['price_basis'] == 'raw' and marks['row_count'] == 10
+    rows = get_history('600519', limit=None, adjust='none')
+    assert [row['close'] for row in rows] == pytest.approx(legacy['close'].tolist())
+
+
+@pytest.mark.asyncio
+async def test_resume_warns_on_conflicting_arguments(temp_db, caplog):
+    """继续未完成任务时沿用其日期范围和股票列表，本次参数不一致时记录警告"""
+    scheduler = TaskScheduler('unused', max_concurrent=2, rate_limit=0)
+    scheduler.downloader = FakeDownloader(failing=['000001'])
+    await scheduler.run_update('2024-01-01', '2024-01-12', stock_codes=['600519', '000001'])
+
+    scheduler.downloader = FakeDownloader()
+    caplog.set_level('WARNING', logger='app.task_scheduler')
+
+    def conflicts():
+        return [r.getMessage() for r in caplog.records if r.getMessage().startswith('继续同步任务')]
+
+    await scheduler.run_update(resume=True)
+    await scheduler.run_update('2024-01-01', '2024-01-12', stock_codes=['600519', '000001'], resume=True)
+    assert conflicts() == []
+
+    await scheduler.run_update('2024-01-05', None, stock_codes=['600519', '000002'], resume=True)
+    messages = conflicts()
+    assert any('沿用其日期范围 2024-01-01 至 2024-01-12' in m for m in messages)
+    assert any('不会同步' in m and '000002' in m for m in messages)
+    assert any('仍会执行' in m for m in messages)
+    assert scheduler.downloader.calls == []
+
+
+@pytest.mark.asyncio
+async def test_legacy_rows_kept_when_replacement_fails(temp_db, monkeypatch):
+    """旧版前复权数据在写入事务中替换: 删除之后写入失败时整体回滚，旧数据和水位保持不变"""
+    from app.db import stock_history
+
+    legacy = make_bars('600519', periods=10).assign(close=lambda df: df['close'] * 0.5)
+    assert save_many([legacy])
+    with db.write_cursor() as cursor:
+        cursor.execute("UPDATE stock_watermarks SET price_basis = 'qfq'")
+    upsert = stock_history.upsert_grouped
+
+    def fail_after_delete(cursor, grouped, replace=()):
+        upsert(cursor, grouped, replace)
+        raise sqlite3.OperationalError('disk I/O error')
+
+    monkeypatch.setattr(stock_history, 'upsert_grouped', fail_after_delete)
+    scheduler = TaskScheduler('unused', max_concurrent=2, rate_limit=0)
+    scheduler.downloader = FakeDownloader()
+    await scheduler.run_update('2024-01-08', '2024-01-12', stock_codes=['600519'])
+    assert sync_jobs.get_tasks(sync_jobs.get_resumable_job()['id'])[0]['status'] == sync_jobs.FAILED
+
+    marks = get_watermarks(['600519'])['600519']
+    assert marks['price_basis'] == 'qfq' and marks['row_count'] == 10
+    rows = get_history('600519', limit=None, adjust='none')
+    assert [row['close'] for row in rows] == pytest.approx(legacy['close'].tolist())
+
+    # 恢复后重新同步，整体替换为不复权数据
+    monkeypatch.setattr(stock_history, 'upsert_grouped', upsert)
+    monkeypatch.setitem(DB_CONFIG, 'sync_retry_base_seconds', 0)
+    await scheduler.run_update('2024-01-08', '2024-01-12', stock_codes=['600519'])
+    assert get_watermarks(['600519'])['600519']['price_basis'] == 'raw'
+    assert [row['close'] for row in get_history('600519', limit=None, adjust='none')] == \
+        pytest.approx(make_bars('600519', periods=10)['close'].tolist())
@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+测试交易日历
+"""
+
+import sys
+import os
+from datetime import date, datetime
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pandas as pd
+import pytest
+
+from app import trading_calendar
+
+
+@pytest.fixture
+def calendar(temp_db, monkeypatch):
+    """2024年春节(2月9日-2月17日)休市的交易日历"""
+    days = [d.date() for d in pd.bdate_range('2024-01-01', '2026-12-31')
+            if not (date(2024, 2, 9) <= d.date() <= date(2024, 2, 17))]
+    calls = []
+
+    def fetch():
+        calls.append(1)
+        return days
+
+    monkeypatch.setattr(trading_calendar, 'fetch_trading_days', fetch)
+    trading_calendar.reset()
+    yield calls
+    trading_calendar.reset()
+
+
+def test_calendar_is_cached_in_database(calendar):
+    today = date(2024, 3, 1)
+    trading_calendar.ensure_calendar(today)
+    trading_calendar.reset()
+    trading_calendar.ensure_calendar(today)
+    assert len(calendar) == 1
+    assert not trading_calendar.is_trading_day('2024-02-12')
+
+
+def test_last_completed_session(calendar):
+    # 周六取周五
+    assert trading_calendar.last_completed_session(datetime(2024, 1, 6, 10, 0)) == '2024-01-05'
+    # 交易日收盘前取上一个交易日，收盘后取当天
+    assert trading_calendar.last_completed_session(datetime(2024, 1, 9, 10, 0)) == '2024-01-08'
+    assert trading_calendar.last_completed_session(datetime(2024, 1, 9, 16, 0)) == '2024-01-09'
+    # 春节假期中取节前最后一个交易日
+    assert trading_calendar.last_completed_session(datetime(2024, 2, 14, 16, 0)) == '2024-02-08'
+
+
+def test_next_trading_day(calendar):
+    assert trading_calendar.next_trading_day('2024-01-05') == '2024-01-08'
+    assert trading_calendar.next_trading_day('2024-02-08') == '2024-02-19'
+
+
+def test_weekday_fallback(temp_db, monkeypatch):
+    def fail():
+        raise ConnectionError('offline')
+
+    monkeypatch.setattr(trading_calendar, 'fetch_trading_days', fail)
+    trading_calendar.reset()
+    try:
+        assert trading_calendar.next_trading_day('2024-02-08') == '2024-02-09'
+        assert trading_calendar.last_completed_session(datetime(2024, 1, 7, 12, 0)) == '2024-01-05'
+    finally:
+        trading_calendar.reset()